@@ -0,0 +1,36 @@
+"""Benchmark the HTML parsers of the WebsiteReader in pages per second.
+
+Usage: python cookbook/knowledge/html_parser_benchmark.py [directory of .html pages]
+Defaults to the fixture pages of the tests.
+"""
+
+import sys
+from pathlib import Path
+
+from pas.knowledge.document.html import (
+    BeautifulSoupParser,
+    HtmlParser,
+    LxmlParser,
+    SelectolaxParser,
+)
+from pas.utils.timer import Timer
+
+pages_dir = Path(sys.argv[1] if len(sys.argv) > 1 else "tests/fixtures/html")
+pages = [path.read_bytes() for path in sorted(pages_dir.glob("*.html"))]
+# Parse at least 1000 pages per parser
+repeat = max(1, 1000 // max(1, len(pages)))
+
+parsers: list[HtmlParser] = [BeautifulSoupParser(), LxmlParser(), SelectolaxParser()]
+for parser in parsers:
+    try:
+        parser.parse(pages[0], "https://example.com/")
+    except ImportError as e:
+        print(f"{parser.__class__.__name__}: skipped, {e}")
+        continue
+
+    with Timer() as timer:
+        for _ in range(repeat):
+            for page in pages:
+                parser.parse(page, "https://example.com/")
+    pages_per_second = repeat * len(pages) / timer.elapsed
+    print(f"{parser.__class__.__name__}: {pages_per_second:,.0f} pages/sec")
@@ -1,15 +1,23 @@
-from hashlib import md5
+import asyncio
 
 from chromadb import Client as ChromaDbClient
 from chromadb import PersistentClient as PersistentChromaDbClient
 from chromadb.api.client import ClientAPI
 from chromadb.api.models.Collection import Collection
-from chromadb.api.types import GetResult, QueryResult
+from chromadb.api.types import GetResult, Metadata, QueryResult
+import numpy as np
 
 from pas.knowledge.document import Document
 from pas.knowledge.embedder import Embedder
+from pas.knowledge.embedder.base import Embedding, as_float32
 from pas.utils.log import logger
 from pas.knowledge.vectordb import Distance, VectorDb
+from pas.knowledge.vectordb.filters import (
+    STORED_NAME_FIELD,
+    Filters,
+    document_fields,
+    to_chroma_where,
+)
 
 
 class ChromaDb(VectorDb):
@@ -20,6 +28,7 @@ class ChromaDb(VectorDb):
         distance: Distance = Distance.cosine,
         path: str = "tmp/chromadb",
         persistent_client: bool = False,
+        batch_size: int = 1000,
         **kwargs,
     ):
         # Collection attributes
@@ -41,6 +50,9 @@ class ChromaDb(VectorDb):
         self.persistent_client: bool = persistent_client
         self.path: str = path
 
+        # Number of ids looked up per request when checking existing documents
+        self.batch_size: int = batch_size
+
         # Chroma client kwargs
         self.kwargs = kwargs
 
@@ -68,6 +80,8 @@ class ChromaDb(VectorDb):
                 name=self.collection,
                 metadata={"hnsw:space": self.distance.value},
             )
+        elif self._collection is None:
+            self._collection = self.client.get_collection(name=self.collection)
 
     def doc_exists(self, document: Document) -> bool:
         """Check if a document exists in the collection.
@@ -76,17 +90,33 @@ class ChromaDb(VectorDb):
         Returns:
             bool: True if document exists, False otherwise.
         """
-        if self.client:
+        return self.docs_exist([document])[0]
+
+    def docs_exist(self, documents: list[Document]) -> list[bool]:
+        """Check which documents exist in the collection.
+        Documents are looked up by id in batches of `batch_size`.
+        Args:
+            documents (List[Document]): Documents to check.
+        Returns:
+            List[bool]: True for each document which exists, False otherwise.
+        """
+        doc_ids = [self.doc_id(document) for document in documents]
+        existing_ids: set[str] = set()
+        if self.client and len(doc_ids) > 0:
             try:
-                collection: Collection = self.client.get_collection(
+                collection: Collection = self._collection or self.client.get_collection(
                     name=self.collection,
                 )
-                collection_data: GetResult = collection.get(include=["documents"])
-                if collection_data.get("documents"):
-                    return True
+                unique_ids = list(dict.fromkeys(doc_ids))
+                for start in range(0, len(unique_ids), self.batch_size):
+                    collection_data: GetResult = collection.get(
+                        ids=unique_ids[start : start + self.batch_size],
+                        include=[],
+                    )
+                    existing_ids.update(collection_data.get("ids", []))
             except Exception as e:
-                logger.error(f"Document does not exist: {e}")
-        return False
+                logger.error(f"Error checking if documents exist: {e}")
+        return [doc_id in existing_ids for doc_id in doc_ids]
 
     def name_exists(self, name: str) -> bool:
         """Check if a document with a given name exists in the collection.
@@ -96,69 +126,232 @@ class ChromaDb(VectorDb):
             bool: True if document exists, False otherwise."""
         if self.client:
             try:
-                collections: Collection = self.client.get_collection(
+                collection: Collection = self._collection or self.client.get_collection(
                     name=self.collection,
                 )
-                for collection in collections:
-                    if name in collection:
-                        return True
+                collection_data: GetResult = collection.get(
+                    where={STORED_NAME_FIELD: name},
+                    limit=1,
+                    include=[],
+                )
+                return len(collection_data.get("ids", [])) > 0
             except Exception as e:
-                logger.error(f"Document with given name does not exist: {e}")
+                logger.error(f"Error checking if name exists: {e}")
         return False
 
-    def insert(self, documents: list[Document]) -> None:
-        """Insert documents into the collection.
+    def get_stored_embeddings(
+        self,
+        documents: list[Document],
+    ) -> dict[str, np.ndarray]:
+        """Get the stored embeddings of documents which exist with identical content.
         Args:
-            documents (List[Document]): List of documents to insert
+            documents (List[Document]): Documents to look up.
+        Returns:
+            Dict[str, np.ndarray]: Stored float32 embeddings by document id.
         """
-        logger.debug(f"Inserting {len(documents)} documents")
-        ids: list = []
-        docs: list = []
-        docs_embeddings: list = []
+        contents = {
+            self.doc_id(document): document.content.replace("\x00", "\ufffd")
+            for document in documents
+        }
+        doc_ids = list(contents)
+        stored_embeddings: dict[str, np.ndarray] = {}
+        if self._collection is None or len(doc_ids) == 0:
+            return stored_embeddings
+
+        try:
+            for start in range(0, len(doc_ids), self.batch_size):
+                collection_data: GetResult = self._collection.get(
+                    ids=doc_ids[start : start + self.batch_size],
+                    include=["embeddings", "documents"],
+                )
+                embeddings = collection_data.get("embeddings")
+                stored_contents = collection_data.get("documents")
+                for doc_id, embedding, content in zip(
+                    collection_data.get("ids", []),
+                    embeddings if embeddings is not None else [],
+                    stored_contents if stored_contents is not None else [],
+                    strict=False,
+                ):
+                    if embedding is not None and content == contents.get(doc_id):
+                        stored_embeddings[doc_id] = as_float32(embedding)
+        except Exception as e:
+            logger.error(f"Error getting stored embeddings: {e}")
+        return stored_embeddings
 
+    def _prepare_documents(
+        self,
+        documents: list[Document],
+        skip_existing: bool,
+    ) -> tuple[list[str], list[str], list[np.ndarray], list[Metadata | None]]:
+        """Embed documents and build the ids, contents, embeddings and metadata to write.
+        The metadata holds the name and meta data of documents, to filter searches.
+
+        Documents which already exist with identical content are not embedded again:
+        they are skipped if `skip_existing` is True, otherwise their stored
+        embeddings are reused.
+        """
+        stored_embeddings: dict[str, np.ndarray] = {}
+        if skip_existing:
+            existing_ids = {
+                self.doc_id(document)
+                for document, exists in zip(
+                    documents,
+                    self.docs_exist(documents),
+                    strict=True,
+                )
+                if exists
+            }
+        else:
+            stored_embeddings = self.get_stored_embeddings(documents)
+            existing_ids = set(stored_embeddings)
+        if len(existing_ids) > 0:
+            logger.debug(f"Found {len(existing_ids)} existing documents")
+
+        documents_to_write: dict[str, Document] = {}
         for document in documents:
-            document.embed(embedder=self.embedder)
+            doc_id = self.doc_id(document)
+            # Chroma rejects duplicate ids in a single request
+            if doc_id in documents_to_write:
+                continue
+            if doc_id in existing_ids:
+                if skip_existing:
+                    continue
+                if document.embedding is None:
+                    document.embedding = stored_embeddings[doc_id]
+            documents_to_write[doc_id] = document
+
+        # Keep embeddings computed ahead of time, e.g. by the loading pipeline
+        Document.embed_documents(
+            documents=[
+                document
+                for document in documents_to_write.values()
+                if document.embedding is None
+            ],
+            embedder=self.embedder,
+        )
+
+        ids: list[str] = []
+        docs: list[str] = []
+        # Chroma accepts float32 arrays, so embeddings are never converted to lists
+        docs_embeddings: list[np.ndarray] = []
+        # Chroma rejects empty metadata, documents without fields have None
+        metadatas: list[Metadata | None] = []
+        for doc_id, document in documents_to_write.items():
+            if document.embedding is None or len(document.embedding) == 0:
+                logger.warning(f"Skipping document without embedding: {doc_id}")
+                continue
             cleaned_content = document.content.replace("\x00", "\ufffd")
-            doc_id = md5(cleaned_content.encode()).hexdigest()
-            docs_embeddings.append(document.embedding)
+            docs_embeddings.append(as_float32(document.embedding))
             docs.append(cleaned_content)
             ids.append(doc_id)
+            metadatas.append(
+                document_fields(
+                    document.name,
+                    document.meta_data,
+                    name_field=STORED_NAME_FIELD,
+                )
+                or None,
+            )
+        return ids, docs, docs_embeddings, metadatas
 
-        if len(docs) > 0 and self._collection is not None:
-            self._collection.add(ids=ids, embeddings=docs_embeddings, documents=docs)
-            logger.debug(f"Inserted {len(docs)} documents")
-        else:
+    def insert(self, documents: list[Document]) -> None:
+        """Insert documents into the collection.
+        Documents which already exist in the collection are skipped without embedding.
+        Args:
+            documents (List[Document]): List of documents to insert
+        """
+        logger.debug(f"Inserting {len(documents)} documents")
+        if self._collection is None:
             logger.error("Collection does not exist")
+            return
+
+        ids, docs, docs_embeddings, metadatas = self._prepare_documents(
+            documents,
+            skip_existing=True,
+        )
+        if len(docs) > 0:
+            self._collection.add(
+                ids=ids,
+                embeddings=docs_embeddings,
+                documents=docs,
+                metadatas=metadatas,  # type: ignore
+            )
+            self.mark_changed()
+        logger.debug(f"Inserted {len(docs)} documents")
+
+    def upsert_available(self) -> bool:
+        return True
 
     def upsert(self, documents: list[Document]) -> None:
         """Upsert documents into the collection.
+        Documents which already exist reuse their stored embeddings.
         Args:
             documents (List[Document]): List of documents to upsert
         """
-        logger.debug(f"Inserting {len(documents)} documents")
-        ids: list = []
-        docs: list = []
-        docs_embeddings: list = []
+        logger.debug(f"Upserting {len(documents)} documents")
+        if self._collection is None:
+            logger.error("Collection does not exist")
+            return
 
-        for document in documents:
-            document.embed(embedder=self.embedder)
-            cleaned_content = document.content.replace("\x00", "\ufffd")
-            doc_id = md5(cleaned_content.encode()).hexdigest()
-            docs_embeddings.append(document.embedding)
-            docs.append(cleaned_content)
-            ids.append(doc_id)
+        ids, docs, docs_embeddings, metadatas = self._prepare_documents(
+            documents,
+            skip_existing=False,
+        )
+        if len(docs) > 0:
+            self._collection.upsert(
+                ids=ids,
+                embeddings=docs_embeddings,
+                documents=docs,
+                metadatas=metadatas,  # type: ignore
+            )
+            self.mark_changed()
+        logger.debug(f"Upserted {len(docs)} documents")
 
-        if len(docs) > 0 and self._collection is not None:
-            self._collection.upsert(ids=ids, embeddings=docs_embeddings, documents=docs)
-            logger.debug(f"Inserted {len(docs)} documents")
-        else:
+    def delete_documents(self, ids: list[str]) -> None:
+        """Delete documents from the collection by id.
+        Args:
+            ids (List[str]): Ids of the documents to delete
+        """
+        if self._collection is None:
+            logger.error("Collection does not exist")
+            return
+
+        for start in range(0, len(ids), self.batch_size):
+            self._collection.delete(ids=ids[start : start + self.batch_size])
+        if len(ids) > 0:
+            self.mark_changed()
+        logger.debug(f"Deleted {len(ids)} documents")
+
+    def get_ids(self, filters: Filters) -> list[str]:
+        """Get the ids of the documents matching the filters.
+        Args:
+            filters (Dict[str, Any]): Filters on the name and meta data of documents
+        Returns:
+            List[str]: Ids of the matching documents
+        """
+        if self._collection is None:
             logger.error("Collection does not exist")
+            return []
+
+        collection_data: GetResult = self._collection.get(
+            where=to_chroma_where(filters),
+            include=[],
+        )
+        return list(collection_data.get("ids", []))
 
-    def search(self, query: str, limit: int = 5) -> list[Document]:
+    def search(
+        self,
+        query: str,
+        limit: int = 5,
+        filters: Filters | None = None,
+    ) -> list[Document]:
         """Search the collection for a query.
         Args:
             query (str): Query to search for.
             limit (int): Number of results to return.
+            filters (Optional[Dict[str, Any]]): Only return documents matching these
+                filters on their name and meta data, evaluated by Chroma as a `where`
+                clause, see `filters.Filters`.
         Returns:
             List[Document]: List of search results.
         """
@@ -166,56 +359,138 @@ class ChromaDb(VectorDb):
         if query_embedding is None:
             logger.error(f"Error getting embedding for Query: {query}")
             return []
+        return self.search_by_embedding(query_embedding, limit=limit, filters=filters)
+
+    async def asearch(
+        self,
+        query: str,
+        limit: int = 5,
+        filters: Filters | None = None,
+    ) -> list[Document]:
+        """Search the collection for a query without blocking the event loop.
+        The query is embedded with the async API of the embedder, and the Chroma
+        client, which is synchronous, is queried in a thread.
+        """
+        query_embedding = await self.embedder.aget_embedding(query)
+        if query_embedding is None:
+            logger.error(f"Error getting embedding for Query: {query}")
+            return []
+        return await asyncio.to_thread(
+            self.search_by_embedding,
+            query_embedding,
+            limit,
+            filters,
+        )
 
+    def search_by_embedding(
+        self,
+        query_embedding: Embedding,
+        limit: int = 5,
+        filters: Filters | None = None,
+    ) -> list[Document]:
+        """Return the documents closest to an embedding"""
         if not self._collection:
             self._collection = self.client.get_collection(name=self.collection)
 
         result: QueryResult = self._collection.query(
-            query_embeddings=query_embedding,
+            query_embeddings=query_embedding,  # type: ignore
             n_results=limit,
+            where=to_chroma_where(filters) if filters else None,
+            include=["documents", "metadatas"],  # type: ignore
         )
+        return self._search_results(result)[0]
+
+    def search_many(
+        self,
+        queries: list[str],
+        limit: int = 5,
+        filters: Filters | None = None,
+    ) -> list[list[Document]]:
+        """Search the collection for several queries at once.
+        The queries are embedded in batches, and each group of `batch_size`
+        queries is sent to Chroma as a single query.
+        Args:
+            queries (List[str]): Queries to search for.
+            limit (int): Number of results to return per query.
+            filters (Optional[Dict[str, Any]]): Only return documents matching these
+                filters on their name and meta data, see `filters.Filters`.
+        Returns:
+            List[List[Document]]: Search results of each query, in the same order.
+        """
+        results: list[list[Document]] = [[] for _ in queries]
+        if len(queries) == 0:
+            return results
+        query_embeddings = self.embedder.get_embedding_arrays(queries)
+        positions: list[int] = []
+        for position, (query, query_embedding) in enumerate(
+            zip(queries, query_embeddings, strict=True),
+        ):
+            if len(query_embedding) == 0:
+                logger.error(f"Error getting embedding for Query: {query}")
+            else:
+                positions.append(position)
 
-        # Build search results
-        search_results: list[Document] = []
+        if not self._collection:
+            self._collection = self.client.get_collection(name=self.collection)
 
-        ids = result.get("ids", [[]])[0]
-        distances = result.get("distances", [[]])[0]  # type: ignore
-        metadatas = result.get("metadatas", [[]])[0]  # type: ignore
-        documents = result.get("documents", [[]])[0]  # type: ignore
-        embeddings = result.get("embeddings")
-        uris = result.get("uris")
-        data = result.get("data")
+        where = to_chroma_where(filters) if filters else None
+        for start in range(0, len(positions), self.batch_size):
+            batch = positions[start : start + self.batch_size]
+            result: QueryResult = self._collection.query(
+                query_embeddings=[query_embeddings[i] for i in batch],
+                n_results=limit,
+                where=where,
+                include=["documents", "metadatas"],  # type: ignore
+            )
+            for position, documents in zip(
+                batch,
+                self._search_results(result),
+                strict=True,
+            ):
+                results[position] = documents
+        return results
 
+    def _search_results(self, result: QueryResult) -> list[list[Document]]:
+        """Build the documents of each query of a query result"""
+        search_results: list[list[Document]] = []
         try:
             # Use zip to iterate over multiple lists simultaneously
-            for id_, distance, metadata, document in zip(
-                ids,
-                distances,
-                metadatas,
-                documents,
-                strict=False,
+            for ids, metadatas, contents in zip(
+                result.get("ids", []),
+                result.get("metadatas") or [],
+                result.get("documents") or [],
+                strict=True,
             ):
-                search_results.append(
-                    Document(
-                        id=id_,
-                        distances=distance,
-                        metadatas=metadata,
-                        content=document,
-                        embeddings=embeddings,
-                        uris=uris,
-                        data=data,
-                    ),
-                )
+                documents: list[Document] = []
+                for id_, metadata, content in zip(
+                    ids,
+                    metadatas,
+                    contents,
+                    strict=False,
+                ):
+                    meta_data = dict(metadata or {})
+                    documents.append(
+                        Document(
+                            id=id_,
+                            name=meta_data.pop(STORED_NAME_FIELD, None),
+                            meta_data=meta_data,
+                            content=content,
+                        ),
+                    )
+                search_results.append(documents)
         except Exception as e:
             logger.error(f"Error building search results: {e}")
-
-        return search_results
+        # Results of a failed query are empty
+        num_queries = len(result.get("ids", []))
+        return search_results + [[]] * (num_queries - len(search_results))
 
     def delete(self) -> None:
         """Delete the collection."""
         if self.exists():
             logger.debug(f"Deleting collection: {self.collection}")
             self.client.delete_collection(name=self.collection)
+            self._collection = None
+            self.mark_changed()
 
     def exists(self) -> bool:
         """Check if the collection exists."""
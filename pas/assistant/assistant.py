@@ -1,6 +1,8 @@
+import asyncio
 import json
 from collections.abc import AsyncIterator, Callable, Iterator
 from datetime import datetime
+from inspect import iscoroutinefunction
 from os import getenv
 from textwrap import dedent
 from typing import (
@@ -781,13 +783,51 @@ class Assistant(BaseModel):
         )
         if len(relevant_docs) == 0:
             return None
+        return self.format_references(relevant_docs)
 
+    async def aget_references_from_knowledge_base(
+        self,
+        query: str,
+        num_documents: int | None = None,
+    ) -> str | None:
+        """Return a list of references from the knowledge base, without blocking the
+        event loop. A synchronous `references_function` is run in a thread.
+        """
+
+        if self.references_function is not None:
+            reference_kwargs = {
+                "assistant": self,
+                "query": query,
+                "num_documents": num_documents,
+            }
+            if iscoroutinefunction(self.references_function):
+                references = await self.references_function(**reference_kwargs)
+            else:
+                references = await asyncio.to_thread(
+                    self.references_function,
+                    **reference_kwargs,
+                )
+            return remove_indent(references)
+
+        if self.knowledge_base is None:
+            return None
+
+        relevant_docs: list[Document] = await self.knowledge_base.asearch(
+            query=query,
+            num_documents=num_documents,
+        )
+        if len(relevant_docs) == 0:
+            return None
+        return self.format_references(relevant_docs)
+
+    def format_references(self, documents: list[Document]) -> str:
+        """Returns the documents formatted as `references_format`"""
         if self.references_format == "yaml":
             import yaml
 
-            return yaml.dump([doc.to_dict() for doc in relevant_docs])
+            return yaml.dump([doc.to_dict() for doc in documents])
 
-        return json.dumps([doc.to_dict() for doc in relevant_docs], indent=2)
+        return json.dumps([doc.to_dict() for doc in documents], indent=2)
 
     def get_formatted_chat_history(self) -> str | None:
         """Returns a formatted chat history to add to the user prompt"""
@@ -1140,7 +1180,7 @@ class Assistant(BaseModel):
             if self.add_references_to_prompt and message and isinstance(message, str):
                 reference_timer = Timer()
                 reference_timer.start()
-                user_prompt_references = self.get_references_from_knowledge_base(
+                user_prompt_references = await self.aget_references_from_knowledge_base(
                     query=message,
                 )
                 reference_timer.stop()
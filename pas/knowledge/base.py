@@ -1,12 +1,18 @@
-from collections.abc import Iterator
+import asyncio
+from collections.abc import Callable, Iterator
 from typing import Any
 
 from pydantic import BaseModel, ConfigDict
 
+from pas.knowledge.bm25 import BM25Index, reciprocal_rank_fusion
+from pas.knowledge.cache import SearchCache
+from pas.knowledge.dedupe import Deduplicator
 from pas.knowledge.document import Document
 from pas.knowledge.document.reader import Reader
+from pas.knowledge.pipeline import embed_pipeline
+from pas.knowledge.rerank import Reranker, has_embedding
 from pas.utils.log import logger
-from pas.knowledge.vectordb import VectorDb
+from pas.knowledge.vectordb import Filters, VectorDb
 
 
 class AssistantKnowledge(BaseModel):
@@ -20,6 +26,27 @@ class AssistantKnowledge(BaseModel):
     num_documents: int = 2
     # Number of documents to optimize the vector db on
     optimize_on: int | None = 1000
+    # Number of threads embedding documents while loading the knowledge base
+    # If greater than 1, reading, embedding and inserting documents run concurrently
+    num_workers: int = 1
+    # Maximum number of document lists waiting to be embedded while loading
+    queue_size: int = 4
+    # Cache of search results, invalidated when the vector db changes
+    search_cache: SearchCache | None = None
+    # Drops exact and near duplicate documents while loading the knowledge base
+    deduplicator: Deduplicator | None = None
+    # Lexical index maintained alongside the vector db while loading documents
+    # If set, search fuses lexical and vector results, see `hybrid_search`
+    lexical_index: BM25Index | None = None
+    # Number of results of each retriever fused by hybrid search
+    hybrid_candidates: int = 20
+    # Constant of reciprocal rank fusion, higher values weigh lower ranks more
+    rrf_k: int = 60
+    # Optional rerank stage: search fetches `rerank_candidates` documents, which the
+    # reranker rescores to return the best `num_documents`
+    reranker: Reranker | None = None
+    # Number of candidates fetched for the reranker
+    rerank_candidates: int = 20
 
     model_config = ConfigDict(arbitrary_types_allowed=True)
 
@@ -30,22 +57,339 @@ class AssistantKnowledge(BaseModel):
         """
         raise NotImplementedError
 
-    def search(self, query: str, num_documents: int | None = None) -> list[Document]:
-        """Returns relevant documents matching the query"""
+    def search(
+        self,
+        query: str,
+        num_documents: int | None = None,
+        filters: Filters | None = None,
+    ) -> list[Document]:
+        """Returns relevant documents matching the query
+
+        Args:
+            query (str): Query to search for.
+            num_documents (Optional[int]): Number of documents to return. Defaults to `num_documents`.
+            filters (Optional[Dict[str, Any]]): Only return documents whose name and meta data match these filters, e.g. {"url": url}. Filters are pushed down to the vector db, see `pas.knowledge.vectordb.filters`.
+        """
         try:
             if self.vector_db is None:
                 logger.warning("No vector db provided")
                 return []
 
             _num_documents = num_documents or self.num_documents
+            cached_documents = self._get_cached(query, _num_documents, filters)
+            if cached_documents is not None:
+                logger.debug(f"Using cached documents for query: {query}")
+                return cached_documents
+
             logger.debug(
                 f"Getting {_num_documents} relevant documents for query: {query}",
             )
-            return self.vector_db.search(query=query, limit=_num_documents)
+            num_candidates = self.num_rerank_candidates(_num_documents)
+            if self.lexical_index is not None:
+                documents = self.hybrid_search(query, num_candidates, filters=filters)
+            else:
+                documents = self.vector_search(query, num_candidates, filters=filters)
+            documents = self.rerank(query, documents, _num_documents)
+            self._set_cached(query, _num_documents, filters, documents)
+            return documents
         except Exception as e:
             logger.error(f"Error searching for documents: {e}")
             return []
 
+    async def asearch(
+        self,
+        query: str,
+        num_documents: int | None = None,
+        filters: Filters | None = None,
+    ) -> list[Document]:
+        """Returns relevant documents matching the query, see `search`, without
+        blocking the event loop: the query is embedded with the async API of the
+        embedder and blocking work runs in threads.
+        """
+        try:
+            if self.vector_db is None:
+                logger.warning("No vector db provided")
+                return []
+
+            _num_documents = num_documents or self.num_documents
+            cached_documents = self._get_cached(query, _num_documents, filters)
+            if cached_documents is not None:
+                logger.debug(f"Using cached documents for query: {query}")
+                return cached_documents
+
+            logger.debug(
+                f"Getting {_num_documents} relevant documents for query: {query}",
+            )
+            num_results = self.num_rerank_candidates(_num_documents)
+            num_candidates = (
+                max(num_results, self.hybrid_candidates)
+                if self.lexical_index is not None
+                else num_results
+            )
+            if not filters:
+                documents = await self.vector_db.asearch(query, limit=num_candidates)
+            else:
+                documents = await self.vector_db.asearch(
+                    query,
+                    limit=num_candidates,
+                    filters=filters,
+                )
+            if self.lexical_index is not None:
+                documents = await asyncio.to_thread(
+                    self._fuse,
+                    query,
+                    documents,
+                    num_results,
+                    filters,
+                )
+            if self.reranker is not None:
+                documents = await asyncio.to_thread(
+                    self.rerank,
+                    query,
+                    documents,
+                    _num_documents,
+                )
+            self._set_cached(query, _num_documents, filters, documents)
+            return documents
+        except Exception as e:
+            logger.error(f"Error searching for documents: {e}")
+            return []
+
+    def _get_cached(
+        self,
+        query: str,
+        num_documents: int,
+        filters: Filters | None,
+    ) -> list[Document] | None:
+        if self.search_cache is None or self.vector_db is None:
+            return None
+        return self.search_cache.get(
+            query,
+            num_documents=num_documents,
+            collection=getattr(self.vector_db, "collection", None),
+            version=self.vector_db.version,
+            filters=filters,
+        )
+
+    def _set_cached(
+        self,
+        query: str,
+        num_documents: int,
+        filters: Filters | None,
+        documents: list[Document],
+    ) -> None:
+        # Empty results are not cached, they may come from a failed embedding
+        if self.search_cache is None or self.vector_db is None or len(documents) == 0:
+            return
+        self.search_cache.set(
+            query,
+            num_documents=num_documents,
+            documents=documents,
+            collection=getattr(self.vector_db, "collection", None),
+            version=self.vector_db.version,
+            filters=filters,
+        )
+
+    def search_many(
+        self,
+        queries: list[str],
+        num_documents: int | None = None,
+        filters: Filters | None = None,
+    ) -> list[list[Document]]:
+        """Returns relevant documents for each query, in the same order
+
+        Queries which are not cached are searched together: embedded in batches and
+        sent to the vector db as one batched query, see `VectorDb.search_many`.
+
+        Args:
+            queries (List[str]): Queries to search for.
+            num_documents (Optional[int]): Number of documents to return per query. Defaults to `num_documents`.
+            filters (Optional[Dict[str, Any]]): Only return documents whose name and meta data match these filters, see `search`.
+        """
+        try:
+            if self.vector_db is None:
+                logger.warning("No vector db provided")
+                return [[] for _ in queries]
+
+            _num_documents = num_documents or self.num_documents
+            results: list[list[Document] | None] = [
+                self._get_cached(query, _num_documents, filters) for query in queries
+            ]
+
+            # Repeated queries are searched once
+            missing_queries = list(
+                dict.fromkeys(
+                    query
+                    for query, documents in zip(queries, results, strict=True)
+                    if documents is None
+                ),
+            )
+            if len(missing_queries) > 0:
+                logger.debug(
+                    f"Getting {_num_documents} relevant documents "
+                    f"for {len(missing_queries)} queries",
+                )
+                num_candidates = self.num_rerank_candidates(_num_documents)
+                if self.lexical_index is not None:
+                    searched = self.hybrid_search_many(
+                        missing_queries,
+                        num_candidates,
+                        filters=filters,
+                    )
+                else:
+                    searched = self.vector_search_many(
+                        missing_queries,
+                        num_candidates,
+                        filters=filters,
+                    )
+                searched = [
+                    self.rerank(query, documents, _num_documents)
+                    for query, documents in zip(missing_queries, searched, strict=True)
+                ]
+                searched_documents = dict(zip(missing_queries, searched, strict=True))
+                for position, query in enumerate(queries):
+                    if results[position] is None:
+                        results[position] = list(searched_documents[query])
+                for query, documents in searched_documents.items():
+                    self._set_cached(query, _num_documents, filters, documents)
+            return results  # type: ignore
+        except Exception as e:
+            logger.error(f"Error searching for documents: {e}")
+            return [[] for _ in queries]
+
+    def vector_search(
+        self,
+        query: str,
+        num_documents: int,
+        filters: Filters | None = None,
+    ) -> list[Document]:
+        """Returns the documents closest to the query in the vector db"""
+        if self.vector_db is None:
+            raise ValueError("No vector db provided")
+        # Vector dbs written before filters were supported only accept a query
+        if not filters:
+            return self.vector_db.search(query=query, limit=num_documents)
+        return self.vector_db.search(query=query, limit=num_documents, filters=filters)
+
+    def vector_search_many(
+        self,
+        queries: list[str],
+        num_documents: int,
+        filters: Filters | None = None,
+    ) -> list[list[Document]]:
+        """Returns the documents closest to each query in the vector db"""
+        if self.vector_db is None:
+            raise ValueError("No vector db provided")
+        if not filters:
+            return self.vector_db.search_many(queries, limit=num_documents)
+        return self.vector_db.search_many(
+            queries,
+            limit=num_documents,
+            filters=filters,
+        )
+
+    def hybrid_search(
+        self,
+        query: str,
+        num_documents: int,
+        filters: Filters | None = None,
+    ) -> list[Document]:
+        """Returns the documents matching the query in the vector db and the lexical
+        index, merged with reciprocal rank fusion.
+        """
+        if self.vector_db is None or self.lexical_index is None:
+            raise ValueError("Hybrid search needs a vector db and a lexical index")
+
+        num_candidates = max(num_documents, self.hybrid_candidates)
+        vector_documents = self.vector_search(query, num_candidates, filters=filters)
+        return self._fuse(query, vector_documents, num_documents, filters)
+
+    def hybrid_search_many(
+        self,
+        queries: list[str],
+        num_documents: int,
+        filters: Filters | None = None,
+    ) -> list[list[Document]]:
+        """Returns the hybrid search results of each query, see `hybrid_search`.
+        The vector db is searched for all queries at once.
+        """
+        if self.vector_db is None or self.lexical_index is None:
+            raise ValueError("Hybrid search needs a vector db and a lexical index")
+
+        num_candidates = max(num_documents, self.hybrid_candidates)
+        vector_results = self.vector_search_many(
+            queries,
+            num_candidates,
+            filters=filters,
+        )
+        return [
+            self._fuse(query, vector_documents, num_documents, filters)
+            for query, vector_documents in zip(queries, vector_results, strict=True)
+        ]
+
+    def _fuse(
+        self,
+        query: str,
+        vector_documents: list[Document],
+        num_documents: int,
+        filters: Filters | None,
+    ) -> list[Document]:
+        """Merge vector results with the lexical results of the query"""
+        num_candidates = max(num_documents, self.hybrid_candidates)
+        lexical_documents = self.lexical_index.search(  # type: ignore
+            query,
+            limit=num_candidates,
+            filters=filters,
+        )
+        return reciprocal_rank_fusion(
+            [vector_documents, lexical_documents],
+            k=self.rrf_k,
+        )[:num_documents]
+
+    def num_rerank_candidates(self, num_documents: int) -> int:
+        """Returns the number of documents to search for before reranking"""
+        if self.reranker is None:
+            return num_documents
+        return max(num_documents, self.rerank_candidates)
+
+    def rerank(
+        self,
+        query: str,
+        documents: list[Document],
+        num_documents: int,
+    ) -> list[Document]:
+        """Returns the best `num_documents` candidates according to the reranker.
+        Falls back to the order of the search if reranking fails.
+        """
+        if self.reranker is None or len(documents) == 0:
+            return documents[:num_documents]
+
+        try:
+            if self.reranker.uses_embeddings and self.vector_db is not None:
+                # Search results usually come without embeddings, the stored ones
+                # are given to copies of them
+                missing = [
+                    document
+                    for document in documents
+                    if not has_embedding(document.embedding)
+                ]
+                stored = (
+                    self.vector_db.get_stored_embeddings(missing) if missing else {}
+                )
+                if stored:
+                    documents = [
+                        document.model_copy(update={"embedding": embedding})
+                        if not has_embedding(document.embedding)
+                        and (embedding := stored.get(self.vector_db.doc_id(document)))
+                        is not None
+                        else document
+                        for document in documents
+                    ]
+            return self.reranker.rerank(query, documents, top_n=num_documents)
+        except Exception as e:
+            logger.warning(f"Error reranking documents: {e}")
+            return documents[:num_documents]
+
     def load(
         self,
         recreate: bool = False,
@@ -67,33 +411,96 @@ class AssistantKnowledge(BaseModel):
         if recreate:
             logger.info("Deleting collection")
             self.vector_db.delete()
+            if self.lexical_index is not None:
+                self.lexical_index.clear()
 
         logger.info("Creating collection")
         self.vector_db.create()
 
         logger.info("Loading knowledge base")
         num_documents = 0
-        for document_list in self.document_lists:
-            documents_to_load = document_list
-            # Upsert documents if upsert is True and vector db supports upsert
-            if upsert and self.vector_db.upsert_available():
+        # Upsert documents if upsert is True and vector db supports upsert
+        use_upsert = upsert and self.vector_db.upsert_available()
+        vector_db = self.vector_db
+        deduplicator = self.deduplicator
+        if deduplicator is not None:
+            deduplicator.reset()
+        lexical_index = self.lexical_index
+
+        def prepare(document_list: list[Document]) -> list[Document]:
+            # Drop duplicates before they are looked up or embedded
+            if deduplicator is not None:
+                document_list = deduplicator.filter(document_list)
+            # Filter out documents which already exist in the vector db
+            if not use_upsert and skip_existing:
+                exist = vector_db.docs_exist(document_list)
+                # Existing documents are indexed too, in case the index was added later
+                if lexical_index is not None:
+                    lexical_index.add(
+                        [
+                            document
+                            for document, exists in zip(
+                                document_list, exist, strict=True
+                            )
+                            if exists
+                        ],
+                    )
+                return [
+                    document
+                    for document, exists in zip(document_list, exist, strict=True)
+                    if not exists
+                ]
+            return document_list
+
+        for documents_to_load in self.prepared_document_lists(prepare):
+            if use_upsert:
                 self.vector_db.upsert(documents=documents_to_load)
             # Insert documents
             else:
-                # Filter out documents which already exist in the vector db
-                if skip_existing:
-                    documents_to_load = [
-                        document
-                        for document in document_list
-                        if not self.vector_db.doc_exists(document)
-                    ]
                 self.vector_db.insert(documents=documents_to_load)
+            # Documents are indexed once they are in the vector db
+            if lexical_index is not None:
+                lexical_index.add(documents_to_load)
             num_documents += len(documents_to_load)
             logger.info(f"Added {len(documents_to_load)} documents to knowledge base")
 
+        if deduplicator is not None:
+            logger.info(
+                f"Dropped {deduplicator.dropped} duplicate documents: "
+                f"{deduplicator.exact_dropped} exact, "
+                f"{deduplicator.near_dropped} near duplicates",
+            )
+
         if self.optimize_on is not None and num_documents > self.optimize_on:
             logger.info("Optimizing Vector DB")
             self.vector_db.optimize()
+        if lexical_index is not None:
+            lexical_index.save()
+        self.clear_search_cache()
+
+    def prepared_document_lists(
+        self,
+        prepare: Callable[[list[Document]], list[Document]],
+    ) -> Iterator[list[Document]]:
+        """Iterator that yields the document lists of the knowledge base after `prepare`
+
+        If `num_workers` is greater than 1 and the vector db has an embedder, documents
+        are read, prepared and embedded concurrently, ahead of being inserted.
+        """
+        embedder = self.vector_db.embedder if self.vector_db is not None else None
+        if self.num_workers <= 1 or embedder is None:
+            for document_list in self.document_lists:
+                yield prepare(document_list)
+            return
+
+        logger.debug(f"Embedding documents with {self.num_workers} workers")
+        yield from embed_pipeline(
+            document_lists=self.document_lists,
+            embedder=embedder,
+            prepare=prepare,
+            num_workers=self.num_workers,
+            queue_size=self.queue_size,
+        )
 
     def load_documents(
         self,
@@ -108,7 +515,72 @@ class AssistantKnowledge(BaseModel):
             upsert (bool): If True, upserts documents to the vector db. Defaults to False.
             skip_existing (bool): If True, skips documents which already exist in the vector db when inserting. Defaults to True.
         """
+        self._load_documents(
+            documents=documents,
+            upsert=upsert,
+            skip_existing=skip_existing,
+        )
+        if self.lexical_index is not None:
+            self.lexical_index.save()
+
+    async def aload_documents(
+        self,
+        documents: list[Document],
+        upsert: bool = False,
+        skip_existing: bool = True,
+    ) -> None:
+        """Load documents to the knowledge base without blocking the event loop
+
+        Documents are written with `VectorDb.ainsert` or `VectorDb.aupsert`, which embed
+        them with the async API of the embedder.
+
+        Args:
+            documents (List[Document]): List of documents to load
+            upsert (bool): If True, upserts documents to the vector db. Defaults to False.
+            skip_existing (bool): If True, skips documents which already exist in the vector db when inserting. Defaults to True.
+        """
+        logger.info("Loading knowledge base")
+        if self.vector_db is None:
+            logger.warning("No vector db provided")
+            return
+
+        vector_db = self.vector_db
+        await asyncio.to_thread(vector_db.create)
+
+        if upsert and vector_db.upsert_available():
+            await vector_db.aupsert(documents=documents)
+            logger.info(f"Loaded {len(documents)} documents to knowledge base")
+        else:
+            documents_to_load = documents
+            if skip_existing:
+                exist = await asyncio.to_thread(vector_db.docs_exist, documents)
+                documents_to_load = [
+                    document
+                    for document, exists in zip(documents, exist, strict=True)
+                    if not exists
+                ]
+            if len(documents_to_load) > 0:
+                await vector_db.ainsert(documents=documents_to_load)
+                logger.info(
+                    f"Loaded {len(documents_to_load)} documents to knowledge base",
+                )
+            else:
+                logger.info("No new documents to load")
 
+        # Documents are indexed once they are in the vector db
+        if self.lexical_index is not None:
+            await asyncio.to_thread(self.lexical_index.add, documents)
+        self.clear_search_cache()
+        if self.lexical_index is not None:
+            await asyncio.to_thread(self.lexical_index.save)
+
+    def _load_documents(
+        self,
+        documents: list[Document],
+        upsert: bool = False,
+        skip_existing: bool = True,
+    ) -> None:
+        """Load documents to the knowledge base, without saving the lexical index"""
         logger.info("Loading knowledge base")
         if self.vector_db is None:
             logger.warning("No vector db provided")
@@ -120,6 +592,9 @@ class AssistantKnowledge(BaseModel):
         # Upsert documents if upsert is True
         if upsert and self.vector_db.upsert_available():
             self.vector_db.upsert(documents=documents)
+            if self.lexical_index is not None:
+                self.lexical_index.add(documents)
+            self.clear_search_cache()
             logger.info(f"Loaded {len(documents)} documents to knowledge base")
             return
 
@@ -127,8 +602,12 @@ class AssistantKnowledge(BaseModel):
         documents_to_load = (
             [
                 document
-                for document in documents
-                if not self.vector_db.doc_exists(document)
+                for document, exists in zip(
+                    documents,
+                    self.vector_db.docs_exist(documents),
+                    strict=True,
+                )
+                if not exists
             ]
             if skip_existing
             else documents
@@ -137,9 +616,14 @@ class AssistantKnowledge(BaseModel):
         # Insert documents
         if len(documents_to_load) > 0:
             self.vector_db.insert(documents=documents_to_load)
+            self.clear_search_cache()
             logger.info(f"Loaded {len(documents_to_load)} documents to knowledge base")
         else:
             logger.info("No new documents to load")
+        # Documents are indexed once they are in the vector db, existing documents
+        # too, in case the index was added later
+        if self.lexical_index is not None:
+            self.lexical_index.add(documents)
 
     def load_document(
         self,
@@ -230,4 +714,17 @@ class AssistantKnowledge(BaseModel):
             logger.warning("No vector db available")
             return True
 
-        return self.vector_db.clear()
+        cleared = self.vector_db.clear()
+        # Keep the lexical index in sync with the documents left in the vector db
+        if cleared:
+            if self.lexical_index is not None:
+                self.lexical_index.clear()
+            self.clear_search_cache()
+        return cleared
+
+    def clear_search_cache(self) -> None:
+        """Remove cached search results.
+        Called after loading documents, for vector dbs which do not track changes.
+        """
+        if self.search_cache is not None:
+            self.search_cache.clear()
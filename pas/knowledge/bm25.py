@@ -0,0 +1,370 @@
+import json
+import re
+from array import array
+from collections import Counter
+from itertools import repeat
+from pathlib import Path
+from threading import RLock
+from typing import Any
+
+import numpy as np
+
+from pas.knowledge.document import Document
+from pas.knowledge.vectordb.base import VectorDb
+from pas.knowledge.vectordb.filters import FieldIndex, Filters, document_fields
+from pas.utils.log import logger
+
+TOKEN = re.compile(r"\w+")
+
+
+def tokenize(text: str) -> list[str]:
+    """Split text into lowercase words, identifiers like ERR-4021 give err and 4021"""
+    return TOKEN.findall(text.lower())
+
+
+class BM25Index:
+    def __init__(
+        self,
+        path: str | None = None,
+        k1: float = 1.5,
+        b: float = 0.75,
+        max_deleted_fraction: float = 0.25,
+    ):
+        """
+        In-process inverted index ranking documents with BM25.
+
+        Documents are identified like in the vector db, by the hash of their content.
+        The posting list of each term is a pair of compact arrays of document rows and
+        term frequencies, scored with vectorized numpy operations.
+
+        If a path is provided, the index is loaded from `{path}` when it exists and
+        `save()` writes it there: the posting lists in a single `bm25.npz` file and the
+        documents in a JSON lines file.
+
+        :param path: The directory to persist the index in, in memory only if None.
+        :param k1: The BM25 term frequency saturation.
+        :param b: The BM25 document length normalization.
+        :param max_deleted_fraction: The fraction of deleted documents above which
+            the posting lists are compacted.
+        """
+        self.path: str | None = path
+        self.k1: float = k1
+        self.b: float = b
+        self.max_deleted_fraction: float = max_deleted_fraction
+
+        # Row of each term in the posting lists
+        self._terms: dict[str, int] = {}
+        # Posting lists by term row: document rows and term frequencies
+        self._postings_rows: list[array] = []
+        self._postings_tfs: list[array] = []
+        # Number of tokens of each document by row
+        self._lengths: array = array("I")
+        # Documents by row, None for deleted documents
+        self._documents: list[Document | None] = []
+        # Row of each document id
+        self._rows: dict[str, int] = {}
+        # Number of tokens of the documents which are not deleted
+        self._total_length: int = 0
+        # Rows by value of the name and meta data fields, to evaluate filters
+        self._field_index: FieldIndex = FieldIndex()
+
+        self._lock = RLock()
+        if self.path is not None and self._index_file.exists():
+            self.load()
+
+    @property
+    def _index_file(self) -> Path:
+        return Path(self.path) / "bm25.npz"  # type: ignore
+
+    @property
+    def _documents_file(self) -> Path:
+        return Path(self.path) / "documents.jsonl"  # type: ignore
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def add(self, documents: list[Document]) -> None:
+        """Index documents, documents which are already indexed are skipped.
+        The postings of the documents are appended to the posting lists term by term.
+        """
+        with self._lock:
+            # Term, term frequency and document row of each new posting
+            terms: list[str] = []
+            term_frequencies: list[int] = []
+            rows: list[int] = []
+            for document in documents:
+                doc_id = VectorDb.doc_id(document)
+                if doc_id in self._rows:
+                    continue
+                tokens = tokenize(document.content)
+                counts = Counter(tokens)
+                row = len(self._documents)
+                terms.extend(counts)
+                term_frequencies.extend(counts.values())
+                rows.extend(repeat(row, len(counts)))
+                self._lengths.append(len(tokens))
+                # Embeddings are not needed to return lexical matches
+                self._documents.append(
+                    Document.model_construct(
+                        id=document.id,
+                        name=document.name,
+                        meta_data=dict(document.meta_data),
+                        content=document.content,
+                    ),
+                )
+                self._rows[doc_id] = row
+                self._field_index.add(
+                    row,
+                    document_fields(document.name, document.meta_data),
+                )
+                self._total_length += len(tokens)
+            if not terms:
+                return
+
+            vocabulary = self._terms
+            term_rows = np.fromiter(
+                (vocabulary.setdefault(term, len(vocabulary)) for term in terms),
+                dtype=np.int64,
+                count=len(terms),
+            )
+            while len(self._postings_rows) < len(vocabulary):
+                self._postings_rows.append(array("I"))
+                self._postings_tfs.append(array("I"))
+
+            # Group the postings by term, keeping the rows in ascending order
+            order = np.argsort(term_rows, kind="stable")
+            term_rows = term_rows[order]
+            posting_rows = np.array(rows, dtype=np.uint32)[order]
+            posting_tfs = np.array(term_frequencies, dtype=np.uint32)[order]
+            bounds = np.flatnonzero(np.diff(term_rows)) + 1
+            starts = [0, *bounds.tolist()]
+            ends = [*bounds.tolist(), len(term_rows)]
+            for start, end in zip(starts, ends, strict=True):
+                term_row = int(term_rows[start])
+                self._postings_rows[term_row].frombytes(
+                    posting_rows[start:end].tobytes()
+                )
+                self._postings_tfs[term_row].frombytes(posting_tfs[start:end].tobytes())
+
+    def remove(self, ids: list[str]) -> None:
+        """Remove documents by id, see `VectorDb.doc_id`"""
+        with self._lock:
+            for doc_id in ids:
+                row = self._rows.pop(doc_id, None)
+                if row is not None:
+                    self._documents[row] = None
+                    self._field_index.remove(row)
+                    self._total_length -= self._lengths[row]
+            num_deleted = len(self._documents) - len(self._rows)
+            if num_deleted > self.max_deleted_fraction * len(self._documents):
+                self.compact()
+
+    def search(
+        self,
+        query: str,
+        limit: int = 5,
+        filters: Filters | None = None,
+    ) -> list[Document]:
+        """Returns the documents with the highest BM25 score for the query.
+        If filters are provided, only documents matching them are returned.
+        """
+        with self._lock:
+            if len(self._rows) == 0:
+                return []
+
+            num_documents = len(self._rows)
+            lengths = np.frombuffer(self._lengths, dtype=np.uint32)
+            average_length = max(self._total_length / num_documents, 1.0)
+            length_norms = self.k1 * (1 - self.b + self.b * lengths / average_length)
+
+            scores = np.zeros(len(self._documents), dtype=np.float32)
+            for term in set(tokenize(query)):
+                term_row = self._terms.get(term)
+                if term_row is None:
+                    continue
+                rows = np.frombuffer(self._postings_rows[term_row], dtype=np.uint32)
+                tfs = np.frombuffer(self._postings_tfs[term_row], dtype=np.uint32)
+                # Deleted documents are counted until the posting lists are compacted
+                document_frequency = len(rows)
+                idf = np.log(
+                    1
+                    + (num_documents - document_frequency + 0.5)
+                    / (document_frequency + 0.5),
+                )
+                # Rows are unique within a posting list
+                scores[rows] += (
+                    idf * tfs * (self.k1 + 1) / (tfs + length_norms[rows])
+                ).astype(np.float32)
+
+            matches = np.flatnonzero(scores > 0)
+            if filters:
+                allowed = np.zeros(len(self._documents), dtype=bool)
+                allowed[self._field_index.rows(filters)] = True
+                matches = matches[allowed[matches]]
+            # Deleted documents may be among the best matches
+            k = min(len(matches), limit + len(self._documents) - num_documents)
+            if 0 < k < len(matches):
+                matches = matches[np.argpartition(-scores[matches], k - 1)[:k]]
+            top = matches[np.argsort(-scores[matches], kind="stable")]
+            results: list[Document] = []
+            for row in top:
+                document = self._documents[row]
+                if document is not None:
+                    results.append(document.model_copy(deep=True))
+                    if len(results) == limit:
+                        break
+            return results
+
+    def compact(self) -> None:
+        """Remove deleted documents from the posting lists, renumbering the rows"""
+        with self._lock:
+            alive = np.array(
+                [document is not None for document in self._documents],
+                dtype=bool,
+            )
+            if alive.all():
+                return
+
+            logger.debug("Compacting BM25 index")
+            new_rows = np.cumsum(alive, dtype=np.int64) - 1
+            terms: dict[str, int] = {}
+            postings_rows: list[array] = []
+            postings_tfs: list[array] = []
+            for term, term_row in self._terms.items():
+                rows = np.frombuffer(self._postings_rows[term_row], dtype=np.uint32)
+                keep = alive[rows]
+                if not keep.any():
+                    continue
+                terms[term] = len(terms)
+                postings_rows.append(
+                    array("I", new_rows[rows[keep]].astype(np.uint32).tobytes()),
+                )
+                tfs = np.frombuffer(self._postings_tfs[term_row], dtype=np.uint32)
+                postings_tfs.append(array("I", tfs[keep].tobytes()))
+
+            self._terms = terms
+            self._postings_rows = postings_rows
+            self._postings_tfs = postings_tfs
+            self._lengths = array(
+                "I",
+                np.frombuffer(self._lengths, dtype=np.uint32)[alive].tobytes(),
+            )
+            self._documents = [doc for doc in self._documents if doc is not None]
+            self._field_index.clear()
+            for row, document in enumerate(self._documents):
+                self._field_index.add(
+                    row,
+                    document_fields(document.name, document.meta_data),
+                )
+            self._rows = {
+                doc_id: int(new_rows[row]) for doc_id, row in self._rows.items()
+            }
+
+    def save(self) -> None:
+        """Compact the index and write it to `path`"""
+        if self.path is None:
+            return
+
+        with self._lock:
+            self.compact()
+            Path(self.path).mkdir(parents=True, exist_ok=True)
+            offsets = np.zeros(len(self._postings_rows) + 1, dtype=np.int64)
+            offsets[1:] = np.cumsum([len(rows) for rows in self._postings_rows])
+            row_ids = {row: doc_id for doc_id, row in self._rows.items()}
+
+            # Write to temporary files first so an interrupted save keeps the old index
+            index_file = self._index_file.with_name("bm25.tmp.npz")
+            np.savez(
+                index_file,
+                terms=np.array(list(self._terms), dtype=str),
+                offsets=offsets,
+                rows=np.frombuffer(b"".join(self._postings_rows), dtype=np.uint32),
+                tfs=np.frombuffer(b"".join(self._postings_tfs), dtype=np.uint32),
+                lengths=np.frombuffer(self._lengths, dtype=np.uint32),
+            )
+            documents_file = self._documents_file.with_suffix(".tmp")
+            with documents_file.open("w", encoding="utf-8") as f:
+                for row, document in enumerate(self._documents):
+                    entry: dict[str, Any] = {
+                        "doc_id": row_ids[row],
+                        "id": document.id,  # type: ignore
+                        "name": document.name,  # type: ignore
+                        "meta_data": document.meta_data,  # type: ignore
+                        "content": document.content,  # type: ignore
+                    }
+                    f.write(json.dumps(entry, default=str) + "\n")
+            documents_file.replace(self._documents_file)
+            index_file.replace(self._index_file)
+
+    def load(self) -> None:
+        """Load the index saved in `path`"""
+        with self._lock:
+            self._reset()
+            with np.load(self._index_file) as index:
+                offsets = index["offsets"]
+                rows = index["rows"]
+                tfs = index["tfs"]
+                for term_row, term in enumerate(index["terms"].tolist()):
+                    start, end = offsets[term_row], offsets[term_row + 1]
+                    self._terms[term] = term_row
+                    self._postings_rows.append(array("I", rows[start:end].tobytes()))
+                    self._postings_tfs.append(array("I", tfs[start:end].tobytes()))
+                self._lengths = array("I", index["lengths"].tobytes())
+
+            with self._documents_file.open(encoding="utf-8") as f:
+                for row, line in enumerate(f):
+                    entry = json.loads(line)
+                    meta_data = entry["meta_data"] or {}
+                    self._documents.append(
+                        Document.model_construct(
+                            id=entry["id"],
+                            name=entry["name"],
+                            meta_data=meta_data,
+                            content=entry["content"],
+                        ),
+                    )
+                    self._rows[entry["doc_id"]] = row
+                    self._field_index.add(
+                        row,
+                        document_fields(entry["name"], meta_data),
+                    )
+            self._total_length = int(sum(self._lengths))
+
+    def _reset(self) -> None:
+        self._terms = {}
+        self._postings_rows = []
+        self._postings_tfs = []
+        self._lengths = array("I")
+        self._documents = []
+        self._rows = {}
+        self._total_length = 0
+        self._field_index.clear()
+
+    def clear(self) -> None:
+        """Remove all documents, and the saved index"""
+        with self._lock:
+            self._reset()
+            if self.path is not None:
+                self._index_file.unlink(missing_ok=True)
+                self._documents_file.unlink(missing_ok=True)
+
+
+def reciprocal_rank_fusion(
+    result_lists: list[list[Document]],
+    k: int = 60,
+) -> list[Document]:
+    """Merge ranked lists of documents, scoring each document by the sum of
+    1 / (k + rank) over the lists it is in. Documents are matched by content hash.
+    """
+    scores: dict[str, float] = {}
+    documents: dict[str, Document] = {}
+    for results in result_lists:
+        for rank, document in enumerate(results, start=1):
+            doc_id = VectorDb.doc_id(document)
+            scores[doc_id] = scores.get(doc_id, 0.0) + 1.0 / (k + rank)
+            documents.setdefault(doc_id, document)
+    # Sorting is stable, so ties keep the order of the first lists
+    return [
+        documents[doc_id]
+        for doc_id in sorted(scores, key=scores.__getitem__, reverse=True)
+    ]
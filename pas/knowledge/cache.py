@@ -0,0 +1,115 @@
+import json
+from collections import OrderedDict
+from threading import Lock
+from time import monotonic
+from typing import Any
+
+from pas.knowledge.document import Document
+
+
+class SearchCache:
+    def __init__(self, max_size: int = 256, ttl: float | None = 300):
+        """
+        In-memory cache of search results with least recently used eviction.
+
+        Results are keyed by the normalized query, the number of documents, the filters
+        and the collection and its version, so results are invalidated when the vector db
+        changes. `ttl` bounds how stale results can get when the collection is changed
+        by another process.
+
+        :param max_size: The maximum number of queries kept in memory.
+        :param ttl: The number of seconds results are kept, None to keep them until
+            they are evicted or invalidated.
+        """
+        self.max_size: int = max_size
+        self.ttl: float | None = ttl
+        self.hits: int = 0
+        self.misses: int = 0
+
+        self._results: OrderedDict[tuple, tuple[float, list[Document]]] = OrderedDict()
+        self._version: tuple[str | None, int] | None = None
+        self._lock = Lock()
+
+    def __len__(self) -> int:
+        return len(self._results)
+
+    @staticmethod
+    def normalize(query: str) -> str:
+        """Returns the query with runs of whitespace collapsed to a single space"""
+        return " ".join(query.split())
+
+    def key(
+        self,
+        query: str,
+        num_documents: int,
+        collection: str | None,
+        version: int,
+        filters: dict[str, Any] | None,
+    ) -> tuple:
+        filters_key = (
+            json.dumps(filters, sort_keys=True, default=str) if filters else None
+        )
+        return (collection, version, num_documents, self.normalize(query), filters_key)
+
+    def get(
+        self,
+        query: str,
+        num_documents: int,
+        collection: str | None = None,
+        version: int = 0,
+        filters: dict[str, Any] | None = None,
+    ) -> list[Document] | None:
+        """Returns the cached results for the query, None if they are not cached"""
+        with self._lock:
+            self._check_version(collection, version)
+            key = self.key(query, num_documents, collection, version, filters)
+            cached = self._results.get(key)
+            if cached is not None:
+                stored_at, documents = cached
+                if self.ttl is None or monotonic() - stored_at < self.ttl:
+                    self._results.move_to_end(key)
+                    self.hits += 1
+                    return list(documents)
+                del self._results[key]
+            self.misses += 1
+            return None
+
+    def set(
+        self,
+        query: str,
+        num_documents: int,
+        documents: list[Document],
+        collection: str | None = None,
+        version: int = 0,
+        filters: dict[str, Any] | None = None,
+    ) -> None:
+        with self._lock:
+            self._check_version(collection, version)
+            key = self.key(query, num_documents, collection, version, filters)
+            self._results[key] = (monotonic(), list(documents))
+            self._results.move_to_end(key)
+            while len(self._results) > self.max_size:
+                self._results.popitem(last=False)
+
+    def _check_version(self, collection: str | None, version: int) -> None:
+        # Results of other versions can no longer be hit, so they are dropped
+        if self._version != (collection, version):
+            self._results.clear()
+            self._version = (collection, version)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._results.clear()
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hit_rate,
+            "size": len(self._results),
+        }
@@ -0,0 +1,155 @@
+from hashlib import blake2b
+from threading import Lock
+from typing import Any
+
+import numpy as np
+
+from pas.knowledge.document import Document
+
+# Multiplier combining the hashes of the words of a shingle
+SHINGLE_MULTIPLIER = np.uint64(1_000_003)
+
+
+class Deduplicator:
+    def __init__(
+        self,
+        near_duplicates: bool = True,
+        threshold: float = 0.8,
+        num_perm: int = 128,
+        bands: int = 32,
+        shingle_size: int = 3,
+        seed: int = 0,
+    ):
+        """
+        Drops exact and near duplicate documents, keeping the first one seen.
+
+        Exact duplicates have the same content after collapsing whitespace. Near
+        duplicates are found with MinHash signatures of the word shingles of the
+        content, indexed with locality sensitive hashing: documents sharing a band of
+        their signature are candidates, and are duplicates if their estimated Jaccard
+        similarity is at least `threshold`.
+
+        :param near_duplicates: Drop near duplicates, else only exact duplicates.
+        :param threshold: The minimum estimated Jaccard similarity of near duplicates.
+        :param num_perm: The number of hash functions of the MinHash signatures.
+        :param bands: The number of LSH bands, `num_perm` must be a multiple of it.
+            More bands find more candidates with a lower similarity.
+        :param shingle_size: The number of words per shingle.
+        :param seed: The seed of the hash functions.
+        """
+        if num_perm % bands != 0:
+            raise ValueError("num_perm must be a multiple of bands")
+
+        self.near_duplicates: bool = near_duplicates
+        self.threshold: float = threshold
+        self.num_perm: int = num_perm
+        self.bands: int = bands
+        self.shingle_size: int = shingle_size
+        self.exact_dropped: int = 0
+        self.near_dropped: int = 0
+        self.kept: int = 0
+
+        rng = np.random.default_rng(seed)
+        # Multiply-shift hash functions, with odd multipliers
+        self._a = rng.integers(0, 1 << 63, size=num_perm, dtype=np.uint64) * 2 + 1
+        self._b = rng.integers(0, 1 << 63, size=num_perm, dtype=np.uint64)
+        self._hashes: set[bytes] = set()
+        self._signatures: list[np.ndarray] = []
+        self._buckets: list[dict[bytes, list[int]]] = [{} for _ in range(bands)]
+        self._lock = Lock()
+
+    def filter(self, documents: list[Document]) -> list[Document]:
+        """Returns the documents which are not duplicates of a document seen before"""
+        kept: list[Document] = []
+        with self._lock:
+            for document in documents:
+                words = document.content.split()
+                content_hash = blake2b(
+                    " ".join(words).encode(),
+                    digest_size=16,
+                ).digest()
+                if content_hash in self._hashes:
+                    self.exact_dropped += 1
+                    continue
+                self._hashes.add(content_hash)
+
+                if self.near_duplicates and words:
+                    signature = self.signature(words)
+                    if self._is_near_duplicate(signature):
+                        self.near_dropped += 1
+                        continue
+                    self._index(signature)
+                kept.append(document)
+            self.kept += len(kept)
+        return kept
+
+    def signature(self, words: list[str]) -> np.ndarray:
+        """Returns the MinHash signature of the word shingles"""
+        # Built-in string hashes vary between processes, which is fine for an
+        # index kept in memory
+        word_hashes = np.fromiter(
+            map(hash, words),
+            dtype=np.int64,
+            count=len(words),
+        ).view(np.uint64)
+        # Shingle hashes are combined from the word hashes, wrapping around 2^64
+        size = min(self.shingle_size, len(words))
+        num_shingles = len(words) - size + 1
+        shingle_hashes = word_hashes[:num_shingles].copy()
+        for offset in range(1, size):
+            shingle_hashes *= SHINGLE_MULTIPLIER
+            shingle_hashes += word_hashes[offset : offset + num_shingles]
+        shingle_hashes = np.unique(shingle_hashes)
+        # The high 32 bits of the products are the hash values
+        permuted = (shingle_hashes[:, None] * self._a + self._b) >> np.uint64(32)
+        return permuted.min(axis=0).astype(np.uint32)
+
+    def _band_keys(self, signature: np.ndarray) -> list[bytes]:
+        return [band.tobytes() for band in signature.reshape(self.bands, -1)]
+
+    def _is_near_duplicate(self, signature: np.ndarray) -> bool:
+        checked: set[int] = set()
+        for buckets, key in zip(
+            self._buckets,
+            self._band_keys(signature),
+            strict=True,
+        ):
+            for index in buckets.get(key, ()):
+                if index in checked:
+                    continue
+                checked.add(index)
+                similarity = np.mean(self._signatures[index] == signature)
+                if similarity >= self.threshold:
+                    return True
+        return False
+
+    def _index(self, signature: np.ndarray) -> None:
+        index = len(self._signatures)
+        self._signatures.append(signature)
+        for buckets, key in zip(
+            self._buckets,
+            self._band_keys(signature),
+            strict=True,
+        ):
+            buckets.setdefault(key, []).append(index)
+
+    @property
+    def dropped(self) -> int:
+        return self.exact_dropped + self.near_dropped
+
+    def reset(self) -> None:
+        """Forget the documents seen and reset the counts"""
+        with self._lock:
+            self._hashes.clear()
+            self._signatures.clear()
+            self._buckets = [{} for _ in range(self.bands)]
+            self.exact_dropped = 0
+            self.near_dropped = 0
+            self.kept = 0
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "kept": self.kept,
+            "exact_dropped": self.exact_dropped,
+            "near_dropped": self.near_dropped,
+        }
@@ -1,8 +1,9 @@
 from typing import Any
 
-from pydantic import BaseModel, ConfigDict
+from pydantic import BaseModel, ConfigDict, field_serializer
 
 from pas.knowledge.embedder import Embedder
+from pas.knowledge.embedder.base import Embedding, embedding_to_list
 
 
 class Document(BaseModel):
@@ -13,11 +14,16 @@ class Document(BaseModel):
     name: str | None = None
     meta_data: dict[str, Any] = {}
     embedder: Embedder | None = None
-    embedding: list[float] | None = None
+    # A list of floats or a float32 buffer, converted to a list when serialized
+    embedding: Embedding | None = None
     usage: dict[str, Any] | None = None
 
     model_config = ConfigDict(arbitrary_types_allowed=True)
 
+    @field_serializer("embedding")
+    def serialize_embedding(self, embedding: Embedding | None) -> list[float] | None:
+        return embedding_to_list(embedding) if embedding is not None else None
+
     def embed(self, embedder: Embedder | None = None) -> None:
         """Embed the document using the provided embedder"""
 
@@ -27,6 +33,40 @@ class Document(BaseModel):
 
         self.embedding, self.usage = _embedder.get_embedding_and_usage(self.content)
 
+    @classmethod
+    def embed_documents(cls, documents: list["Document"], embedder: Embedder) -> None:
+        """Embed a list of documents using batched requests to the embedder.
+        Embeddings are stored as float32 arrays.
+        """
+
+        if len(documents) == 0:
+            return
+
+        embeddings = embedder.get_embedding_arrays(
+            [document.content for document in documents],
+        )
+        for document, embedding in zip(documents, embeddings, strict=True):
+            document.embedding = embedding
+
+    @classmethod
+    async def aembed_documents(
+        cls,
+        documents: list["Document"],
+        embedder: Embedder,
+    ) -> None:
+        """Embed a list of documents like `embed_documents`, without blocking the
+        event loop.
+        """
+
+        if len(documents) == 0:
+            return
+
+        embeddings = await embedder.aget_embedding_arrays(
+            [document.content for document in documents],
+        )
+        for document, embedding in zip(documents, embeddings, strict=True):
+            document.embedding = embedding
+
     def to_dict(self) -> dict[str, Any]:
         """Returns a dictionary representation of the document"""
 
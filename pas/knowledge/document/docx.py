@@ -16,32 +16,34 @@ class DocxReader(Reader):
             raise FileNotFoundError(f"Could not find file: {path}")
 
         try:
-            import textract
+            return self.read_source(path)
         except ImportError:
-            raise ImportError("`textract` not installed")
-
-        try:
-            logger.info(f"Reading: {path}")
-            doc_name = (
-                path.name.split("/")[-1]
-                .split(".")[0]
-                .replace("/", "_")
-                .replace(" ", "_")
-            )
-            doc_content = textract.process(path)
-            documents = [
-                Document(
-                    name=doc_name,
-                    id=doc_name,
-                    content=doc_content.decode("utf-8"),
-                ),
-            ]
-            if self.chunk:
-                chunked_documents = []
-                for document in documents:
-                    chunked_documents.extend(self.chunk_document(document))
-                return chunked_documents
-            return documents
+            raise
         except Exception as e:
             logger.error(f"Error reading: {path}: {e}")
         return []
+
+    def read_source(self, path: Path) -> list[Document]:
+        try:
+            import textract
+        except ImportError:
+            raise ImportError("`textract` not installed")
+
+        logger.info(f"Reading: {path}")
+        doc_name = (
+            path.name.split("/")[-1].split(".")[0].replace("/", "_").replace(" ", "_")
+        )
+        doc_content = textract.process(path)
+        documents = [
+            Document(
+                name=doc_name,
+                id=doc_name,
+                content=doc_content.decode("utf-8"),
+            ),
+        ]
+        if self.chunk:
+            chunked_documents = []
+            for document in documents:
+                chunked_documents.extend(self.chunk_document(document))
+            return chunked_documents
+        return documents
@@ -0,0 +1,149 @@
+from importlib.util import find_spec
+from typing import Any, NamedTuple
+from urllib.parse import urljoin
+
+from pydantic import BaseModel
+
+# Main content is the first <article>, else the first <main>, else the first element
+# with one of these classes, in order
+MAIN_CONTENT_TAGS = ["article", "main"]
+MAIN_CONTENT_CLASSES = ["content", "main-content", "post-content"]
+# Elements whose text is not content
+SKIPPED_TAGS = {"script", "style", "template"}
+
+
+class ParsedPage(NamedTuple):
+    # Text of the main content, with strings separated by a space
+    content: str
+    # Absolute URLs of the links, in document order
+    links: list[str]
+
+
+class HtmlParser(BaseModel):
+    """Base class for HTML parsers extracting the main content and links of pages"""
+
+    def parse(self, html: bytes | str, url: str) -> ParsedPage:
+        raise NotImplementedError
+
+
+class BeautifulSoupParser(HtmlParser):
+    """Parser using BeautifulSoup, with the pure Python `html.parser` by default"""
+
+    features: str = "html.parser"
+
+    def parse(self, html: bytes | str, url: str) -> ParsedPage:
+        try:
+            from bs4 import BeautifulSoup
+        except ImportError:
+            raise ImportError("`bs4` not installed")
+
+        soup = BeautifulSoup(html, self.features)
+        return ParsedPage(
+            content=self.extract_main_content(soup),
+            links=[
+                urljoin(url, link["href"]) for link in soup.find_all("a", href=True)
+            ],
+        )
+
+    @staticmethod
+    def extract_main_content(soup: Any) -> str:
+        # Try to find main content by specific tags or class names
+        for tag in MAIN_CONTENT_TAGS:
+            element = soup.find(tag)
+            if element:
+                return element.get_text(strip=True, separator=" ")
+
+        for class_name in MAIN_CONTENT_CLASSES:
+            element = soup.find(class_=class_name)
+            if element:
+                return element.get_text(strip=True, separator=" ")
+
+        return ""
+
+
+class LxmlParser(HtmlParser):
+    """Parser using the `lxml` C parser.
+
+    The tree is walked once, collecting the links and the candidates for the main
+    content together.
+    """
+
+    def parse(self, html: bytes | str, url: str) -> ParsedPage:
+        try:
+            from lxml import html as lxml_html
+        except ImportError:
+            raise ImportError("`lxml` not installed")
+
+        if not html or not html.strip():
+            return ParsedPage(content="", links=[])
+        root = lxml_html.fromstring(html)
+
+        links: list[str] = []
+        candidates: dict[str, Any] = {}
+        for element in root.iter():
+            tag = element.tag
+            if not isinstance(tag, str):
+                # Comments and processing instructions
+                continue
+            if tag == "a":
+                href = element.get("href")
+                if href is not None:
+                    links.append(urljoin(url, href))
+            elif tag in MAIN_CONTENT_TAGS:
+                candidates.setdefault(tag, element)
+            class_names = element.get("class")
+            if class_names:
+                for class_name in class_names.split():
+                    if class_name in MAIN_CONTENT_CLASSES:
+                        candidates.setdefault(class_name, element)
+
+        for key in MAIN_CONTENT_TAGS + MAIN_CONTENT_CLASSES:
+            if key in candidates:
+                return ParsedPage(content=element_text(candidates[key]), links=links)
+        return ParsedPage(content="", links=links)
+
+
+class SelectolaxParser(HtmlParser):
+    """Parser using the `selectolax` bindings to the lexbor C parser"""
+
+    def parse(self, html: bytes | str, url: str) -> ParsedPage:
+        try:
+            from selectolax.lexbor import LexborHTMLParser
+        except ImportError:
+            raise ImportError("`selectolax` not installed")
+
+        tree = LexborHTMLParser(html)
+        links = [
+            urljoin(url, node.attributes["href"] or "") for node in tree.css("a[href]")
+        ]
+        for selector in MAIN_CONTENT_TAGS + [f".{c}" for c in MAIN_CONTENT_CLASSES]:
+            node = tree.css_first(selector)
+            if node is not None:
+                for skipped in node.css(", ".join(SKIPPED_TAGS)):
+                    skipped.decompose()
+                return ParsedPage(
+                    content=node.text(separator=" ", strip=True),
+                    links=links,
+                )
+        return ParsedPage(content="", links=links)
+
+
+def element_text(element: Any) -> str:
+    """Returns the stripped strings of an lxml element joined by a space.
+    The text of skipped elements is removed from the tree.
+    """
+    for skipped in list(element.iter(*SKIPPED_TAGS)):
+        skipped.text = None
+        del skipped[:]
+    return " ".join(
+        text for text in (string.strip() for string in element.itertext()) if text
+    )
+
+
+def get_html_parser() -> HtmlParser:
+    """Returns the fastest available parser: selectolax, lxml, else BeautifulSoup"""
+    if find_spec("selectolax") is not None:
+        return SelectolaxParser()
+    if find_spec("lxml") is not None:
+        return LxmlParser()
+    return BeautifulSoupParser()
@@ -0,0 +1,157 @@
+import json
+from pathlib import Path
+from time import time
+
+from pydantic import BaseModel
+from sqlalchemy.dialects import sqlite
+from sqlalchemy.engine import Engine, create_engine
+from sqlalchemy.inspection import inspect
+from sqlalchemy.pool import StaticPool
+from sqlalchemy.schema import Column, MetaData, Table
+from sqlalchemy.sql.expression import delete, func, select
+from sqlalchemy.types import Float, String, Text
+
+from pas.utils.log import logger
+
+
+class CachedPage(BaseModel):
+    """A page as it was last fetched, with the validators of its response"""
+
+    url: str
+    etag: str | None = None
+    last_modified: str | None = None
+    # Main content extracted from the page
+    content: str = ""
+    # Absolute URLs of the links found on the page
+    links: list[str] = []
+
+    @property
+    def validators(self) -> dict[str, str]:
+        """Returns the headers making a request conditional on the page changing"""
+        headers: dict[str, str] = {}
+        if self.etag is not None:
+            headers["If-None-Match"] = self.etag
+        if self.last_modified is not None:
+            headers["If-Modified-Since"] = self.last_modified
+        return headers
+
+
+class HttpCache:
+    def __init__(
+        self,
+        table_name: str = "http_cache",
+        db_url: str | None = None,
+        db_file: str | None = "tmp/http_cache.db",
+        db_engine: Engine | None = None,
+    ):
+        """
+        Persistent cache of crawled pages for conditional requests, using a sqlite database.
+
+        The ETag and Last-Modified headers of each page are stored with the content
+        and links extracted from it, so a page answered with 304 Not Modified is not
+        parsed again.
+
+        :param table_name: The name of the table to store pages.
+        :param db_url: The database URL to connect to.
+        :param db_file: The database file to connect to.
+        :param db_engine: The database engine to use.
+        """
+        _engine: Engine | None = db_engine
+        if _engine is None and db_url is not None:
+            _engine = create_engine(db_url)
+        elif _engine is None and db_file is not None:
+            Path(db_file).parent.mkdir(parents=True, exist_ok=True)
+            _engine = create_engine(f"sqlite:///{db_file}")
+        elif _engine is None:
+            # Share a single in-memory database between threads
+            _engine = create_engine(
+                "sqlite://",
+                poolclass=StaticPool,
+                connect_args={"check_same_thread": False},
+            )
+        self.db_engine: Engine = _engine
+
+        self.table_name: str = table_name
+        self.metadata: MetaData = MetaData()
+        self.table: Table = self.get_table()
+        self.create()
+
+    def get_table(self) -> Table:
+        return Table(
+            self.table_name,
+            self.metadata,
+            Column("url", String, primary_key=True),
+            Column("etag", String),
+            Column("last_modified", String),
+            Column("content", Text),
+            # Links as a JSON list
+            Column("links", Text),
+            # Timestamp of the last response with content
+            Column("fetched_at", Float),
+            extend_existing=True,
+        )
+
+    def table_exists(self) -> bool:
+        try:
+            return inspect(self.db_engine).has_table(self.table.name)
+        except Exception as e:
+            logger.error(e)
+            return False
+
+    def create(self) -> None:
+        if not self.table_exists():
+            logger.debug(f"Creating table: {self.table.name}")
+            self.table.create(self.db_engine)
+
+    def __len__(self) -> int:
+        with self.db_engine.connect() as conn:
+            return conn.execute(select(func.count()).select_from(self.table)).scalar()
+
+    def get(self, url: str) -> CachedPage | None:
+        stmt = select(
+            self.table.c.etag,
+            self.table.c.last_modified,
+            self.table.c.content,
+            self.table.c.links,
+        ).where(self.table.c.url == url)
+        with self.db_engine.connect() as conn:
+            row = conn.execute(stmt).first()
+        if row is None:
+            return None
+        return CachedPage(
+            url=url,
+            etag=row.etag,
+            last_modified=row.last_modified,
+            content=row.content or "",
+            links=json.loads(row.links or "[]"),
+        )
+
+    def set(self, page: CachedPage) -> None:
+        stmt = sqlite.insert(self.table).values(
+            url=page.url,
+            etag=page.etag,
+            last_modified=page.last_modified,
+            content=page.content,
+            links=json.dumps(page.links),
+            fetched_at=time(),
+        )
+        stmt = stmt.on_conflict_do_update(
+            index_elements=["url"],
+            set_=dict(
+                etag=stmt.excluded.etag,
+                last_modified=stmt.excluded.last_modified,
+                content=stmt.excluded.content,
+                links=stmt.excluded.links,
+                fetched_at=stmt.excluded.fetched_at,
+            ),
+        )
+        with self.db_engine.begin() as conn:
+            conn.execute(stmt)
+
+    def delete(self, url: str) -> None:
+        with self.db_engine.begin() as conn:
+            conn.execute(delete(self.table).where(self.table.c.url == url))
+
+    def clear(self) -> None:
+        with self.db_engine.begin() as conn:
+            conn.execute(delete(self.table))
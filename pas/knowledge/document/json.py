@@ -1,46 +1,206 @@
 import json
+import re
+from collections.abc import Iterator
+from itertools import islice
 from pathlib import Path
+from typing import Any, TextIO
 
 from pas.knowledge.document.base import Document
 from pas.knowledge.document.reader import Reader
 from pas.utils.log import logger
 
+DECODER = json.JSONDecoder()
+WHITESPACE = re.compile(r"[ \t\n\r]*")
+DELIMITERS = {" ", "\t", "\n", "\r", ",", "]"}
+
 
 class JSONReader(Reader):
-    """Reader for JSON files"""
+    """Reader for JSON and JSON Lines files.
+
+    Files are parsed incrementally, the elements of a top level array or the lines of a
+    `.jsonl` file are read one at a time, so memory use is bounded by the size of the
+    largest element rather than the size of the file.
+    """
 
     chunk: bool = False
+    # Fields of each element which make up the content, dotted for nested fields
+    # Defaults to the whole element as JSON
+    content_fields: list[str] | None = None
+    # Fields of each element added to the meta data of its documents
+    meta_data_fields: list[str] = []
+    # Number of elements per batch yielded by `iter_documents`
+    batch_size: int = 100
+    # Number of characters read from the file at a time
+    read_size: int = 1 << 20
 
     def read(self, path: Path) -> list[Document]:
+        return [
+            document
+            for documents in self.iter_documents(path)
+            for document in documents
+        ]
+
+    def iter_documents(self, path: Path) -> Iterator[list[Document]]:
+        """Read the file and yield its documents in batches of `batch_size` elements"""
         if not path:
             raise ValueError("No path provided")
 
         if not path.exists():
             raise FileNotFoundError(f"Could not find file: {path}")
 
-        try:
-            logger.info(f"Reading: {path}")
-            json_name = path.name.split(".")[0]
-            json_contents = json.loads(path.read_text("utf-8"))
-
-            if isinstance(json_contents, dict):
-                json_contents = [json_contents]
-
-            documents = [
-                Document(
-                    name=json_name,
-                    id=f"{json_name}_{page_number}",
-                    meta_data={"page": page_number},
-                    content=json.dumps(content),
-                )
-                for page_number, content in enumerate(json_contents, start=1)
-            ]
-            if self.chunk:
-                logger.debug("Chunking documents not yet supported for JSONReader")
-                # chunked_documents = []
-                # for document in documents:
-                #     chunked_documents.extend(self.chunk_document(document))
-                # return chunked_documents
-            return documents
-        except Exception:
-            raise
+        logger.info(f"Reading: {path}")
+        json_name = path.name.split(".")[0]
+        with path.open(encoding="utf-8") as f:
+            elements = (
+                iter_json_lines(f)
+                if path.suffix == ".jsonl"
+                else iter_json(f, self.read_size)
+            )
+            numbered_elements = enumerate(elements, start=1)
+            while batch := list(islice(numbered_elements, self.batch_size)):
+                documents: list[Document] = []
+                for page_number, element in batch:
+                    document = self.element_document(json_name, page_number, element)
+                    if self.chunk:
+                        documents.extend(self.iter_chunks(document))
+                    else:
+                        documents.append(document)
+                yield documents
+
+    def element_document(
+        self,
+        json_name: str,
+        page_number: int,
+        element: Any,
+    ) -> Document:
+        meta_data: dict[str, Any] = {"page": page_number}
+        if isinstance(element, dict):
+            for field in self.meta_data_fields:
+                value = get_field(element, field)
+                if value is not None:
+                    meta_data[field] = value
+
+        if self.content_fields is None or not isinstance(element, dict):
+            content = json.dumps(element)
+        elif len(self.content_fields) == 1:
+            content = field_text(get_field(element, self.content_fields[0]))
+        else:
+            # One line per field, fields without a value are left out
+            content = "\n".join(
+                f"{field}: {field_text(value)}"
+                for field in self.content_fields
+                if (value := get_field(element, field)) is not None
+            )
+
+        return Document(
+            name=json_name,
+            id=f"{json_name}_{page_number}",
+            meta_data=meta_data,
+            content=content,
+        )
+
+
+def get_field(element: dict[str, Any], field: str) -> Any:
+    """Returns the value of a field, nested fields are separated by dots"""
+    value: Any = element
+    for key in field.split("."):
+        if not isinstance(value, dict):
+            return None
+        value = value.get(key)
+    return value
+
+
+def field_text(value: Any) -> str:
+    if value is None:
+        return ""
+    return value if isinstance(value, str) else json.dumps(value)
+
+
+def iter_json_lines(f: TextIO) -> Iterator[Any]:
+    """Yield the value of each non empty line"""
+    for line in f:
+        if line.strip():
+            yield json.loads(line)
+
+
+def iter_json(f: TextIO, read_size: int = 1 << 20) -> Iterator[Any]:
+    """Yield the elements of a top level array one at a time, or the top level value.
+
+    The file is read in blocks of `read_size` characters. Elements are decoded from
+    the buffer, which is refilled when the next element is incomplete. An element
+    which fails to decode for any other reason raises `json.JSONDecodeError` at once.
+    """
+    buffer = ""
+    while more := f.read(read_size):
+        buffer = buffer[WHITESPACE.match(buffer).end() :] + more  # type: ignore
+        if buffer.strip(" \t\n\r"):
+            break
+    position = WHITESPACE.match(buffer).end()  # type: ignore
+    if position == len(buffer):
+        return
+    if buffer[position] != "[":
+        # Any other top level value is read whole
+        yield json.loads(buffer[position:] + f.read())
+        return
+
+    position += 1
+    eof = False
+    # Start of the array, after an element or after a comma
+    state = "start"
+    while True:
+        position = WHITESPACE.match(buffer, position).end()  # type: ignore
+        end: int | None = None
+        if position < len(buffer):
+            char = buffer[position]
+            if char == "]" and state != "comma":
+                return
+            if state == "element":
+                if char != ",":
+                    raise json.JSONDecodeError(
+                        "Expecting ',' delimiter", buffer, position
+                    )
+                position += 1
+                state = "comma"
+                continue
+            try:
+                element, end = DECODER.raw_decode(buffer, position)
+            except json.JSONDecodeError as error:
+                if eof or not truncated(error):
+                    raise
+            # A number cut at the end of the buffer, like "1." of "1.5", is decoded
+            # without error, so elements must be followed by a delimiter
+            if end is not None and (eof or buffer[end : end + 1] in DELIMITERS):
+                yield element
+                position = end
+                state = "element"
+                continue
+        elif eof:
+            raise json.JSONDecodeError("Unterminated JSON array", buffer, position)
+
+        # Read at least as much as is buffered, so that a large element is decoded
+        # a logarithmic number of times
+        more = f.read(max(read_size, len(buffer) - position))
+        buffer = buffer[position:] + more
+        position = 0
+        eof = len(more) == 0
+
+
+LITERALS = ("true", "false", "null", "NaN", "Infinity", "-Infinity")
+# The rest of a number cut after its integer or fraction part, like ".", "e" or "e-"
+NUMBER_TAIL = re.compile(r"[.eE][0-9eE+-]*")
+
+
+def truncated(error: json.JSONDecodeError) -> bool:
+    """Whether decoding failed only because the buffer ends inside the element"""
+    if error.pos >= len(error.doc) or error.msg.startswith("Unterminated string"):
+        return True
+    tail = error.doc[error.pos :]
+    # An escape, a number or a literal cut at the end of the buffer, like "\\u00",
+    # "1." or "tru"
+    if error.msg.startswith("Invalid \\uXXXX escape"):
+        return len(tail) <= len("uXXXX")
+    if NUMBER_TAIL.fullmatch(tail):
+        return True
+    return any(
+        len(tail) < len(literal) and literal.startswith(tail) for literal in LITERALS
+    )
@@ -1,6 +1,15 @@
+import sys
+from collections import OrderedDict, deque
+from collections.abc import Iterable, Iterator
+from concurrent.futures import Future, ProcessPoolExecutor
+from functools import lru_cache
+from hashlib import sha256
+from multiprocessing import get_context
 from pathlib import Path
 from typing import IO, Any
 
+from pydantic import PrivateAttr
+
 from pas.knowledge.document.base import Document
 from pas.knowledge.document.reader import Reader
 from pas.utils.log import logger
@@ -9,86 +18,293 @@ from pas.utils.log import logger
 class PDFReader(Reader):
     """Reader for PDF files"""
 
+    # Number of processes extracting text, 1 to extract in the current process
+    num_workers: int = 1
+    # Number of pages per task, pages of larger files are extracted in parallel
+    pages_per_task: int = 100
+    # Maximum number of files whose first task is waiting to be read, bounds the
+    # memory used by extracted text. Defaults to 2 * num_workers.
+    max_pending_tasks: int | None = None
+    # Number of tasks after which a worker process is replaced, to release its memory.
+    # Requires Python 3.11, ignored with a warning on older versions.
+    max_tasks_per_child: int | None = None
+
+    _executor: ProcessPoolExecutor | None = PrivateAttr(default=None)
+
     def read(self, pdf: str | Path | IO[Any]) -> list[Document]:
         if not pdf:
             raise ValueError("No pdf provided")
 
+        doc_name = pdf_name(pdf)
+        logger.info(f"Reading: {doc_name}")
+        # The first task is read in the current process, the remaining pages of
+        # larger files by the worker processes, which can only open paths
+        end = (
+            self.task_pages
+            if self.num_workers > 1 and isinstance(pdf, str | Path)
+            else None
+        )
+        documents, num_pages = read_pages(self, pdf, doc_name, 0, end)
+        if end is None or num_pages <= end:
+            return documents
+
+        futures = self._submit_pages(pdf, doc_name, num_pages)
         try:
-            from pypdf import PdfReader as DocumentReader
-        except ImportError:
-            raise ImportError("`pypdf` not installed")
+            for future in futures:
+                documents.extend(future.result()[0])
+        finally:
+            for future in futures:
+                future.cancel()
+        return documents
+
+    def read_many(
+        self,
+        pdfs: Iterable[str | Path],
+    ) -> Iterator[list[Document] | None]:
+        """Read PDF files in a pool of `num_workers` processes.
+
+        Files are split into tasks of `pages_per_task` pages, so both small and large
+        files are read in parallel. The first task of a file also counts its pages,
+        the tasks of its remaining pages are submitted once it is done, so files are
+        only parsed by the worker processes. The documents of each file are yielded
+        in order, as soon as all pages of the file are read. Files which cannot be
+        read are logged and yield None.
+        """
+        if self.num_workers <= 1:
+            for pdf in pdfs:
+                try:
+                    yield self.read(pdf)
+                except Exception as e:
+                    logger.error(f"Error reading: {pdf}: {e}")
+                    yield None
+            return
 
-        doc_name = ""
+        max_pending_tasks = self.max_pending_tasks or 2 * self.num_workers
+        # First task of each file, in the order the files are yielded
+        pending: deque[tuple[str | Path, str, Future | None]] = deque()
         try:
-            if isinstance(pdf, str):
-                doc_name = pdf.split("/")[-1].split(".")[0].replace(" ", "_")
-            else:
-                doc_name = pdf.name.split(".")[0]
-        except Exception:
-            doc_name = "pdf"
+            for pdf in pdfs:
+                doc_name = pdf_name(pdf)
+                logger.info(f"Reading: {doc_name}")
+                try:
+                    future = self.executor.submit(
+                        read_pages,
+                        self._chunk_reader(),
+                        pdf,
+                        doc_name,
+                        0,
+                        self.task_pages,
+                    )
+                except Exception as e:
+                    logger.error(f"Error reading: {pdf}: {e}")
+                    future = None
+                pending.append((pdf, doc_name, future))
 
-        logger.info(f"Reading: {doc_name}")
-        doc_reader = DocumentReader(pdf)
+                while len(pending) > max_pending_tasks:
+                    yield self._collect(*pending.popleft())
 
-        documents = [
-            Document(
-                name=doc_name,
-                id=f"{doc_name}_{page_number}",
-                meta_data={"page": page_number},
-                content=page.extract_text(),
+            while pending:
+                yield self._collect(*pending.popleft())
+        finally:
+            # Tasks of files which are not read, if the caller stops early
+            for _, _, future in pending:
+                if future is not None:
+                    future.cancel()
+
+    @property
+    def executor(self) -> ProcessPoolExecutor:
+        """Pool of reading processes, kept between reads so they start once"""
+        if self._executor is None:
+            executor_kwargs: dict[str, Any] = {}
+            if self.max_tasks_per_child is not None:
+                if sys.version_info >= (3, 11):
+                    executor_kwargs["max_tasks_per_child"] = self.max_tasks_per_child
+                else:
+                    logger.warning(
+                        "max_tasks_per_child requires Python 3.11, "
+                        "worker processes are not replaced",
+                    )
+            # Workers are spawned rather than forked, files may be read from a thread
+            # of the loading pipeline while other threads hold locks
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.num_workers,
+                mp_context=get_context("spawn"),
+                **executor_kwargs,
             )
-            for page_number, page in enumerate(doc_reader.pages, start=1)
+        return self._executor
+
+    def close(self) -> None:
+        """Shut down the reading processes"""
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+    @property
+    def task_pages(self) -> int:
+        """Number of pages read per task"""
+        return max(1, self.pages_per_task)
+
+    def page_ranges(self, num_pages: int) -> list[tuple[int, int]]:
+        """Returns the page ranges of a file of `num_pages` pages, one per task"""
+        return [
+            (start, min(start + self.task_pages, num_pages))
+            for start in range(0, num_pages, self.task_pages)
         ]
-        if self.chunk:
-            chunked_documents = []
-            for document in documents:
-                chunked_documents.extend(self.chunk_document(document))
-            return chunked_documents
+
+    def _chunk_reader(self) -> Reader:
+        # Workers only need the chunking settings, the reader holds the pool
+        return Reader.model_construct(
+            **{name: getattr(self, name) for name in Reader.model_fields},
+        )
+
+    def _submit_pages(
+        self,
+        pdf: str | Path,
+        doc_name: str,
+        num_pages: int,
+    ) -> list[Future]:
+        """Submit the tasks reading the pages after the first task of a file"""
+        chunk_reader = self._chunk_reader()
+        return [
+            self.executor.submit(read_pages, chunk_reader, pdf, doc_name, start, end)
+            for start, end in self.page_ranges(num_pages)[1:]
+        ]
+
+    def _collect(
+        self,
+        pdf: str | Path,
+        doc_name: str,
+        first_task: Future | None,
+    ) -> list[Document] | None:
+        if first_task is None:
+            return None
+        futures: list[Future] = []
+        try:
+            documents, num_pages = first_task.result()
+            futures = self._submit_pages(pdf, doc_name, num_pages)
+            for future in futures:
+                documents.extend(future.result()[0])
+        except Exception as e:
+            logger.error(f"Error reading: {pdf}: {e}")
+            return None
+        finally:
+            for future in futures:
+                future.cancel()
         return documents
 
 
+def pdf_name(pdf: str | Path | IO[Any]) -> str:
+    """Returns the name of a PDF, used to name its documents"""
+    try:
+        if isinstance(pdf, str):
+            return pdf.split("/")[-1].split(".")[0].replace(" ", "_")
+        return pdf.name.split(".")[0]
+    except Exception:
+        return "pdf"
+
+
+def read_pages(
+    reader: Reader,
+    pdf: str | Path | IO[Any],
+    doc_name: str,
+    start: int = 0,
+    end: int | None = None,
+) -> tuple[list[Document], int]:
+    """Extract the text of pages `start` to `end` of a PDF as documents.
+    Returns the documents and the number of pages of the PDF.
+    Defined at module level so it can run in worker processes.
+    """
+    try:
+        from pypdf import PdfReader as DocumentReader
+    except ImportError:
+        raise ImportError("`pypdf` not installed")
+
+    doc_reader = DocumentReader(pdf)
+    pages = doc_reader.pages[start:end]
+    documents = [
+        # Page text is always a string, so validation is skipped
+        Document.model_construct(
+            name=doc_name,
+            id=f"{doc_name}_{page_number}",
+            meta_data={"page": page_number},
+            content=page.extract_text(),
+        )
+        for page_number, page in enumerate(pages, start=start + 1)
+    ]
+    num_pages = len(doc_reader.pages)
+    if reader.chunk:
+        documents = [
+            chunk for document in documents for chunk in reader.iter_chunks(document)
+        ]
+    return documents, num_pages
+
+
 class PDFImageReader(Reader):
     """Reader for PDF files with text and images extraction"""
 
+    # Images narrower or shorter than this number of pixels are skipped, e.g. rules
+    min_image_size: int = 32
+    # Number of processes running OCR, 1 to run OCR in the current process
+    num_workers: int = 1
+    # Number of images sent to a worker process at a time
+    ocr_batch_size: int = 16
+    # Maximum number of OCR results cached by image content hash
+    ocr_cache_size: int = 10_000
+
+    _ocr_cache: OrderedDict[str, str] = PrivateAttr(default_factory=OrderedDict)
+    _executor: ProcessPoolExecutor | None = PrivateAttr(default=None)
+
     def read(self, pdf: str | Path | IO[Any]) -> list[Document]:
         if not pdf:
             raise ValueError("No pdf provided")
 
         try:
-            import rapidocr_onnxruntime as rapidocr
             from pypdf import PdfReader as DocumentReader
         except ImportError:
-            raise ImportError("`pypdf` or `rapidocr_onnxruntime` not installed")
-
-        doc_name = ""
-        try:
-            if isinstance(pdf, str):
-                doc_name = pdf.split("/")[-1].split(".")[0].replace(" ", "_")
-            else:
-                doc_name = pdf.name.split(".")[0]
-        except Exception:
-            doc_name = "pdf"
+            raise ImportError("`pypdf` not installed")
 
+        doc_name = pdf_name(pdf)
         logger.info(f"Reading: {doc_name}")
         doc_reader = DocumentReader(pdf)
 
-        # Initialize RapidOCR
-        ocr = rapidocr.RapidOCR()
-
-        documents = []
-        for page_number, page in enumerate(doc_reader.pages, start=1):
-            page_text = page.extract_text() or ""
-            images_text_list: list = []
-
+        # Text and image hashes of each page, and the images which are not cached
+        pages: list[tuple[str, list[str]]] = []
+        image_texts: dict[str, str] = {}
+        images_to_read: dict[str, bytes] = {}
+        num_skipped = 0
+        for page in doc_reader.pages:
+            image_hashes: list[str] = []
             for image_object in page.images:
-                image_data = image_object.data
+                if self._is_small(image_object):
+                    num_skipped += 1
+                    continue
+                image_hash = sha256(image_object.data).hexdigest()
+                image_hashes.append(image_hash)
+                if image_hash in image_texts or image_hash in images_to_read:
+                    continue
+                cached_text = self._ocr_cache.get(image_hash)
+                if cached_text is not None:
+                    self._ocr_cache.move_to_end(image_hash)
+                    image_texts[image_hash] = cached_text
+                else:
+                    images_to_read[image_hash] = image_object.data
+            pages.append((page.extract_text() or "", image_hashes))
 
-                # Perform OCR on the image
-                ocr_result, elapse = ocr(image_data)
+        logger.debug(
+            f"Running OCR on {len(images_to_read)} images, {len(image_texts)} cached, "
+            f"{num_skipped} skipped",
+        )
+        image_texts.update(self.read_images(images_to_read))
 
-                # Extract text from OCR result
-                if ocr_result:
-                    images_text_list += [item[1] for item in ocr_result]
+        documents = []
+        # Repeated images, e.g. logos and headers, are only added to their first page
+        added_images: set[str] = set()
+        for page_number, (page_text, image_hashes) in enumerate(pages, start=1):
+            images_text_list: list[str] = []
+            for image_hash in image_hashes:
+                if image_hash not in added_images and image_texts[image_hash]:
+                    images_text_list.append(image_texts[image_hash])
+                added_images.add(image_hash)
 
             images_text: str = "\n".join(images_text_list)
             content = page_text + "\n" + images_text
@@ -109,3 +325,73 @@ class PDFImageReader(Reader):
             return chunked_documents
 
         return documents
+
+    def read_images(self, images: dict[str, bytes]) -> dict[str, str]:
+        """Run OCR on images by content hash, returns and caches their text"""
+        if len(images) == 0:
+            return {}
+
+        data = list(images.values())
+        if self.num_workers > 1 and len(data) > self.ocr_batch_size:
+            batches = [
+                data[start : start + self.ocr_batch_size]
+                for start in range(0, len(data), self.ocr_batch_size)
+            ]
+            texts = [
+                text
+                for batch_texts in self.executor.map(ocr_images, batches)
+                for text in batch_texts
+            ]
+        else:
+            texts = ocr_images(data)
+
+        image_texts = dict(zip(images, texts, strict=True))
+        self._ocr_cache.update(image_texts)
+        while len(self._ocr_cache) > self.ocr_cache_size:
+            self._ocr_cache.popitem(last=False)
+        return image_texts
+
+    @property
+    def executor(self) -> ProcessPoolExecutor:
+        """Pool of OCR processes, kept between reads so models are loaded once"""
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.num_workers,
+                mp_context=get_context("spawn"),
+            )
+        return self._executor
+
+    def close(self) -> None:
+        """Shut down the OCR processes"""
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+    def _is_small(self, image_object: Any) -> bool:
+        image = getattr(image_object, "image", None)
+        if image is None:
+            return False
+        return min(image.size) < self.min_image_size
+
+
+@lru_cache(maxsize=1)
+def get_ocr() -> Any:
+    """Returns the OCR engine of the current process, loading its models once"""
+    try:
+        import rapidocr_onnxruntime as rapidocr
+    except ImportError:
+        raise ImportError("`rapidocr_onnxruntime` not installed")
+
+    return rapidocr.RapidOCR()
+
+
+def ocr_images(images: list[bytes]) -> list[str]:
+    """Returns the text found in each image.
+    Defined at module level so it can run in worker processes.
+    """
+    ocr = get_ocr()
+    texts: list[str] = []
+    for image in images:
+        ocr_result, _ = ocr(image)
+        texts.append("\n".join(item[1] for item in ocr_result) if ocr_result else "")
+    return texts
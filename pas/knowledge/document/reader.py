@@ -1,69 +1,65 @@
-from typing import Any
+import re
+from collections import deque
+from collections.abc import Iterable, Iterator
+from itertools import islice
+from typing import Any, Literal, NamedTuple
 
 from pydantic import BaseModel
 
 from pas.knowledge.document.base import Document
+from pas.knowledge.document.tokenizer import Tokenizer
+from pas.utils.log import logger
+
+WHITESPACE = re.compile(r"\s+")
 
 
 class Reader(BaseModel):
     chunk: bool = True
+    # Maximum size of a chunk, in characters or estimated tokens, see `chunk_unit`
     chunk_size: int = 3000
-    separators: list[str] = ["\n", "\n\n", "\r", "\r\n", "\n\r", "\t", " ", "  "]
+    # Size of the text repeated from the end of a chunk at the start of the next one
+    chunk_overlap: int = 0
+    # Unit of `chunk_size` and `chunk_overlap`
+    # Tokens are estimated as 1 token per 4 characters, unless a tokenizer is set
+    chunk_unit: Literal["characters", "tokens"] = "characters"
+    # Tokenizer counting the tokens of chunks, sizes are in tokens if it is set
+    tokenizer: Tokenizer | None = None
+    # Separators to end chunks at, from the most to the least preferred
+    separators: list[str] = ["\n\n", "\r\n", "\n", "\r", "\t", " "]
 
     def read(self, obj: Any) -> list[Document]:
         raise NotImplementedError
 
+    def read_many(self, objs: Iterable[Any]) -> Iterator[list[Document] | None]:
+        """Read several sources, yielding the documents of each source in order.
+        Sources which cannot be read are logged and yield None.
+        Readers which can read sources concurrently should override this method.
+        """
+        for obj in objs:
+            try:
+                yield self.read_source(obj)
+            except Exception as e:
+                logger.error(f"Error reading: {obj}: {e}")
+                yield None
+
+    def read_source(self, obj: Any) -> list[Document]:
+        """Read a source, raising errors instead of returning no documents.
+        Readers whose `read` logs errors should override this method.
+        """
+        return self.read(obj)
+
     def clean_text(self, text: str) -> str:
-        """Clean the text by replacing multiple newlines with a single newline"""
-        import re
-
-        # Replace multiple newlines with a single newline
-        cleaned_text = re.sub(r"\n+", "\n", text)
-        # Replace multiple spaces with a single space
-        cleaned_text = re.sub(r"\s+", " ", cleaned_text)
-        # Replace multiple tabs with a single tab
-        cleaned_text = re.sub(r"\t+", "\t", cleaned_text)
-        # Replace multiple carriage returns with a single carriage return
-        cleaned_text = re.sub(r"\r+", "\r", cleaned_text)
-        # Replace multiple form feeds with a single form feed
-        cleaned_text = re.sub(r"\f+", "\f", cleaned_text)
-        # Replace multiple vertical tabs with a single vertical tab
-        cleaned_text = re.sub(r"\v+", "\v", cleaned_text)
-
-        return cleaned_text
+        """Clean the text by replacing runs of whitespace with a single space"""
+        return WHITESPACE.sub(" ", text)
 
     def chunk_document(self, document: Document) -> list[Document]:
         """Chunk the document content into smaller documents"""
-        content = document.content
-        cleaned_content = self.clean_text(content)
-        content_length = len(cleaned_content)
-        chunked_documents: list[Document] = []
-        chunk_number = 1
-        chunk_meta_data = document.meta_data
+        return list(self.iter_chunks(document))
 
-        start = 0
-        while start < content_length:
-            end = start + self.chunk_size
-
-            # Ensure we're not splitting a word in half
-            if end < content_length:
-                while end > start and cleaned_content[end] not in [
-                    " ",
-                    "\n",
-                    "\r",
-                    "\t",
-                ]:
-                    end -= 1
-
-            # If the entire chunk is a word, then just split it at self.chunk_size
-            if end == start:
-                end = start + self.chunk_size
-
-            # If the end is greater than the content length, then set it to the content length
-            if end > content_length:
-                end = content_length
-
-            chunk = cleaned_content[start:end]
+    def iter_chunks(self, document: Document) -> Iterator[Document]:
+        """Yield the chunks of the document content as documents, one at a time"""
+        chunk_meta_data = document.meta_data
+        for chunk_number, chunk in enumerate(self.split_text(document.content), 1):
             meta_data = chunk_meta_data.copy()
             meta_data["chunk"] = chunk_number
             chunk_id = None
@@ -72,14 +68,213 @@ class Reader(BaseModel):
             elif document.name:
                 chunk_id = f"{document.name}_{chunk_number}"
             meta_data["chunk_size"] = len(chunk)
-            chunked_documents.append(
-                Document(
-                    id=chunk_id,
-                    name=document.name,
-                    meta_data=meta_data,
-                    content=chunk,
-                ),
+            # Chunks are built from a validated document, so validation is skipped
+            yield Document.model_construct(
+                id=chunk_id,
+                name=document.name,
+                meta_data=meta_data,
+                content=chunk,
+            )
+
+    def split_text(self, text: str) -> Iterator[str]:
+        """Split the text into cleaned chunks of at most `chunk_size`.
+
+        The text is scanned once. Each chunk ends after the most preferred separator
+        found in the second half of the chunk, else after any separator, or is cut at
+        `chunk_size` if there is none. With `chunk_overlap`, the next chunk starts
+        with the last whole words within `chunk_overlap` of the end of the chunk.
+        """
+        if self.tokenizer is not None:
+            yield from self._split_tokens(text, self.tokenizer)
+            return
+
+        scale = 4 if self.chunk_unit == "tokens" else 1
+        max_length = max(1, self.chunk_size * scale)
+        overlap = min(self.chunk_overlap * scale, max_length - 1)
+        for start, end in self._spans(text, max_length, overlap):
+            chunk = self.clean_text(text[start:end]).strip()
+            if chunk:
+                yield chunk
+
+    def _split_tokens(self, text: str, tokenizer: Tokenizer) -> Iterator[str]:
+        """Split the text into chunks of at most `chunk_size` tokens.
+
+        The text is split at separators into pieces, which are tokenized in batches
+        and packed into chunks. Pieces longer than a chunk are cut into pieces of
+        tokens. The last pieces within `chunk_overlap` tokens of the end of a chunk
+        start the next one.
+        """
+        max_tokens = max(1, self.chunk_size)
+        overlap = min(self.chunk_overlap, max_tokens - 1)
+        # Pieces of about `chunk_overlap` tokens, estimated as 4 characters per token
+        piece_tokens = overlap or max(1, max_tokens // 4)
+
+        pieces: deque[TokenPiece] = deque()
+        num_tokens = 0
+        for piece in self._token_pieces(text, tokenizer, max_tokens, piece_tokens):
+            if pieces and num_tokens + piece.num_tokens > max_tokens:
+                yield self._join_pieces(text, pieces, tokenizer)
+                # Keep the last pieces as overlap, starting at a word boundary
+                while pieces and (
+                    num_tokens > overlap
+                    or num_tokens + piece.num_tokens > max_tokens
+                    or not pieces[0].word_start
+                ):
+                    num_tokens -= pieces.popleft().num_tokens
+            pieces.append(piece)
+            num_tokens += piece.num_tokens
+
+        if pieces:
+            chunk = self._join_pieces(text, pieces, tokenizer)
+            if chunk:
+                yield chunk
+
+    def _token_pieces(
+        self,
+        text: str,
+        tokenizer: Tokenizer,
+        max_tokens: int,
+        piece_tokens: int,
+        spans: Iterator[tuple[int, int]] | None = None,
+    ) -> Iterator["TokenPiece"]:
+        """Yield the pieces of the text with their number of tokens"""
+        if spans is None:
+            spans = self._spans(text, 4 * piece_tokens, 0)
+        while batch := list(islice(spans, tokenizer.batch_size)):
+            batch_tokens = tokenizer.encode_batch(
+                [self.clean_text(text[start:end]) for start, end in batch],
             )
-            chunk_number += 1
-            start = end
-        return chunked_documents
+            for (start, end), tokens in zip(batch, batch_tokens, strict=True):
+                if len(tokens) <= max_tokens:
+                    word_start = start == 0 or text[start - 1].isspace()
+                    yield TokenPiece(start, end, len(tokens), word_start)
+                    continue
+                piece = text[start:end].rstrip()
+                if WHITESPACE.search(piece) is not None:
+                    # Pieces with separators are split again at separators
+                    yield from self._token_pieces(
+                        text,
+                        tokenizer,
+                        max_tokens,
+                        piece_tokens,
+                        (
+                            (start + piece_start, start + piece_end)
+                            for piece_start, piece_end in self._spans(
+                                piece,
+                                max(1, len(piece) // 2),
+                                0,
+                            )
+                        ),
+                    )
+                    continue
+                # Pieces without separators are cut by tokens, like text without
+                # whitespace is cut by characters, and may be overlapped mid-word
+                for token_start in range(0, len(tokens), piece_tokens):
+                    cut_tokens = tokens[token_start : token_start + piece_tokens]
+                    yield TokenPiece(start, end, len(cut_tokens), True, cut_tokens)
+
+    def _join_pieces(
+        self,
+        text: str,
+        pieces: Iterable["TokenPiece"],
+        tokenizer: Tokenizer,
+    ) -> str:
+        """Returns the cleaned text of consecutive pieces"""
+        parts: list[str] = []
+        position: int | None = None
+        tokens: list[int] = []
+        for piece in pieces:
+            if piece.tokens is not None and position == piece.end and tokens:
+                # Pieces of tokens of the same text are decoded together
+                tokens.extend(piece.tokens)
+                continue
+            if tokens:
+                parts.append(tokenizer.decode(tokens))
+                tokens = []
+            if position is not None:
+                # Whitespace between pieces
+                parts.append(text[position : piece.start])
+            if piece.tokens is not None:
+                tokens = list(piece.tokens)
+            else:
+                parts.append(text[piece.start : piece.end])
+            position = piece.end
+        if tokens:
+            parts.append(tokenizer.decode(tokens))
+        return self.clean_text("".join(parts)).strip()
+
+    def _spans(
+        self, text: str, max_length: int, overlap: int
+    ) -> Iterator[tuple[int, int]]:
+        """Yield the start and end of chunks of at most `max_length` characters"""
+        text_length = len(text)
+        start = 0
+        previous_end = 0
+        while start < text_length:
+            # Chunks start at a word, not at the whitespace after a cut
+            start = self._skip_whitespace(text, start)
+            end = self._chunk_end(text, start, max_length)
+            if end <= previous_end:
+                # The overlap leaves no room for new text, start after it instead
+                start = self._skip_whitespace(text, previous_end)
+                end = self._chunk_end(text, start, max_length)
+            if start >= text_length:
+                break
+            yield start, end
+            if end >= text_length:
+                break
+
+            previous_end = end
+            start = self._overlap_start(text, start, end, overlap) if overlap else end
+
+    def _skip_whitespace(self, text: str, position: int) -> int:
+        match = WHITESPACE.match(text, position)
+        return match.end() if match is not None else position
+
+    def _chunk_end(self, text: str, start: int, max_length: int) -> int:
+        end = min(start + max_length, len(text))
+        if end < len(text):
+            end = self._split_point(text, start, end)
+        return end
+
+    def _overlap_start(self, text: str, start: int, end: int, overlap: int) -> int:
+        """Returns the start of the chunk after `start`-`end`: the first whole word
+        within `overlap` characters of the end of its content, or `end` if there is
+        none. The next chunk always starts after `start`.
+        """
+        if WHITESPACE.search(text, start, end) is None:
+            # Text without whitespace cut at `chunk_size` is overlapped mid-word
+            if end < len(text) and not text[end].isspace():
+                return max(end - overlap, start + 1)
+            return end
+        # The overlap is measured from the last word, not from a trailing separator
+        content_end = end
+        while text[content_end - 1].isspace():
+            content_end -= 1
+        overlap_start = max(content_end - overlap, start + 1)
+        # Words start after whitespace, the search starts one character earlier in
+        # case a word starts at `overlap_start`
+        match = WHITESPACE.search(text, overlap_start - 1, content_end)
+        return match.end() if match is not None else end
+
+    def _split_point(self, text: str, start: int, end: int) -> int:
+        """Returns the end of a chunk after the most preferred separator"""
+        # Prefer separators in the second half to avoid small chunks
+        for min_end in (start + (end - start) // 2, start + 1):
+            for separator in self.separators:
+                position = text.rfind(separator, min_end, end)
+                if position != -1:
+                    return position + len(separator)
+        return end
+
+
+class TokenPiece(NamedTuple):
+    """Piece of text packed into chunks by `Reader._split_tokens`"""
+
+    start: int
+    end: int
+    num_tokens: int
+    # True if the overlap of a chunk can start with this piece
+    word_start: bool
+    # Tokens of the piece if it was cut from a longer piece, else the whole text
+    tokens: list[int] | None = None
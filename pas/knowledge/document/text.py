@@ -16,27 +16,27 @@ class TextReader(Reader):
             raise FileNotFoundError(f"Could not find file: {path}")
 
         try:
-            logger.info(f"Reading: {path}")
-            file_name = (
-                path.name.split("/")[-1]
-                .split(".")[0]
-                .replace("/", "_")
-                .replace(" ", "_")
-            )
-            file_contents = path.read_text()
-            documents = [
-                Document(
-                    name=file_name,
-                    id=file_name,
-                    content=file_contents,
-                ),
-            ]
-            if self.chunk:
-                chunked_documents = []
-                for document in documents:
-                    chunked_documents.extend(self.chunk_document(document))
-                return chunked_documents
-            return documents
+            return self.read_source(path)
         except Exception as e:
             logger.error(f"Error reading: {path}: {e}")
         return []
+
+    def read_source(self, path: Path) -> list[Document]:
+        logger.info(f"Reading: {path}")
+        file_name = (
+            path.name.split("/")[-1].split(".")[0].replace("/", "_").replace(" ", "_")
+        )
+        file_contents = path.read_text()
+        documents = [
+            Document(
+                name=file_name,
+                id=file_name,
+                content=file_contents,
+            ),
+        ]
+        if self.chunk:
+            chunked_documents = []
+            for document in documents:
+                chunked_documents.extend(self.chunk_document(document))
+            return chunked_documents
+        return documents
@@ -0,0 +1,64 @@
+from typing import Any
+
+from pydantic import BaseModel, ConfigDict
+
+
+class Tokenizer(BaseModel):
+    """Base class for tokenizers used to size chunks in tokens"""
+
+    # Number of texts tokenized per call to `encode_batch` when chunking
+    batch_size: int = 256
+
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    def encode(self, text: str) -> list[int]:
+        raise NotImplementedError
+
+    def decode(self, tokens: list[int]) -> str:
+        raise NotImplementedError
+
+    def encode_batch(self, texts: list[str]) -> list[list[int]]:
+        """Tokenize a list of texts.
+        Tokenizers with a parallel batch implementation should override this method.
+        """
+        return [self.encode(text) for text in texts]
+
+    def count_tokens(self, text: str) -> int:
+        return len(self.encode(text))
+
+
+class TiktokenTokenizer(Tokenizer):
+    """Local BPE tokenizer using `tiktoken`.
+
+    The vocabulary is downloaded once and cached by tiktoken, in TIKTOKEN_CACHE_DIR if
+    it is set. Batches are tokenized in `num_threads` threads, outside of the GIL.
+    """
+
+    encoding_name: str = "cl100k_base"
+    num_threads: int = 8
+    # Encoding to use instead of loading `encoding_name`, e.g. built from a local file
+    tiktoken_encoding: Any | None = None
+
+    @property
+    def encoding(self) -> Any:
+        if self.tiktoken_encoding is not None:
+            return self.tiktoken_encoding
+
+        try:
+            import tiktoken
+        except ImportError:
+            raise ImportError("`tiktoken` not installed")
+
+        # tiktoken keeps loaded encodings, so the vocabulary is read once per process
+        self.tiktoken_encoding = tiktoken.get_encoding(self.encoding_name)
+        return self.tiktoken_encoding
+
+    def encode(self, text: str) -> list[int]:
+        # Special tokens in documents are encoded as plain text
+        return self.encoding.encode_ordinary(text)
+
+    def decode(self, tokens: list[int]) -> str:
+        return self.encoding.decode(tokens)
+
+    def encode_batch(self, texts: list[str]) -> list[list[int]]:
+        return self.encoding.encode_ordinary_batch(texts, num_threads=self.num_threads)
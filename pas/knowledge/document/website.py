@@ -1,20 +1,47 @@
+import asyncio
 import random
-import time
-from urllib.parse import urljoin, urlparse
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from time import monotonic
+from typing import Any
+from urllib.parse import urlparse
 
 import httpx
+from pydantic import ConfigDict
 
 from pas.knowledge.document.base import Document
+from pas.knowledge.document.html import HtmlParser, get_html_parser
+from pas.knowledge.document.http_cache import CachedPage, HttpCache
 from pas.knowledge.document.reader import Reader
 from pas.utils.log import logger
 
-try:
-    from bs4 import BeautifulSoup
-except ImportError:
-    from pas.const import DEPENDENCY_GROUP_WEBTOOLS, IMPORT_ERROR
 
-    logger.error(IMPORT_ERROR("bs4", DEPENDENCY_GROUP_WEBTOOLS))
-    raise
+class HostThrottle:
+    def __init__(self, max_concurrency: int, min_delay: float, max_delay: float):
+        """
+        Limits the concurrent requests to a host and spaces them by a random delay.
+
+        :param max_concurrency: The maximum number of requests in flight to the host.
+        :param min_delay: Minimum number of seconds between the requests to the host.
+        :param max_delay: Maximum number of seconds between the requests to the host.
+        """
+        self.semaphore = asyncio.Semaphore(max_concurrency)
+        self.min_delay: float = min_delay
+        self.max_delay: float = max_delay
+
+        self._next_request: float = 0.0
+        self._lock = asyncio.Lock()
+
+    async def wait(self) -> None:
+        """Wait until the next request to the host is allowed"""
+        async with self._lock:
+            delay = self._next_request - monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            self._next_request = monotonic() + random.uniform(
+                self.min_delay,
+                self.max_delay,
+            )
 
 
 class WebsiteReader(Reader):
@@ -22,19 +49,23 @@ class WebsiteReader(Reader):
 
     max_depth: int = 3
     max_links: int = 10
+    # Maximum number of requests in flight
+    max_concurrency: int = 10
+    # Maximum number of requests in flight to a single host
+    max_concurrency_per_host: int = 2
+    # Random delay in seconds between the requests to a host
+    min_delay: float = 0.1
+    max_delay: float = 0.5
+    timeout: float = 10
+    # Parameters passed to the httpx.AsyncClient
+    client_params: dict[str, Any] | None = None
+    # Cache of crawled pages, pages are requested conditionally if they are cached
+    http_cache: HttpCache | None = None
+    # Parser extracting the main content and links of pages
+    # Defaults to the fastest installed parser, see `get_html_parser`
+    html_parser: HtmlParser | None = None
 
-    _visited: set[str] = set()
-    _urls_to_crawl: list[tuple[str, int]] = []
-
-    def delay(self, min_seconds=1, max_seconds=3):
-        """
-        Introduce a random delay.
-
-        :param min_seconds: Minimum number of seconds to delay. Default is 1.
-        :param max_seconds: Maximum number of seconds to delay. Default is 3.
-        """
-        sleep_time = random.uniform(min_seconds, max_seconds)
-        time.sleep(sleep_time)
+    model_config = ConfigDict(arbitrary_types_allowed=True)
 
     def _get_primary_domain(self, url: str) -> str:
         """
@@ -47,27 +78,13 @@ class WebsiteReader(Reader):
         # Return primary domain (excluding subdomains)
         return ".".join(domain_parts[-2:])
 
-    def _extract_main_content(self, soup: BeautifulSoup) -> str:
-        """
-        Extracts the main content from a BeautifulSoup object.
-
-        :param soup: The BeautifulSoup object to extract the main content from.
-        :return: The main content.
-        """
-        # Try to find main content by specific tags or class names
-        for tag in ["article", "main"]:
-            element = soup.find(tag)
-            if element:
-                return element.get_text(strip=True, separator=" ")
-
-        for class_name in ["content", "main-content", "post-content"]:
-            element = soup.find(class_=class_name)
-            if element:
-                return element.get_text(strip=True, separator=" ")
-
-        return ""
-
-    def crawl(self, url: str, starting_depth: int = 1) -> dict[str, str]:
+    def crawl(
+        self,
+        url: str,
+        starting_depth: int = 1,
+        skip_unchanged: bool = False,
+        cache_pages: list[CachedPage] | None = None,
+    ) -> dict[str, str]:
         """
         Crawls a website and returns a dictionary of URLs and their corresponding content.
 
@@ -83,64 +100,181 @@ class WebsiteReader(Reader):
         The function focuses on extracting the main content by prioritizing content inside common HTML tags
         like `<article>`, `<main>`, and `<div>` with class names such as "content", "main-content", etc.
         The crawler will also respect the `max_depth` attribute of the WebCrawler class, ensuring it does not
-        crawl deeper than the specified depth.
+        crawl deeper than the specified depth. See `acrawl`.
+        """
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            return asyncio.run(
+                self.acrawl(url, starting_depth, skip_unchanged, cache_pages),
+            )
+
+        # Called from an event loop, the crawl runs in its own loop in a thread
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            return executor.submit(
+                asyncio.run,
+                self.acrawl(url, starting_depth, skip_unchanged, cache_pages),
+            ).result()
+
+    async def acrawl(
+        self,
+        url: str,
+        starting_depth: int = 1,
+        skip_unchanged: bool = False,
+        cache_pages: list[CachedPage] | None = None,
+    ) -> dict[str, str]:
+        """
+        Crawls a website concurrently and returns a dictionary of URLs and their content.
+
+        Pages are fetched breadth first with a shared connection pool, with at most
+        `max_concurrency` requests in flight, `max_concurrency_per_host` per host, and
+        a random delay between `min_delay` and `max_delay` seconds between the requests
+        to a host. The state of the crawl is local to each call.
+
+        With an `http_cache`, cached pages are requested with their ETag and
+        Last-Modified validators. Pages answered with 304 Not Modified are not parsed,
+        their cached content and links are used instead.
+
+        :param url: The starting URL to begin the crawl.
+        :param starting_depth: The starting depth level for the crawl. Defaults to 1.
+        :param skip_unchanged: Leave out pages answered with 304 Not Modified from the
+            result. Their links are still crawled and they count towards `max_links`.
+        :param cache_pages: Collect the fetched pages in this list instead of writing
+            them to the `http_cache`, so the caller caches them once they are stored.
+        :return: A dictionary of URLs and the main content extracted from them.
         """
-        num_links = 0
         crawler_result: dict[str, str] = {}
+        # Number of pages with main content, changed or not
+        num_links = 0
         primary_domain = self._get_primary_domain(url)
-        # Add starting URL with its depth to the global list
-        self._urls_to_crawl.append((url, starting_depth))
-        while self._urls_to_crawl:
-            # Unpack URL and depth from the global list
-            current_url, current_depth = self._urls_to_crawl.pop(0)
-
-            # Skip if
-            # - URL is already visited
-            # - does not end with the primary domain,
-            # - exceeds max depth
-            # - exceeds max links
-            if (
-                current_url in self._visited
-                or not urlparse(current_url).netloc.endswith(primary_domain)
-                or current_depth > self.max_depth
-                or num_links >= self.max_links
-            ):
-                continue
-
-            self._visited.add(current_url)
-            self.delay()
+        # URLs to crawl with their depth, and every URL added to them
+        urls_to_crawl: deque[tuple[str, int]] = deque([(url, starting_depth)])
+        seen: set[str] = {url}
+        hosts: dict[str, HostThrottle] = {}
+        pending: dict[asyncio.Task, tuple[str, int]] = {}
+        html_parser = self.html_parser or get_html_parser()
 
-            try:
-                logger.debug(f"Crawling: {current_url}")
-                response = httpx.get(current_url, timeout=10)
-                soup = BeautifulSoup(response.content, "html.parser")
-
-                # Extract main content
-                main_content = self._extract_main_content(soup)
-                if main_content:
-                    crawler_result[current_url] = main_content
-                    num_links += 1
-
-                # Add found URLs to the global list, with incremented depth
-                for link in soup.find_all("a", href=True):
-                    full_url = urljoin(current_url, link["href"])
-                    parsed_url = urlparse(full_url)
-                    if parsed_url.netloc.endswith(primary_domain) and not any(
-                        parsed_url.path.endswith(ext)
-                        for ext in [".pdf", ".jpg", ".png"]
-                    ):
-                        if (
-                            full_url not in self._visited
-                            and (full_url, current_depth + 1) not in self._urls_to_crawl
+        client_params: dict[str, Any] = {
+            "timeout": self.timeout,
+            "limits": httpx.Limits(max_connections=self.max_concurrency),
+        }
+        if self.client_params:
+            client_params.update(self.client_params)
+        async with httpx.AsyncClient(**client_params) as client:
+            while urls_to_crawl or pending:
+                # Pages without main content do not count towards max_links,
+                # so more pages are fetched as long as the limit is not reached
+                while (
+                    urls_to_crawl
+                    and len(pending) < self.max_concurrency
+                    and num_links + len(pending) < self.max_links
+                ):
+                    current_url, current_depth = urls_to_crawl.popleft()
+                    if current_depth > self.max_depth:
+                        continue
+                    host = urlparse(current_url).netloc
+                    if host not in hosts:
+                        hosts[host] = HostThrottle(
+                            self.max_concurrency_per_host,
+                            self.min_delay,
+                            self.max_delay,
+                        )
+                    task = asyncio.create_task(
+                        self._fetch(client, hosts[host], current_url),
+                    )
+                    pending[task] = (current_url, current_depth)
+
+                if not pending:
+                    break
+                done, _ = await asyncio.wait(
+                    pending,
+                    return_when=asyncio.FIRST_COMPLETED,
+                )
+                for task in done:
+                    current_url, current_depth = pending.pop(task)
+                    fetched = task.result()
+                    if fetched is None:
+                        continue
+                    page, content = fetched
+                    if content is not None:
+                        try:
+                            # Extract main content and links in a single pass
+                            page.content, page.links = html_parser.parse(
+                                content,
+                                current_url,
+                            )
+                        except Exception as e:
+                            logger.debug(f"Failed to parse: {current_url}: {e}")
+                            continue
+                        if self.http_cache is not None and page.validators:
+                            if cache_pages is not None:
+                                cache_pages.append(page)
+                            else:
+                                self.http_cache.set(page)
+
+                    if page.content and num_links < self.max_links:
+                        num_links += 1
+                        if content is not None or not skip_unchanged:
+                            crawler_result[current_url] = page.content
+
+                    if current_depth >= self.max_depth:
+                        continue
+                    # Add found URLs to crawl, with incremented depth
+                    for full_url in page.links:
+                        if full_url in seen:
+                            continue
+                        parsed_url = urlparse(full_url)
+                        if parsed_url.netloc.endswith(primary_domain) and not any(
+                            parsed_url.path.endswith(ext)
+                            for ext in [".pdf", ".jpg", ".png"]
                         ):
-                            self._urls_to_crawl.append((full_url, current_depth + 1))
+                            seen.add(full_url)
+                            urls_to_crawl.append((full_url, current_depth + 1))
 
+        return crawler_result
+
+    async def _fetch(
+        self,
+        client: httpx.AsyncClient,
+        host: HostThrottle,
+        url: str,
+    ) -> tuple[CachedPage, bytes | None] | None:
+        """Returns the page with its content, None as content if the cached page is
+        not modified, or None if the page cannot be fetched
+        """
+        cached = self.http_cache.get(url) if self.http_cache is not None else None
+        async with host.semaphore:
+            await host.wait()
+            try:
+                logger.debug(f"Crawling: {url}")
+                response = await client.get(
+                    url,
+                    headers=cached.validators if cached is not None else None,
+                )
+                if (
+                    cached is not None
+                    and response.status_code == httpx.codes.NOT_MODIFIED
+                ):
+                    logger.debug(f"Not modified: {url}")
+                    return cached, None
+                response.raise_for_status()
             except Exception as e:
-                logger.debug(f"Failed to crawl: {current_url}: {e}")
+                logger.debug(f"Failed to crawl: {url}: {e}")
+                return None
 
-        return crawler_result
+        page = CachedPage(
+            url=url,
+            etag=response.headers.get("etag"),
+            last_modified=response.headers.get("last-modified"),
+        )
+        return page, response.content
 
-    def read(self, url: str) -> list[Document]:
+    def read(
+        self,
+        url: str,
+        skip_unchanged: bool = False,
+        cache_pages: list[CachedPage] | None = None,
+    ) -> list[Document]:
         """
         Reads a website and returns a list of documents.
 
@@ -148,11 +282,35 @@ class WebsiteReader(Reader):
         Then iterates through the dictionary and returns chunks of content.
 
         :param url: The URL of the website to read.
+        :param skip_unchanged: Leave out pages not modified since they were cached.
+        :param cache_pages: Collect the pages to cache in this list, see `acrawl`.
         :return: A list of documents.
         """
 
         logger.debug(f"Reading: {url}")
-        crawler_result = self.crawl(url)
+        crawler_result = self.crawl(
+            url,
+            skip_unchanged=skip_unchanged,
+            cache_pages=cache_pages,
+        )
+        return self._documents(url, crawler_result)
+
+    async def aread(
+        self,
+        url: str,
+        skip_unchanged: bool = False,
+        cache_pages: list[CachedPage] | None = None,
+    ) -> list[Document]:
+        """Asynchronously reads a website and returns a list of documents, see `read`"""
+        logger.debug(f"Reading: {url}")
+        crawler_result = await self.acrawl(
+            url,
+            skip_unchanged=skip_unchanged,
+            cache_pages=cache_pages,
+        )
+        return self._documents(url, crawler_result)
+
+    def _documents(self, url: str, crawler_result: dict[str, str]) -> list[Document]:
         documents = []
         for crawled_url, crawled_content in crawler_result.items():
             if self.chunk:
@@ -1,3 +1,3 @@
-from pas.knowledge.embedder.base import Embedder
+from pas.knowledge.embedder.base import Embedder, Embedding
 
-__all__ = ["Embedder"]
+__all__ = ["Embedder", "Embedding"]
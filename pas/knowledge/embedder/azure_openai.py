@@ -1,12 +1,19 @@
 from os import getenv
 from typing import Any, Literal
 
+import numpy as np
+
 from pas.knowledge.embedder.base import Embedder
 from pas.utils.log import logger
 
 try:
     from openai import AzureOpenAI as AzureOpenAIClient
     from openai.types.create_embedding_response import CreateEmbeddingResponse
+
+    from pas.knowledge.embedder.openai import (
+        response_embedding_arrays,
+        response_embeddings,
+    )
 except ImportError:
     from pas.const import DEPENDENCY_GROUP_OPENAI, IMPORT_ERROR
 
@@ -54,11 +61,15 @@ class AzureOpenAIEmbedder(Embedder):
             _client_params["azure_ad_token_provider"] = self.azure_ad_token_provider
         return AzureOpenAIClient(**_client_params)
 
-    def _response(self, text: str) -> CreateEmbeddingResponse:
+    def _response(
+        self,
+        text: str | list[str],
+        encoding_format: Literal["float", "base64"] | None = None,
+    ) -> CreateEmbeddingResponse:
         _request_params: dict[str, Any] = {
             "input": text,
             "model": self.model,
-            "encoding_format": self.encoding_format,
+            "encoding_format": encoding_format or self.encoding_format,
         }
         if self.user is not None:
             _request_params["user"] = self.user
@@ -82,3 +93,18 @@ class AzureOpenAIEmbedder(Embedder):
         embedding = response.data[0].embedding
         usage = response.usage
         return embedding, usage.model_dump()
+
+    def _embed_batch(self, texts: list[str]) -> tuple[list[list[float]], dict | None]:
+        response: CreateEmbeddingResponse = self._response(text=texts)
+        return response_embeddings(response)
+
+    def _embed_batch_array(
+        self,
+        texts: list[str],
+    ) -> tuple[list[np.ndarray], dict | None]:
+        # Base64 embeddings are decoded straight into float32 arrays
+        response: CreateEmbeddingResponse = self._response(
+            text=texts,
+            encoding_format="base64",
+        )
+        return response_embedding_arrays(response)
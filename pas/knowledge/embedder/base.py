@@ -1,10 +1,25 @@
+import asyncio
+from array import array
+from collections.abc import Iterator
+from typing import Any, TypeAlias
+
+import numpy as np
 from pydantic import BaseModel, ConfigDict
 
+# An embedding as a list of floats or as a float32 buffer.
+# Buffers avoid creating a Python float per dimension when ingesting documents.
+Embedding: TypeAlias = list[float] | np.ndarray | array | memoryview
+
 
 class Embedder(BaseModel):
     """Base class for managing embedders"""
 
     dimensions: int = 1536
+    # Maximum number of texts sent to the embedding model in a single request
+    batch_size: int = 100
+    # Approximate maximum number of tokens sent in a single request
+    # Tokens are estimated as 1 token per 4 characters
+    batch_token_limit: int | None = None
 
     model_config = ConfigDict(arbitrary_types_allowed=True)
 
@@ -13,3 +28,174 @@ class Embedder(BaseModel):
 
     def get_embedding_and_usage(self, text: str) -> tuple[list[float], dict | None]:
         raise NotImplementedError
+
+    def get_embeddings(self, texts: list[str]) -> list[list[float]]:
+        """Returns the embeddings for a list of texts, in the same order"""
+        embeddings, _ = self.get_embeddings_and_usage(texts)
+        return embeddings
+
+    def get_embeddings_and_usage(
+        self,
+        texts: list[str],
+    ) -> tuple[list[list[float]], dict | None]:
+        """Returns the embeddings for a list of texts and the combined usage.
+
+        Texts are split into batches bounded by `batch_size` and `batch_token_limit`
+        and each batch is embedded with a single request.
+        """
+        embeddings: list[list[float]] = []
+        usage: dict[str, Any] | None = None
+        for batch in self.batches(texts):
+            batch_embeddings, batch_usage = self._embed_batch(batch)
+            embeddings.extend(batch_embeddings)
+            usage = merge_usage(usage, batch_usage)
+        return embeddings, usage
+
+    def get_embedding_arrays(self, texts: list[str]) -> list[np.ndarray]:
+        """Returns the embeddings for a list of texts as float32 arrays"""
+        embeddings, _ = self.get_embedding_arrays_and_usage(texts)
+        return embeddings
+
+    def get_embedding_arrays_and_usage(
+        self,
+        texts: list[str],
+    ) -> tuple[list[np.ndarray], dict | None]:
+        """Returns the embeddings for a list of texts as float32 arrays and the usage.
+
+        The embeddings of each batch are rows of a single float32 matrix, so no list of
+        floats is kept once a batch is converted. Failed embeddings are empty arrays.
+        """
+        embeddings: list[np.ndarray] = []
+        usage: dict[str, Any] | None = None
+        for batch in self.batches(texts):
+            batch_embeddings, batch_usage = self._embed_batch_array(batch)
+            embeddings.extend(batch_embeddings)
+            usage = merge_usage(usage, batch_usage)
+        return embeddings, usage
+
+    async def aget_embedding(self, text: str) -> list[float]:
+        """Returns the embedding of a text without blocking the event loop.
+        Embedders with an async client override this, others embed in a thread.
+        """
+        return await asyncio.to_thread(self.get_embedding, text)
+
+    async def aget_embedding_arrays(self, texts: list[str]) -> list[np.ndarray]:
+        """Returns the embeddings for a list of texts as float32 arrays, see
+        `get_embedding_arrays`, without blocking the event loop.
+        """
+        embeddings, _ = await self.aget_embedding_arrays_and_usage(texts)
+        return embeddings
+
+    async def aget_embedding_arrays_and_usage(
+        self,
+        texts: list[str],
+    ) -> tuple[list[np.ndarray], dict | None]:
+        embeddings: list[np.ndarray] = []
+        usage: dict[str, Any] | None = None
+        for batch in self.batches(texts):
+            batch_embeddings, batch_usage = await self._aembed_batch_array(batch)
+            embeddings.extend(batch_embeddings)
+            usage = merge_usage(usage, batch_usage)
+        return embeddings, usage
+
+    def batches(self, texts: list[str]) -> Iterator[list[str]]:
+        """Split texts into batches respecting `batch_size` and `batch_token_limit`"""
+        batch: list[str] = []
+        batch_tokens = 0
+        for text in texts:
+            text_tokens = estimate_tokens(text)
+            if batch and (
+                len(batch) >= self.batch_size
+                or (
+                    self.batch_token_limit is not None
+                    and batch_tokens + text_tokens > self.batch_token_limit
+                )
+            ):
+                yield batch
+                batch = []
+                batch_tokens = 0
+            batch.append(text)
+            batch_tokens += text_tokens
+        if batch:
+            yield batch
+
+    def _embed_batch(self, texts: list[str]) -> tuple[list[list[float]], dict | None]:
+        """Embed a single batch of texts.
+        Embedders without a native batch endpoint embed the texts one at a time.
+        """
+        embeddings: list[list[float]] = []
+        usage: dict[str, Any] | None = None
+        for text in texts:
+            embedding, text_usage = self.get_embedding_and_usage(text)
+            embeddings.append(embedding)
+            usage = merge_usage(usage, text_usage)
+        return embeddings, usage
+
+    def _embed_batch_array(
+        self,
+        texts: list[str],
+    ) -> tuple[list[np.ndarray], dict | None]:
+        """Embed a single batch of texts as float32 arrays.
+        Embedders which can return binary embeddings override this to skip lists.
+        """
+        embeddings, usage = self._embed_batch(texts)
+        return to_float32_rows(embeddings), usage
+
+    async def _aembed_batch_array(
+        self,
+        texts: list[str],
+    ) -> tuple[list[np.ndarray], dict | None]:
+        """Embed a single batch of texts as float32 arrays without blocking the event
+        loop. Embedders with an async client override this, others embed in a thread.
+        """
+        return await asyncio.to_thread(self._embed_batch_array, texts)
+
+
+def as_float32(embedding: Embedding) -> np.ndarray:
+    """Returns the embedding as a float32 array, without copying float32 buffers"""
+    if isinstance(embedding, np.ndarray) and embedding.dtype == np.float32:
+        return embedding
+    if isinstance(embedding, array | memoryview):
+        buffer = memoryview(embedding)
+        if buffer.format == "f":
+            return np.frombuffer(buffer, dtype=np.float32)
+    return np.asarray(embedding, dtype=np.float32)
+
+
+def to_float32_rows(embeddings: list[Any]) -> list[np.ndarray]:
+    """Convert a batch of embeddings to rows of a single float32 matrix.
+    Falls back to one array per embedding if their lengths differ, e.g. when some failed.
+    """
+    try:
+        return list(
+            np.asarray(embeddings, dtype=np.float32).reshape(len(embeddings), -1)
+        )
+    except ValueError:
+        return [as_float32(embedding) for embedding in embeddings]
+
+
+def embedding_to_list(embedding: Embedding) -> list[float]:
+    """Returns the embedding as a list of floats, e.g. for JSON serialization"""
+    if isinstance(embedding, list):
+        return embedding
+    return as_float32(embedding).tolist()
+
+
+def estimate_tokens(text: str) -> int:
+    """Returns a rough estimate of the number of tokens in a text"""
+    return len(text) // 4 + 1
+
+
+def merge_usage(a: dict[str, Any] | None, b: dict[str, Any] | None) -> dict | None:
+    """Returns the sum of two usage dictionaries, adding up numeric values"""
+    if a is None:
+        return dict(b) if b is not None else None
+    if b is None:
+        return a
+    merged = dict(a)
+    for key, value in b.items():
+        if isinstance(value, int | float) and isinstance(merged.get(key), int | float):
+            merged[key] += value
+        else:
+            merged.setdefault(key, value)
+    return merged
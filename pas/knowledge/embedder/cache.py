@@ -0,0 +1,393 @@
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from collections.abc import Callable
+from hashlib import md5
+from pathlib import Path
+from threading import Lock
+from time import time
+from typing import Any
+
+import numpy as np
+from pydantic import Field, model_validator
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.engine import Engine, create_engine
+from sqlalchemy.inspection import inspect
+from sqlalchemy.pool import StaticPool
+from sqlalchemy.schema import Column, MetaData, Table
+from sqlalchemy.sql.expression import Executable, delete, func, insert, select, update
+from sqlalchemy.types import Float, LargeBinary, String
+
+from pas.knowledge.embedder.base import (
+    Embedder,
+    Embedding,
+    as_float32,
+    embedding_to_list,
+)
+from pas.utils.log import logger
+
+
+class EmbeddingCache(ABC):
+    """Base class for caching embeddings by content key"""
+
+    def __init__(self):
+        self.hits: int = 0
+        self.misses: int = 0
+        # Caches are shared by the threads of the embed pipeline
+        self._lock = Lock()
+
+    @abstractmethod
+    def get_many(self, keys: list[str]) -> dict[str, Embedding]:
+        """Returns the cached embeddings for the keys which are present"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def set_many(self, embeddings: dict[str, Embedding]) -> None:
+        raise NotImplementedError
+
+    @abstractmethod
+    def clear(self) -> None:
+        raise NotImplementedError
+
+    def get(self, key: str) -> Embedding | None:
+        return self.get_many([key]).get(key)
+
+    def set(self, key: str, embedding: Embedding) -> None:
+        self.set_many({key: embedding})
+
+    def record(self, hits: int, misses: int) -> None:
+        with self._lock:
+            self.hits += hits
+            self.misses += misses
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def stats(self) -> dict[str, Any]:
+        return {"hits": self.hits, "misses": self.misses, "hit_rate": self.hit_rate}
+
+
+class MemoryEmbeddingCache(EmbeddingCache):
+    def __init__(self, max_size: int = 10_000):
+        """
+        In-memory embedding cache with least recently used eviction.
+
+        :param max_size: The maximum number of embeddings kept in memory.
+        """
+        super().__init__()
+        self.max_size: int = max_size
+        self._embeddings: OrderedDict[str, Embedding] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._embeddings)
+
+    def get_many(self, keys: list[str]) -> dict[str, Embedding]:
+        found: dict[str, Embedding] = {}
+        with self._lock:
+            for key in keys:
+                embedding = self._embeddings.get(key)
+                if embedding is not None:
+                    self._embeddings.move_to_end(key)
+                    found[key] = embedding
+        return found
+
+    def set_many(self, embeddings: dict[str, Embedding]) -> None:
+        with self._lock:
+            for key, embedding in embeddings.items():
+                self._embeddings[key] = embedding
+                self._embeddings.move_to_end(key)
+            while len(self._embeddings) > self.max_size:
+                self._embeddings.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._embeddings.clear()
+
+
+class SqlEmbeddingCache(EmbeddingCache):
+    def __init__(
+        self,
+        table_name: str = "embeddings",
+        db_url: str | None = None,
+        db_file: str | None = "tmp/embeddings.db",
+        db_engine: Engine | None = None,
+        max_size: int | None = 1_000_000,
+        memory_size: int = 10_000,
+    ):
+        """
+        Persistent embedding cache using a database with an in-memory LRU tier.
+
+        Embeddings are stored as packed float32 values. Writes use an upsert on sqlite
+        and postgres, other databases replace existing rows with a delete and insert.
+
+        :param table_name: The name of the table to store embeddings.
+        :param db_url: The database URL to connect to.
+        :param db_file: The database file to connect to.
+        :param db_engine: The database engine to use.
+        :param max_size: The maximum number of embeddings stored in the database.
+            The least recently used embeddings are removed first.
+        :param memory_size: The maximum number of embeddings kept in memory.
+        """
+        super().__init__()
+        _engine: Engine | None = db_engine
+        if _engine is None and db_url is not None:
+            _engine = create_engine(db_url)
+        elif _engine is None and db_file is not None:
+            Path(db_file).parent.mkdir(parents=True, exist_ok=True)
+            _engine = create_engine(f"sqlite:///{db_file}")
+        elif _engine is None:
+            # Share a single in-memory database between threads
+            _engine = create_engine(
+                "sqlite://",
+                poolclass=StaticPool,
+                connect_args={"check_same_thread": False},
+            )
+        self.db_engine: Engine = _engine
+
+        self.table_name: str = table_name
+        self.metadata: MetaData = MetaData()
+        self.table: Table = self.get_table()
+        self.max_size: int | None = max_size
+        self.memory: MemoryEmbeddingCache = MemoryEmbeddingCache(max_size=memory_size)
+        # Number of keys looked up per query
+        self.query_batch_size: int = 500
+        self.create()
+
+    def get_table(self) -> Table:
+        return Table(
+            self.table_name,
+            self.metadata,
+            # Hash of the embedder model, dimensions and text
+            Column("key", String, primary_key=True),
+            # Embedding packed as float32 values
+            Column("embedding", LargeBinary),
+            # Timestamp of the last read or write, used for eviction
+            Column("accessed_at", Float, index=True),
+            extend_existing=True,
+        )
+
+    def table_exists(self) -> bool:
+        try:
+            return inspect(self.db_engine).has_table(self.table.name)
+        except Exception as e:
+            logger.error(e)
+            return False
+
+    def create(self) -> None:
+        if not self.table_exists():
+            logger.debug(f"Creating table: {self.table.name}")
+            self.table.create(self.db_engine)
+
+    def __len__(self) -> int:
+        with self.db_engine.connect() as conn:
+            return conn.execute(select(func.count()).select_from(self.table)).scalar()
+
+    def get_many(self, keys: list[str]) -> dict[str, Embedding]:
+        found = self.memory.get_many(keys)
+        missing = [key for key in keys if key not in found]
+        if not missing:
+            return found
+
+        stored: dict[str, Embedding] = {}
+        now = time()
+        with self.db_engine.begin() as conn:
+            # Keep the number of bound parameters under the sqlite limit
+            for start in range(0, len(missing), self.query_batch_size):
+                batch = missing[start : start + self.query_batch_size]
+                stmt = select(self.table.c.key, self.table.c.embedding).where(
+                    self.table.c.key.in_(batch),
+                )
+                batch_stored = {
+                    key: np.frombuffer(blob, dtype=np.float32)
+                    for key, blob in conn.execute(stmt)
+                }
+                if batch_stored:
+                    conn.execute(
+                        update(self.table)
+                        .where(self.table.c.key.in_(list(batch_stored)))
+                        .values(accessed_at=now),
+                    )
+                stored.update(batch_stored)
+
+        self.memory.set_many(stored)
+        found.update(stored)
+        return found
+
+    def set_many(self, embeddings: dict[str, Embedding]) -> None:
+        if not embeddings:
+            return
+
+        self.memory.set_many(embeddings)
+        now = time()
+        rows = [
+            {
+                "key": key,
+                "embedding": as_float32(embedding).tobytes(),
+                "accessed_at": now,
+            }
+            for key, embedding in embeddings.items()
+        ]
+        with self.db_engine.begin() as conn:
+            stmt = self.upsert_statement()
+            if stmt is None:
+                keys = list(embeddings)
+                for start in range(0, len(keys), self.query_batch_size):
+                    batch = keys[start : start + self.query_batch_size]
+                    conn.execute(delete(self.table).where(self.table.c.key.in_(batch)))
+                stmt = insert(self.table)
+            conn.execute(stmt, rows)
+        self.evict()
+
+    def upsert_statement(self) -> Executable | None:
+        """Returns an insert which updates existing keys, None if the database
+        has no upsert supported here
+        """
+        dialects = {"sqlite": sqlite, "postgresql": postgresql}
+        dialect = dialects.get(self.db_engine.dialect.name)
+        if dialect is None:
+            return None
+        stmt = dialect.insert(self.table)
+        return stmt.on_conflict_do_update(
+            index_elements=["key"],
+            set_=dict(
+                embedding=stmt.excluded.embedding,
+                accessed_at=stmt.excluded.accessed_at,
+            ),
+        )
+
+    def evict(self) -> None:
+        """Remove the least recently used embeddings above `max_size`"""
+        if self.max_size is None:
+            return
+
+        with self.db_engine.begin() as conn:
+            count = conn.execute(select(func.count()).select_from(self.table)).scalar()
+            if count is None or count <= self.max_size:
+                return
+            oldest = (
+                select(self.table.c.key)
+                .order_by(self.table.c.accessed_at)
+                .limit(count - self.max_size)
+            )
+            conn.execute(delete(self.table).where(self.table.c.key.in_(oldest)))
+            logger.debug(f"Evicted {count - self.max_size} embeddings from cache")
+
+    def clear(self) -> None:
+        self.memory.clear()
+        with self.db_engine.begin() as conn:
+            conn.execute(delete(self.table))
+
+
+class CachedEmbedder(Embedder):
+    """Embedder which caches the embeddings of another embedder.
+
+    Embeddings are keyed by the embedder model, dimensions and a hash of the text,
+    so identical texts are only embedded once.
+    """
+
+    embedder: Embedder
+    cache: EmbeddingCache = Field(default_factory=MemoryEmbeddingCache)
+
+    @model_validator(mode="after")  # type: ignore
+    def set_dimensions(self) -> "CachedEmbedder":
+        self.dimensions = self.embedder.dimensions
+        return self  # type: ignore
+
+    @property
+    def model(self) -> str:
+        return getattr(self.embedder, "model", self.embedder.__class__.__name__)
+
+    def cache_key(self, text: str) -> str:
+        return md5(f"{self.model}:{self.dimensions}:{text}".encode()).hexdigest()
+
+    def get_embedding(self, text: str) -> list[float]:
+        embedding, _ = self.get_embedding_and_usage(text)
+        return embedding
+
+    def get_embedding_and_usage(self, text: str) -> tuple[list[float], dict | None]:
+        embeddings, usage = self.get_embeddings_and_usage([text])
+        return embeddings[0], usage
+
+    def get_embeddings_and_usage(
+        self,
+        texts: list[str],
+    ) -> tuple[list[list[float]], dict | None]:
+        embeddings, usage = self._cached_embeddings(
+            texts,
+            self.embedder.get_embeddings_and_usage,
+        )
+        return [embedding_to_list(embedding) for embedding in embeddings], usage
+
+    def get_embedding_arrays_and_usage(
+        self,
+        texts: list[str],
+    ) -> tuple[list[np.ndarray], dict | None]:
+        embeddings, usage = self._cached_embeddings(
+            texts,
+            self.embedder.get_embedding_arrays_and_usage,
+        )
+        return [as_float32(embedding) for embedding in embeddings], usage
+
+    async def aget_embedding(self, text: str) -> list[float]:
+        embeddings, _ = await self.aget_embedding_arrays_and_usage([text])
+        return embedding_to_list(embeddings[0])
+
+    async def aget_embedding_arrays_and_usage(
+        self,
+        texts: list[str],
+    ) -> tuple[list[np.ndarray], dict | None]:
+        keys, cached, missing = self._lookup(texts)
+        usage: dict[str, Any] | None = None
+        if missing:
+            embeddings, usage = await self.embedder.aget_embedding_arrays_and_usage(
+                list(missing.values()),
+            )
+            self._store(cached, missing, embeddings)
+        return [as_float32(cached.get(key, [])) for key in keys], usage
+
+    def _cached_embeddings(
+        self,
+        texts: list[str],
+        embed: Callable[[list[str]], tuple[list[Any], dict | None]],
+    ) -> tuple[list[Embedding], dict | None]:
+        """Returns cached embeddings and embeds the missing texts with `embed`"""
+        keys, cached, missing = self._lookup(texts)
+        usage: dict[str, Any] | None = None
+        if missing:
+            embeddings, usage = embed(list(missing.values()))
+            self._store(cached, missing, embeddings)
+        return [cached.get(key, []) for key in keys], usage
+
+    def _lookup(
+        self,
+        texts: list[str],
+    ) -> tuple[list[str], dict[str, Embedding], dict[str, str]]:
+        """Returns the keys of the texts, the cached embeddings by key and the
+        texts to embed by key
+        """
+        keys = [self.cache_key(text) for text in texts]
+        cached = self.cache.get_many(keys)
+
+        # Embed each missing text once, even if it is repeated in the input
+        missing: dict[str, str] = {}
+        for key, text in zip(keys, texts, strict=True):
+            if key not in cached and key not in missing:
+                missing[key] = text
+        self.cache.record(hits=len(texts) - len(missing), misses=len(missing))
+        return keys, cached, missing
+
+    def _store(
+        self,
+        cached: dict[str, Embedding],
+        missing: dict[str, str],
+        embeddings: list[Any],
+    ) -> None:
+        new_embeddings = {
+            key: embedding
+            for key, embedding in zip(missing, embeddings, strict=True)
+            # Failed requests return empty embeddings which are not cached
+            if len(embedding) > 0
+        }
+        self.cache.set_many(new_embeddings)
+        cached.update(new_embeddings)
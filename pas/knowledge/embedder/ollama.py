@@ -1,10 +1,14 @@
 from typing import Any
 
-from pas.knowledge.embedder.base import Embedder
+import numpy as np
+
+from pas.knowledge.embedder.base import Embedder, to_float32_rows
 from pas.utils.log import logger
 
 try:
+    from ollama import AsyncClient as AsyncOllamaClient
     from ollama import Client as OllamaClient
+    from ollama import ResponseError
 except ImportError:
     logger.error("`ollama` not installed")
     raise
@@ -18,12 +22,25 @@ class OllamaEmbedder(Embedder):
     options: Any | None = None
     client_kwargs: dict[str, Any] | None = None
     ollama_client: OllamaClient | None = None
+    # Client used by the async methods, e.g. `aget_embedding`
+    async_ollama_client: AsyncOllamaClient | None = None
+    # Use the batched `/api/embed` endpoint, available from Ollama 0.3.0
+    # Disabled automatically if the server does not support it
+    batch_endpoint: bool = True
 
     @property
     def client(self) -> OllamaClient:
         if self.ollama_client:
             return self.ollama_client
+        return OllamaClient(**self._ollama_params())
+
+    @property
+    def async_client(self) -> AsyncOllamaClient:
+        if self.async_ollama_client:
+            return self.async_ollama_client
+        return AsyncOllamaClient(**self._ollama_params())
 
+    def _ollama_params(self) -> dict[str, Any]:
         _ollama_params: dict[str, Any] = {}
         if self.host:
             _ollama_params["host"] = self.host
@@ -31,7 +48,7 @@ class OllamaEmbedder(Embedder):
             _ollama_params["timeout"] = self.timeout
         if self.client_kwargs:
             _ollama_params.update(self.client_kwargs)
-        return OllamaClient(**_ollama_params)
+        return _ollama_params
 
     def _response(self, text: str) -> dict[str, Any]:
         kwargs: dict[str, Any] = {}
@@ -40,6 +57,15 @@ class OllamaEmbedder(Embedder):
 
         return self.client.embeddings(prompt=text, model=self.model, **kwargs)  # type: ignore
 
+    async def _aresponse(self, text: str) -> dict[str, Any]:
+        kwargs: dict[str, Any] = {}
+        if self.options is not None:
+            kwargs["options"] = self.options
+
+        return await self.async_client.embeddings(
+            prompt=text, model=self.model, **kwargs
+        )  # type: ignore
+
     def get_embedding(self, text: str) -> list[float]:
         try:
             response = self._response(text=text)
@@ -50,6 +76,16 @@ class OllamaEmbedder(Embedder):
             logger.warning(e)
             return []
 
+    async def aget_embedding(self, text: str) -> list[float]:
+        try:
+            response = await self._aresponse(text=text)
+            if response is None:
+                return []
+            return response.get("embedding", [])
+        except Exception as e:
+            logger.warning(e)
+            return []
+
     def get_embedding_and_usage(self, text: str) -> tuple[list[float], dict | None]:
         embedding = []
         usage = None
@@ -60,3 +96,66 @@ class OllamaEmbedder(Embedder):
         except Exception as e:
             logger.warning(e)
         return embedding, usage
+
+    def _batch_response(self, texts: list[str]) -> dict[str, Any]:
+        return self.client.embed(model=self.model, input=texts, options=self.options)  # type: ignore
+
+    async def _abatch_response(self, texts: list[str]) -> dict[str, Any]:
+        return await self.async_client.embed(
+            model=self.model, input=texts, options=self.options
+        )  # type: ignore
+
+    def _embed_batch(self, texts: list[str]) -> tuple[list[list[float]], dict | None]:
+        if not self.batch_endpoint:
+            return super()._embed_batch(texts)
+
+        try:
+            response = self._batch_response(texts=texts)
+        except ResponseError as e:
+            if e.status_code != 404:  # noqa: PLR2004
+                logger.warning(e)
+                return [[] for _ in texts], None
+            logger.debug("Ollama server does not support batched embeddings")
+            self.batch_endpoint = False
+            return super()._embed_batch(texts)
+        except Exception as e:
+            logger.warning(e)
+            return [[] for _ in texts], None
+        return self._batch_embeddings(response, texts)
+
+    async def _aembed_batch_array(
+        self,
+        texts: list[str],
+    ) -> tuple[list[np.ndarray], dict | None]:
+        if self.batch_endpoint:
+            try:
+                response = await self._abatch_response(texts=texts)
+            except ResponseError as e:
+                if e.status_code != 404:  # noqa: PLR2004
+                    logger.warning(e)
+                    return to_float32_rows([[] for _ in texts]), None
+                logger.debug("Ollama server does not support batched embeddings")
+                self.batch_endpoint = False
+            except Exception as e:
+                logger.warning(e)
+                return to_float32_rows([[] for _ in texts]), None
+            else:
+                embeddings, usage = self._batch_embeddings(response, texts)
+                return to_float32_rows(embeddings), usage
+
+        embeddings = [await self.aget_embedding(text) for text in texts]
+        return to_float32_rows(embeddings), None
+
+    @staticmethod
+    def _batch_embeddings(
+        response: dict[str, Any],
+        texts: list[str],
+    ) -> tuple[list[list[float]], dict | None]:
+        embeddings = response.get("embeddings", [])
+        if len(embeddings) != len(texts):
+            logger.warning(f"Expected {len(texts)} embeddings, got {len(embeddings)}")
+            return [[] for _ in texts], None
+        usage = None
+        if "prompt_eval_count" in response:
+            usage = {"prompt_tokens": response["prompt_eval_count"]}
+        return embeddings, usage
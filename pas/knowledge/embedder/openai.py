@@ -1,9 +1,13 @@
+from base64 import b64decode
 from typing import Any, Literal
 
-from pas.knowledge.embedder.base import Embedder
+import numpy as np
+
+from pas.knowledge.embedder.base import Embedder, as_float32
 from pas.utils.log import logger
 
 try:
+    from openai import AsyncOpenAI as AsyncOpenAIClient
     from openai import OpenAI as OpenAIClient
     from openai.types.create_embedding_response import CreateEmbeddingResponse
 except ImportError:
@@ -24,12 +28,22 @@ class OpenAIEmbedder(Embedder):
     request_params: dict[str, Any] | None = None
     client_params: dict[str, Any] | None = None
     openai_client: OpenAIClient | None = None
+    # Client used by the async methods, e.g. `aget_embedding`
+    async_openai_client: AsyncOpenAIClient | None = None
 
     @property
     def client(self) -> OpenAIClient:
         if self.openai_client:
             return self.openai_client
+        return OpenAIClient(**self._client_params())
+
+    @property
+    def async_client(self) -> AsyncOpenAIClient:
+        if self.async_openai_client:
+            return self.async_openai_client
+        return AsyncOpenAIClient(**self._client_params())
 
+    def _client_params(self) -> dict[str, Any]:
         _client_params: dict[str, Any] = {}
         if self.api_key:
             _client_params["api_key"] = self.api_key
@@ -39,13 +53,17 @@ class OpenAIEmbedder(Embedder):
             _client_params["base_url"] = self.base_url
         if self.client_params:
             _client_params.update(self.client_params)
-        return OpenAIClient(**_client_params)
+        return _client_params
 
-    def _response(self, text: str) -> CreateEmbeddingResponse:
+    def _request_params(
+        self,
+        text: str | list[str],
+        encoding_format: Literal["float", "base64"] | None = None,
+    ) -> dict[str, Any]:
         _request_params: dict[str, Any] = {
             "input": text,
             "model": self.model,
-            "encoding_format": self.encoding_format,
+            "encoding_format": encoding_format or self.encoding_format,
         }
         if self.user is not None:
             _request_params["user"] = self.user
@@ -53,7 +71,25 @@ class OpenAIEmbedder(Embedder):
             _request_params["dimensions"] = self.dimensions
         if self.request_params:
             _request_params.update(self.request_params)
-        return self.client.embeddings.create(**_request_params)
+        return _request_params
+
+    def _response(
+        self,
+        text: str | list[str],
+        encoding_format: Literal["float", "base64"] | None = None,
+    ) -> CreateEmbeddingResponse:
+        return self.client.embeddings.create(
+            **self._request_params(text, encoding_format),
+        )
+
+    async def _aresponse(
+        self,
+        text: str | list[str],
+        encoding_format: Literal["float", "base64"] | None = None,
+    ) -> CreateEmbeddingResponse:
+        return await self.async_client.embeddings.create(
+            **self._request_params(text, encoding_format),
+        )
 
     def get_embedding(self, text: str) -> list[float]:
         response: CreateEmbeddingResponse = self._response(text=text)
@@ -63,9 +99,70 @@ class OpenAIEmbedder(Embedder):
             logger.warning(e)
             return []
 
+    async def aget_embedding(self, text: str) -> list[float]:
+        response: CreateEmbeddingResponse = await self._aresponse(text=text)
+        try:
+            return response.data[0].embedding
+        except Exception as e:
+            logger.warning(e)
+            return []
+
     def get_embedding_and_usage(self, text: str) -> tuple[list[float], dict | None]:
         response: CreateEmbeddingResponse = self._response(text=text)
 
         embedding = response.data[0].embedding
         usage = response.usage
         return embedding, usage.model_dump()
+
+    def _embed_batch(self, texts: list[str]) -> tuple[list[list[float]], dict | None]:
+        response: CreateEmbeddingResponse = self._response(text=texts)
+        return response_embeddings(response)
+
+    def _embed_batch_array(
+        self,
+        texts: list[str],
+    ) -> tuple[list[np.ndarray], dict | None]:
+        # Base64 embeddings are decoded straight into float32 arrays
+        response: CreateEmbeddingResponse = self._response(
+            text=texts,
+            encoding_format="base64",
+        )
+        return response_embedding_arrays(response)
+
+    async def _aembed_batch_array(
+        self,
+        texts: list[str],
+    ) -> tuple[list[np.ndarray], dict | None]:
+        response: CreateEmbeddingResponse = await self._aresponse(
+            text=texts,
+            encoding_format="base64",
+        )
+        return response_embedding_arrays(response)
+
+
+def response_embeddings(
+    response: CreateEmbeddingResponse,
+) -> tuple[list[list[float]], dict | None]:
+    """Returns the embeddings of a batch response in the order of the input texts"""
+    # Embeddings are returned with the index of their input text
+    data = sorted(response.data, key=lambda item: item.index)
+    embeddings = [item.embedding for item in data]
+    usage = response.usage
+    return embeddings, usage.model_dump() if usage else None
+
+
+def response_embedding_arrays(
+    response: CreateEmbeddingResponse,
+) -> tuple[list[np.ndarray], dict | None]:
+    """Returns the embeddings of a batch response as float32 arrays.
+    Base64 embeddings are decoded straight into arrays without a list of floats.
+    """
+    data = sorted(response.data, key=lambda item: item.index)
+    embeddings = [
+        np.frombuffer(b64decode(item.embedding), dtype=np.float32)
+        if isinstance(item.embedding, str)
+        else as_float32(item.embedding)
+        for item in data
+    ]
+    usage = response.usage
+    return embeddings, usage.model_dump() if usage else None
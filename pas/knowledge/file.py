@@ -0,0 +1,188 @@
+from collections.abc import Iterator
+from hashlib import sha256
+from pathlib import Path
+
+from pydantic import BaseModel
+
+from pas.knowledge.base import AssistantKnowledge
+from pas.knowledge.document import Document
+from pas.utils.log import logger
+
+
+class FileState(BaseModel):
+    """State of a source file when it was last synced"""
+
+    size: int
+    mtime_ns: int
+    hash: str
+    # Ids of the documents read from the file, see `VectorDb.doc_id`
+    chunk_ids: list[str] = []
+
+
+class SyncManifest(BaseModel):
+    """Source files of a knowledge base and the documents read from them"""
+
+    files: dict[str, FileState] = {}
+
+    @classmethod
+    def load(cls, path: Path) -> "SyncManifest":
+        if not path.exists():
+            return cls()
+        try:
+            return cls.model_validate_json(path.read_text(encoding="utf-8"))
+        except Exception as e:
+            logger.warning(f"Ignoring invalid sync manifest: {path}: {e}")
+            return cls()
+
+    def save(self, path: Path) -> None:
+        # Write to a temporary file first so an interrupted save keeps the old manifest
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(f"{path.name}.tmp")
+        tmp_path.write_text(self.model_dump_json(), encoding="utf-8")
+        tmp_path.replace(path)
+
+
+class FileKnowledgeBase(AssistantKnowledge):
+    """Base class for knowledge bases read from files"""
+
+    path: str | Path
+    # File recording the state of the source files, used by `sync`
+    # Defaults to tmp/sync/<collection>.json
+    manifest_file: str | Path | None = None
+
+    @property
+    def files(self) -> Iterator[Path]:
+        """Iterator over the source files of the knowledge base"""
+        raise NotImplementedError
+
+    @property
+    def document_lists(self) -> Iterator[list[Document]]:
+        """Iterate over the source files and yield lists of documents.
+        Each object yielded by the iterator is a list of documents.
+
+        Returns:
+            Iterator[List[Document]]: Iterator yielding list of documents
+        """
+        for documents in self.reader.read_many(self.files):  # type: ignore
+            # Files which cannot be read are logged by the reader and skipped
+            if documents is not None:
+                yield documents
+
+    @property
+    def manifest_path(self) -> Path:
+        if self.manifest_file is not None:
+            return Path(self.manifest_file)
+        collection = getattr(self.vector_db, "collection", None)
+        if collection is None:
+            raise ValueError("No manifest_file provided")
+        return Path("tmp") / "sync" / f"{collection}.json"
+
+    def sync(self, upsert: bool = False) -> None:
+        """Load new and changed files and remove the documents of deleted files.
+
+        Files are compared to the manifest by size and modification time, and by
+        content hash if those changed, so unchanged files are not read again. The
+        first sync reads every file, documents loaded before are not embedded again.
+
+        Args:
+            upsert (bool): If True, upserts documents to the vector db. Defaults to False.
+        """
+        if self.vector_db is None:
+            logger.warning("No vector db provided")
+            return
+
+        manifest_path = self.manifest_path
+        manifest = SyncManifest.load(manifest_path)
+        self.vector_db.create()
+
+        synced_files: dict[str, FileState] = {}
+        changed_files: dict[str, FileState] = {}
+        for file in self.files:
+            key = str(file.resolve())
+            stat = file.stat()
+            state = manifest.files.get(key)
+            if (
+                state is not None
+                and state.size == stat.st_size
+                and state.mtime_ns == stat.st_mtime_ns
+            ):
+                synced_files[key] = state
+                continue
+
+            file_hash = hash_file(file)
+            if state is not None and state.hash == file_hash:
+                # Only the modification time changed
+                synced_files[key] = state.model_copy(
+                    update={"size": stat.st_size, "mtime_ns": stat.st_mtime_ns},
+                )
+                continue
+            changed_files[key] = FileState(
+                size=stat.st_size,
+                mtime_ns=stat.st_mtime_ns,
+                hash=file_hash,
+            )
+
+        removed_files = [
+            key
+            for key in manifest.files
+            if key not in synced_files and key not in changed_files
+        ]
+        logger.info(
+            f"Syncing knowledge base: {len(changed_files)} new or changed files, "
+            f"{len(removed_files)} removed files, {len(synced_files)} unchanged files",
+        )
+
+        read_documents = self.reader.read_many(  # type: ignore
+            [Path(key) for key in changed_files],
+        )
+        for (key, state), documents in zip(
+            changed_files.items(),
+            read_documents,
+            strict=True,
+        ):
+            if documents is None:
+                # Keep the documents of the previous version, the file is read
+                # again on the next sync
+                previous_state = manifest.files.get(key)
+                if previous_state is not None:
+                    synced_files[key] = previous_state
+                continue
+            self._load_documents(documents=documents, upsert=upsert)
+            state.chunk_ids = list(
+                dict.fromkeys(
+                    self.vector_db.doc_id(document) for document in documents
+                ),
+            )
+            synced_files[key] = state
+
+        # Documents with the same content may come from several files
+        previous_ids = {
+            chunk_id
+            for state in manifest.files.values()
+            for chunk_id in state.chunk_ids
+        }
+        current_ids = {
+            chunk_id for state in synced_files.values() for chunk_id in state.chunk_ids
+        }
+        stale_ids = sorted(previous_ids - current_ids)
+        if len(stale_ids) > 0:
+            logger.info(
+                f"Deleting {len(stale_ids)} documents of changed or removed files"
+            )
+            self.vector_db.delete_documents(stale_ids)
+            if self.lexical_index is not None:
+                self.lexical_index.remove(stale_ids)
+            self.clear_search_cache()
+
+        if self.lexical_index is not None:
+            self.lexical_index.save()
+        SyncManifest(files=synced_files).save(manifest_path)
+
+
+def hash_file(path: Path, block_size: int = 1 << 20) -> str:
+    """Returns the sha256 hash of a file, read in blocks"""
+    file_hash = sha256()
+    with path.open("rb") as f:
+        while block := f.read(block_size):
+            file_hash.update(block)
+    return file_hash.hexdigest()
@@ -1,32 +1,39 @@
 from collections.abc import Iterator
 from pathlib import Path
 
-from pas.knowledge.base import AssistantKnowledge
 from pas.knowledge.document import Document
 from pas.knowledge.document.json import JSONReader
+from pas.knowledge.file import FileKnowledgeBase
 
 
-class JSONKnowledgeBase(AssistantKnowledge):
+class JSONKnowledgeBase(FileKnowledgeBase):
     path: str | Path
     reader: JSONReader = JSONReader()
 
     @property
-    def document_lists(self) -> Iterator[list[Document]]:
-        """Iterate over Json files and yield lists of documents.
-        Each object yielded by the iterator is a list of documents.
-
-        Returns:
-            Iterator[List[Document]]: Iterator yielding list of documents
-        """
+    def files(self) -> Iterator[Path]:
+        """Iterator over the JSON and JSON Lines files in `path`"""
 
         _json_path: Path = Path(self.path) if isinstance(self.path, str) else self.path
 
         if _json_path.exists() and _json_path.is_dir():
-            for _pdf in _json_path.glob("*.json"):
-                yield self.reader.read(path=_pdf)
+            yield from _json_path.glob("*.json")
+            yield from _json_path.glob("*.jsonl")
         elif (
             _json_path.exists()
             and _json_path.is_file()
-            and _json_path.suffix == ".json"
+            and _json_path.suffix in (".json", ".jsonl")
         ):
-            yield self.reader.read(path=_json_path)
+            yield _json_path
+
+    @property
+    def document_lists(self) -> Iterator[list[Document]]:
+        """Iterate over the JSON files and yield lists of documents.
+        Files are read incrementally, each list holds the documents of a batch of
+        elements of a file, see `JSONReader.iter_documents`.
+
+        Returns:
+            Iterator[List[Document]]: Iterator yielding list of documents
+        """
+        for path in self.files:
+            yield from self.reader.iter_documents(path)
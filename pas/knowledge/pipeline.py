@@ -0,0 +1,99 @@
+from collections import deque
+from collections.abc import Callable, Iterable, Iterator
+from concurrent.futures import Future, ThreadPoolExecutor
+from queue import Full, Queue
+from threading import Event, Thread
+
+from pas.knowledge.document import Document
+from pas.knowledge.embedder import Embedder
+from pas.utils.log import logger
+
+# Marks the end of the documents produced by the reader thread
+_DONE = object()
+
+
+def embed_pipeline(
+    document_lists: Iterable[list[Document]],
+    embedder: Embedder,
+    prepare: Callable[[list[Document]], list[Document]] | None = None,
+    num_workers: int = 4,
+    queue_size: int = 4,
+) -> Iterator[list[Document]]:
+    """Read, prepare and embed lists of documents concurrently.
+
+    Reading runs in a background thread and embedding in a pool of `num_workers`
+    threads, while the caller consumes the embedded lists, for example by inserting
+    them into a vector db. At most `queue_size` read lists and
+    `num_workers + queue_size` embedding lists are held in memory, so a slow stage
+    blocks the stages before it.
+
+    Args:
+        document_lists: Lists of documents to embed, usually `AssistantKnowledge.document_lists`.
+        embedder: Embedder used for the documents.
+        prepare: Optional function applied to each list before embedding, e.g. to filter out existing documents.
+        num_workers: Number of concurrent embedding threads.
+        queue_size: Maximum number of read lists waiting to be embedded.
+
+    Returns:
+        Iterator[List[Document]]: Embedded lists of documents, in the order they were read.
+    """
+    read_queue: Queue = Queue(maxsize=queue_size)
+    stop = Event()
+    read_errors: list[BaseException] = []
+
+    def put(item: object) -> bool:
+        # Block while the queue is full, unless the consumer has stopped
+        while not stop.is_set():
+            try:
+                read_queue.put(item, timeout=0.1)
+                return True
+            except Full:
+                continue
+        return False
+
+    def read() -> None:
+        try:
+            for document_list in document_lists:
+                if not put(document_list):
+                    return
+        except BaseException as e:
+            read_errors.append(e)
+        finally:
+            put(_DONE)
+
+    def embed(document_list: list[Document]) -> list[Document]:
+        if prepare is not None:
+            document_list = prepare(document_list)
+        Document.embed_documents(
+            documents=[
+                document for document in document_list if document.embedding is None
+            ],
+            embedder=embedder,
+        )
+        return document_list
+
+    reader = Thread(target=read, name="knowledge-reader", daemon=True)
+    reader.start()
+    executor = ThreadPoolExecutor(
+        max_workers=num_workers,
+        thread_name_prefix="knowledge-embedder",
+    )
+    pending: deque[Future] = deque()
+    try:
+        while True:
+            document_list = read_queue.get()
+            if document_list is _DONE:
+                break
+            pending.append(executor.submit(embed, document_list))
+            # Wait for the oldest list once enough lists are in flight
+            if len(pending) >= num_workers + queue_size:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+    finally:
+        stop.set()
+        executor.shutdown(wait=True, cancel_futures=True)
+
+    if read_errors:
+        logger.error(f"Error reading documents: {read_errors[0]}")
+        raise read_errors[0]
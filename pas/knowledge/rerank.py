@@ -0,0 +1,224 @@
+from time import monotonic
+from typing import Any, ClassVar
+
+import numpy as np
+from pydantic import BaseModel, ConfigDict
+
+from pas.knowledge.document import Document
+from pas.knowledge.embedder import Embedder
+from pas.knowledge.embedder.base import as_float32
+from pas.utils.log import logger
+
+
+class Reranker(BaseModel):
+    """Base class for rerankers rescoring the candidates of a search"""
+
+    # Number of documents scored together
+    batch_size: int = 32
+    # Number of seconds after which no more batches are scored, None for no limit
+    # At least one batch is scored, candidates which are not scored keep their order
+    # after the scored ones
+    latency_budget: float | None = None
+    # If True, search results are given their stored embeddings before reranking
+    uses_embeddings: ClassVar[bool] = False
+
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    def score(self, query: str, documents: list[Document]) -> list[float]:
+        """Returns the relevance of each document to the query, higher is better"""
+        raise NotImplementedError
+
+    def rerank(
+        self,
+        query: str,
+        documents: list[Document],
+        top_n: int | None = None,
+    ) -> list[Document]:
+        """Returns the `top_n` documents with the highest scores, best first"""
+        start = monotonic()
+        scores: list[float] = []
+        for batch_start in range(0, len(documents), self.batch_size):
+            if self.over_budget(start, batch_start // self.batch_size):
+                logger.debug(
+                    f"Reranked {len(scores)} of {len(documents)} documents "
+                    f"within {self.latency_budget}s",
+                )
+                break
+            batch = documents[batch_start : batch_start + self.batch_size]
+            scores.extend(self.score(query, batch))
+
+        # Sorting is stable, so ties keep the order of the first stage
+        scored = sorted(range(len(scores)), key=lambda i: scores[i], reverse=True)
+        order = scored + list(range(len(scores), len(documents)))
+        return [documents[i] for i in order][:top_n]
+
+    def over_budget(self, start: float, num_batches: int) -> bool:
+        """Returns True if scoring another batch would likely exceed the budget,
+        estimating its duration from the batches scored so far.
+        """
+        if self.latency_budget is None or num_batches == 0:
+            return False
+        elapsed = monotonic() - start
+        return elapsed + elapsed / num_batches > self.latency_budget
+
+
+class CrossEncoderReranker(Reranker):
+    """Reranker scoring (query, document) pairs with a cross-encoder exported to ONNX,
+    e.g. cross-encoder/ms-marco-MiniLM-L-6-v2, run on CPU with onnxruntime.
+
+    The pairs of a batch are tokenized together with the `tokenizers` library and
+    scored with a single run of the model. The last logit of each pair is its score.
+    """
+
+    # Path of the ONNX model
+    model_path: str | None = None
+    # Path of the tokenizer.json of the model
+    tokenizer_path: str | None = None
+    # Maximum number of tokens of a pair, longer documents are truncated
+    max_length: int = 512
+    # Number of threads used by onnxruntime, None for its default
+    num_threads: int | None = None
+    # Inference session and tokenizer, created from the paths if not provided
+    session: Any | None = None
+    tokenizer: Any | None = None
+
+    def get_session(self) -> Any:
+        if self.session is not None:
+            return self.session
+
+        try:
+            import onnxruntime
+        except ImportError:
+            raise ImportError("`onnxruntime` not installed")
+
+        if self.model_path is None:
+            raise ValueError("No model_path provided")
+        options = onnxruntime.SessionOptions()
+        if self.num_threads is not None:
+            options.intra_op_num_threads = self.num_threads
+        self.session = onnxruntime.InferenceSession(
+            self.model_path,
+            sess_options=options,
+            providers=["CPUExecutionProvider"],
+        )
+        return self.session
+
+    def get_tokenizer(self) -> Any:
+        if self.tokenizer is None:
+            try:
+                from tokenizers import Tokenizer
+            except ImportError:
+                raise ImportError("`tokenizers` not installed")
+
+            if self.tokenizer_path is None:
+                raise ValueError("No tokenizer_path provided")
+            self.tokenizer = Tokenizer.from_file(self.tokenizer_path)
+        # Pairs of a batch are padded to the longest one
+        if self.tokenizer.truncation is None:
+            self.tokenizer.enable_truncation(max_length=self.max_length)
+        if self.tokenizer.padding is None:
+            self.tokenizer.enable_padding()
+        return self.tokenizer
+
+    def score(self, query: str, documents: list[Document]) -> list[float]:
+        session = self.get_session()
+        encodings = self.get_tokenizer().encode_batch(
+            [(query, document.content) for document in documents],
+        )
+        inputs = {
+            "input_ids": np.array([e.ids for e in encodings], dtype=np.int64),
+            "attention_mask": np.array(
+                [e.attention_mask for e in encodings],
+                dtype=np.int64,
+            ),
+            "token_type_ids": np.array([e.type_ids for e in encodings], dtype=np.int64),
+        }
+        input_names = {model_input.name for model_input in session.get_inputs()}
+        logits = session.run(
+            None,
+            {name: value for name, value in inputs.items() if name in input_names},
+        )[0]
+        return np.asarray(logits).reshape(len(documents), -1)[:, -1].tolist()
+
+
+class MMRReranker(Reranker):
+    """Reranker selecting documents by maximal marginal relevance.
+
+    Each document is chosen to be similar to the query and dissimilar to the
+    documents chosen before it, so near duplicate results are pushed down.
+    Similarities are the cosine of embeddings: the documents' stored embeddings when
+    they have them, otherwise they are embedded in batches with `embedder`.
+    """
+
+    # Embedder of the query and of documents without embeddings
+    # Must be the embedder of the vector db, for the embeddings to be comparable
+    embedder: Embedder
+    # Weight of the relevance to the query against the diversity of the results,
+    # 1.0 ranks by relevance only
+    lambda_mult: float = 0.5
+    uses_embeddings: ClassVar[bool] = True
+
+    def rerank(
+        self,
+        query: str,
+        documents: list[Document],
+        top_n: int | None = None,
+    ) -> list[Document]:
+        start = monotonic()
+        query_embedding = as_float32(self.embedder.get_embedding(query))
+        if len(query_embedding) == 0 or len(documents) == 0:
+            return documents[:top_n]
+
+        # The documents are not modified, they may be cached search results
+        embeddings: list[Any] = [document.embedding for document in documents]
+        missing = [
+            i for i, embedding in enumerate(embeddings) if not has_embedding(embedding)
+        ]
+        if missing:
+            for i, embedding in zip(
+                missing,
+                self.embedder.get_embedding_arrays(
+                    [documents[i].content for i in missing],
+                ),
+                strict=True,
+            ):
+                embeddings[i] = embedding
+        if not all(has_embedding(embedding) for embedding in embeddings):
+            logger.warning("Could not embed the documents to rerank")
+            return documents[:top_n]
+
+        vectors = normalize(np.asarray([as_float32(e) for e in embeddings]))
+        relevance = vectors @ normalize(query_embedding)
+        similarity = vectors @ vectors.T
+
+        num_selected = len(documents) if top_n is None else min(top_n, len(documents))
+        selected: list[int] = []
+        # Highest similarity of each document to the selected documents
+        max_similarity = np.full(len(documents), -np.inf, dtype=np.float32)
+        available = np.ones(len(documents), dtype=bool)
+        while len(selected) < num_selected:
+            if self.latency_budget is not None and (
+                monotonic() - start > self.latency_budget
+            ):
+                # Fill the remaining places by relevance
+                remaining = np.flatnonzero(available)
+                order = remaining[np.argsort(-relevance[remaining], kind="stable")]
+                selected.extend(order[: num_selected - len(selected)].tolist())
+                break
+            penalty = np.where(np.isfinite(max_similarity), max_similarity, 0)
+            scores = self.lambda_mult * relevance - (1 - self.lambda_mult) * penalty
+            best = int(np.argmax(np.where(available, scores, -np.inf)))
+            selected.append(best)
+            available[best] = False
+            max_similarity = np.maximum(max_similarity, similarity[best])
+        return [documents[i] for i in selected]
+
+
+def has_embedding(embedding: Any) -> bool:
+    return embedding is not None and len(embedding) > 0
+
+
+def normalize(vectors: np.ndarray) -> np.ndarray:
+    """Returns the vectors scaled to unit length, zero vectors are unchanged"""
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.where(norms > 0, norms, 1)
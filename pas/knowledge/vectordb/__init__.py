@@ -1,3 +1,4 @@
 from pas.knowledge.vectordb.base import VectorDb, Distance
+from pas.knowledge.vectordb.filters import Filters
 
-__all__ = ["VectorDb", "Distance"]
+__all__ = ["VectorDb", "Distance", "Filters"]
@@ -1,22 +1,49 @@
+import asyncio
 from abc import ABC, abstractmethod
+from hashlib import md5
 from enum import Enum
-from typing import TYPE_CHECKING
+from typing import TYPE_CHECKING, Any
+
+from pas.knowledge.vectordb.filters import Filters
 
 if TYPE_CHECKING:
     from pas.knowledge.document import Document
+    from pas.knowledge.embedder import Embedder
 
 
 class VectorDb(ABC):
     """Base class for managing Vector Databases"""
 
+    # Embedder for embedding the document contents
+    embedder: "Embedder | None" = None
+    # Incremented whenever documents are written or removed,
+    # e.g. to invalidate cached search results
+    version: int = 0
+
+    def mark_changed(self) -> None:
+        """Record that the documents in the vector db have changed"""
+        self.version += 1
+
     @abstractmethod
     def create(self) -> None:
         raise NotImplementedError
 
+    @staticmethod
+    def doc_id(document: "Document") -> str:
+        """Returns the id of a document in the vector db, the md5 hash of its content"""
+        cleaned_content = document.content.replace("\x00", "\ufffd")
+        return md5(cleaned_content.encode()).hexdigest()
+
     @abstractmethod
     def doc_exists(self, document: "Document") -> bool:
         raise NotImplementedError
 
+    def docs_exist(self, documents: list["Document"]) -> list[bool]:
+        """Check which documents exist, one boolean per document.
+        Vector dbs which support bulk lookups should override this method.
+        """
+        return [self.doc_exists(document) for document in documents]
+
     @abstractmethod
     def name_exists(self, name: str) -> bool:
         raise NotImplementedError
@@ -32,10 +59,94 @@ class VectorDb(ABC):
     def upsert(self, documents: list["Document"]) -> None:
         raise NotImplementedError
 
+    async def ainsert(self, documents: list["Document"]) -> None:
+        """Insert documents without blocking the event loop.
+        New documents are embedded with the async API of the embedder, then the
+        documents are inserted in a thread.
+        """
+        await self._aembed_new_documents(documents)
+        await asyncio.to_thread(self.insert, documents)
+
+    async def aupsert(self, documents: list["Document"]) -> None:
+        """Upsert documents without blocking the event loop, see `ainsert`.
+        Existing documents keep their stored embeddings.
+        """
+        await self._aembed_new_documents(documents)
+        await asyncio.to_thread(self.upsert, documents)
+
+    async def _aembed_new_documents(self, documents: list["Document"]) -> None:
+        """Embed the documents which do not exist and have no embedding yet"""
+        if self.embedder is None:
+            return
+
+        from pas.knowledge.document import Document
+
+        documents_to_embed = [doc for doc in documents if doc.embedding is None]
+        if len(documents_to_embed) == 0:
+            return
+        exist = await asyncio.to_thread(self.docs_exist, documents_to_embed)
+        await Document.aembed_documents(
+            documents=[
+                document
+                for document, exists in zip(documents_to_embed, exist, strict=True)
+                if not exists
+            ],
+            embedder=self.embedder,
+        )
+
+    def get_stored_embeddings(self, documents: list["Document"]) -> dict[str, Any]:
+        """Returns the stored embeddings of the documents which exist, by `doc_id`.
+        Vector dbs which can read back embeddings should override this method.
+        """
+        return {}
+
+    def delete_documents(self, ids: list[str]) -> None:
+        """Delete documents by id, see `doc_id`"""
+        raise NotImplementedError
+
+    def get_ids(self, filters: Filters) -> list[str]:
+        """Returns the ids of the documents matching the filters, see `doc_id`"""
+        raise NotImplementedError
+
     @abstractmethod
-    def search(self, query: str, limit: int = 5) -> list["Document"]:
+    def search(
+        self,
+        query: str,
+        limit: int = 5,
+        filters: Filters | None = None,
+    ) -> list["Document"]:
+        """Returns the documents closest to the query.
+        If filters are provided, only documents whose name and meta data match them
+        are returned, see `filters.Filters`.
+        """
         raise NotImplementedError
 
+    async def asearch(
+        self,
+        query: str,
+        limit: int = 5,
+        filters: Filters | None = None,
+    ) -> list["Document"]:
+        """Returns the documents closest to the query without blocking the event loop.
+        Vector dbs run `search` in a thread unless they override this method.
+        """
+        if not filters:
+            return await asyncio.to_thread(self.search, query, limit)
+        return await asyncio.to_thread(self.search, query, limit, filters)
+
+    def search_many(
+        self,
+        queries: list[str],
+        limit: int = 5,
+        filters: Filters | None = None,
+    ) -> list[list["Document"]]:
+        """Returns the documents closest to each query, in the same order.
+        Vector dbs which support batched queries should override this method.
+        """
+        if not filters:
+            return [self.search(query, limit=limit) for query in queries]
+        return [self.search(query, limit=limit, filters=filters) for query in queries]
+
     @abstractmethod
     def delete(self) -> None:
         raise NotImplementedError
@@ -0,0 +1,239 @@
+import json
+from collections.abc import Callable, Collection, Iterable
+from operator import eq, ge, gt, le, lt, ne
+from typing import Any
+
+import numpy as np
+
+# Filters are Chroma style `where` expressions on the fields of documents:
+# the fields of their meta data, and their name as "name", which takes precedence over
+# a "name" field in the meta data.
+#   {"url": "https://docs.example.com/setup"}
+#   {"page": {"$gte": 2}, "tenant": {"$in": ["acme", "globex"]}}
+#   {"$or": [{"name": "a.pdf"}, {"name": "b.pdf"}]}
+# Several fields in one expression must all match. Documents without a field only
+# match $ne and $nin comparisons on it, like in Chroma.
+Filters = dict[str, Any]
+
+NAME_FIELD = "name"
+# Key of the name in the meta data stored in Chroma, apart from the meta data fields
+STORED_NAME_FIELD = "_pas_name"
+COMPARISONS = {"$eq", "$ne", "$gt", "$gte", "$lt", "$lte", "$in", "$nin"}
+LOGICAL_OPERATORS = {"$and", "$or"}
+# Functions of the comparisons of a stored value with one operand
+COMPARISON_FUNCTIONS: dict[str, Callable[[Any, Any], bool]] = {
+    "$eq": eq,
+    "$ne": ne,
+    "$gt": gt,
+    "$gte": ge,
+    "$lt": lt,
+    "$lte": le,
+}
+# Comparisons which only apply to numbers, like in Chroma
+ORDER_COMPARISONS = {"$gt", "$gte", "$lt", "$lte"}
+
+
+def document_fields(
+    name: str | None,
+    meta_data: dict[str, Any],
+    name_field: str = NAME_FIELD,
+) -> dict[str, Any]:
+    """Returns the fields filters are evaluated on, with values as stored in a
+    vector db: lists and dicts as JSON, fields without a value left out.
+    The name is stored as `name_field`.
+    """
+    fields: dict[str, Any] = {}
+    for key, value in meta_data.items():
+        if value is not None:
+            fields[key] = field_value(value)
+    if name is not None:
+        fields[name_field] = name
+    return fields
+
+
+def field_value(value: Any) -> str | int | float | bool | None:
+    """Returns a value as it is stored and matched, scalar values are unchanged"""
+    if value is None or isinstance(value, str | int | float | bool):
+        return value
+    return json.dumps(value, default=str)
+
+
+def iter_conditions(filters: Filters) -> list[tuple[str, Any]]:
+    """Returns the (field or logical operator, condition) pairs of an expression"""
+    if not isinstance(filters, dict):
+        raise ValueError(f"Expected a dict filter expression, got {filters!r}")
+    conditions = list(filters.items())
+    for key, condition in conditions:
+        if key.startswith("$") and key not in LOGICAL_OPERATORS:
+            raise ValueError(f"Unknown logical operator: {key}")
+        if key in LOGICAL_OPERATORS and not isinstance(condition, list):
+            raise ValueError(f"{key} expects a list of expressions")
+    return conditions
+
+
+def comparisons(condition: Any) -> list[tuple[str, Any]]:
+    """Returns the (operator, value) pairs of a field condition, a value is $eq"""
+    if not isinstance(condition, dict):
+        return [("$eq", condition)]
+    for operator in condition:
+        if operator not in COMPARISONS:
+            raise ValueError(f"Unknown comparison operator: {operator}")
+    return list(condition.items())
+
+
+def compare(value: Any, operator: str, operand: Any) -> bool:
+    """Returns True if a stored value satisfies a comparison"""
+    if operator in ("$in", "$nin"):
+        operands = [field_value(v) for v in operand]
+        return (value in operands) == (operator == "$in")
+    operand = field_value(operand)
+    if operator in ORDER_COMPARISONS and not (is_number(value) and is_number(operand)):
+        return False
+    return COMPARISON_FUNCTIONS[operator](value, operand)
+
+
+def is_number(value: Any) -> bool:
+    return isinstance(value, int | float) and not isinstance(value, bool)
+
+
+def to_chroma_where(filters: Filters) -> dict[str, Any]:
+    """Returns the filters as a Chroma `where` clause.
+    Chroma expects a single field per expression, so several fields are joined
+    with $and, as are several operators on one field. The name is matched on the
+    key it is stored as, see `STORED_NAME_FIELD`.
+    """
+    expressions: list[dict[str, Any]] = []
+    for key, condition in iter_conditions(filters):
+        if key in LOGICAL_OPERATORS:
+            clauses = [to_chroma_where(expression) for expression in condition]
+            # Chroma rejects $and and $or with fewer than two expressions
+            if len(clauses) == 1:
+                expressions.append(clauses[0])
+            elif clauses:
+                expressions.append({key: clauses})
+            continue
+        for operator, operand in comparisons(condition):
+            value = (
+                [field_value(v) for v in operand]
+                if operator in ("$in", "$nin")
+                else field_value(operand)
+            )
+            field = STORED_NAME_FIELD if key == NAME_FIELD else key
+            expressions.append({field: {operator: value}})
+    if len(expressions) == 1:
+        return expressions[0]
+    return {"$and": expressions}
+
+
+class FieldIndex:
+    def __init__(self):
+        """
+        Inverted index of document fields for local vector dbs: the set of rows with
+        each value of each field, so filters are evaluated on the matching rows instead
+        of a scan of all documents. Conditions are combined as boolean masks of rows,
+        so negations do not go through the rows in Python.
+        """
+        # Rows by field and value
+        self._rows: dict[str, dict[Any, set[int]]] = {}
+        # Fields of each row, to remove it
+        self._fields: dict[int, dict[str, Any]] = {}
+        # Mask of the indexed rows, grown as rows are added
+        self._indexed: np.ndarray = np.zeros(0, dtype=bool)
+
+    def __len__(self) -> int:
+        return len(self._fields)
+
+    @staticmethod
+    def _key(value: Any) -> tuple[bool, Any]:
+        # True and 1 are equal dict keys, booleans are kept apart
+        return isinstance(value, bool), value
+
+    def add(self, row: int, fields: dict[str, Any]) -> None:
+        """Index the fields of a row, see `document_fields`"""
+        self.remove(row)
+        if row >= len(self._indexed):
+            indexed = np.zeros(max(row + 1, 2 * len(self._indexed)), dtype=bool)
+            indexed[: len(self._indexed)] = self._indexed
+            self._indexed = indexed
+        self._indexed[row] = True
+        self._fields[row] = fields
+        for field, value in fields.items():
+            self._rows.setdefault(field, {}).setdefault(self._key(value), set()).add(
+                row
+            )
+
+    def remove(self, row: int) -> None:
+        fields = self._fields.pop(row, None)
+        if fields is None:
+            return
+        self._indexed[row] = False
+        for field, value in fields.items():
+            values = self._rows[field]
+            rows = values[self._key(value)]
+            rows.discard(row)
+            if not rows:
+                del values[self._key(value)]
+                if not values:
+                    del self._rows[field]
+
+    def clear(self) -> None:
+        self._rows = {}
+        self._fields = {}
+        self._indexed = np.zeros(0, dtype=bool)
+
+    def rows(self, filters: Filters) -> np.ndarray:
+        """Returns the indexed rows matching the filters, in ascending order"""
+        return np.flatnonzero(self.mask(filters))
+
+    def mask(self, filters: Filters) -> np.ndarray:
+        """Returns a boolean mask of the indexed rows matching the filters.
+        Rows past the end of the mask are not indexed.
+        """
+        matching: np.ndarray | None = None
+        for key, condition in iter_conditions(filters):
+            if key == "$and":
+                mask = self._intersect([self.mask(e) for e in condition])
+            elif key == "$or":
+                mask = np.zeros(len(self._indexed), dtype=bool)
+                for expression in condition:
+                    mask |= self.mask(expression)
+            else:
+                mask = self._intersect(
+                    [
+                        self._comparison_mask(key, operator, operand)
+                        for operator, operand in comparisons(condition)
+                    ],
+                )
+            matching = mask if matching is None else matching & mask
+        return self._indexed.copy() if matching is None else matching
+
+    def _intersect(self, masks: list[np.ndarray]) -> np.ndarray:
+        if not masks:
+            return self._indexed.copy()
+        mask = masks[0]
+        for other in masks[1:]:
+            mask &= other
+        return mask
+
+    def _rows_mask(self, row_sets: Iterable[Collection[int]]) -> np.ndarray:
+        mask = np.zeros(len(self._indexed), dtype=bool)
+        for rows in row_sets:
+            mask[np.fromiter(rows, dtype=np.int64, count=len(rows))] = True
+        return mask
+
+    def _comparison_mask(self, field: str, operator: str, operand: Any) -> np.ndarray:
+        values = self._rows.get(field, {})
+        if operator in ("$eq", "$ne"):
+            mask = self._rows_mask([values.get(self._key(field_value(operand)), ())])
+            return mask if operator == "$eq" else self._indexed & ~mask
+        if operator in ("$in", "$nin"):
+            mask = self._rows_mask(
+                values.get(self._key(field_value(v)), ()) for v in operand
+            )
+            return mask if operator == "$in" else self._indexed & ~mask
+        # Range comparisons check each distinct value of the field
+        return self._rows_mask(
+            rows
+            for (_, value), rows in values.items()
+            if compare(value, operator, operand)
+        )
@@ -0,0 +1,236 @@
+from pathlib import Path
+from threading import Thread
+from typing import Any
+
+import numpy as np
+
+from pas.knowledge.embedder import Embedder
+from pas.knowledge.vectordb.base import Distance
+from pas.knowledge.vectordb.numpy import NumpyVectorDb
+from pas.utils.log import logger
+
+
+class IVFVectorDb(NumpyVectorDb):
+    def __init__(
+        self,
+        collection: str,
+        embedder: Embedder,
+        nlist: int | None = None,
+        nprobe: int = 8,
+        train_size: int = 64,
+        num_iterations: int = 10,
+        background_rebuild: bool = True,
+        **kwargs,
+    ):
+        """
+        In-process vector db with an IVF-Flat approximate nearest neighbour index.
+
+        Embeddings are clustered with k-means, and a search only scores the documents
+        in the `nprobe` clusters closest to the query. Until the index is built with
+        `build_index()` or `optimize()`, searches scan all embeddings.
+
+        New documents are assigned to the closest existing cluster. `optimize()`,
+        called by `AssistantKnowledge.load` after `optimize_on` documents, rebuilds the
+        clusters in a background thread while searches keep using the current index.
+
+        Other keyword arguments are passed to `NumpyVectorDb`.
+
+        :param nlist: The number of clusters, defaults to 4 * sqrt(number of documents).
+        :param nprobe: The number of clusters searched per query.
+        :param train_size: The number of documents sampled per cluster to train k-means.
+        :param num_iterations: The number of k-means iterations.
+        :param background_rebuild: If True, `optimize()` rebuilds the index in a thread.
+        """
+        super().__init__(collection=collection, embedder=embedder, **kwargs)
+        self.nlist: int | None = nlist
+        self.nprobe: int = nprobe
+        self.train_size: int = train_size
+        self.num_iterations: int = num_iterations
+        self.background_rebuild: bool = background_rebuild
+        # Random seed for sampling and initializing k-means
+        self.seed: int = 0
+
+        # Cluster centroids, None until the index is built
+        self._centroids: np.ndarray | None = None
+        # Rows of each cluster, new rows are buffered in `_pending` until searched
+        self._lists: list[np.ndarray] = []
+        self._pending: list[list[int]] = []
+        self._rebuild_thread: Thread | None = None
+
+    @property
+    def is_indexed(self) -> bool:
+        return self._centroids is not None
+
+    @property
+    def _centroids_file(self) -> Path:
+        return self.collection_path / "ivf_centroids.npy"  # type: ignore
+
+    def _centroid_scores(
+        self,
+        vectors: np.ndarray,
+        centroids: np.ndarray,
+    ) -> np.ndarray:
+        """Returns the similarity of vectors to centroids, higher is closer"""
+        scores = vectors @ centroids.T
+        if self.distance == Distance.l2:
+            # Ranking by -||c||^2 + 2 v.c is the same as ranking by -||v - c||^2
+            scores = 2 * scores - np.einsum("ij,ij->i", centroids, centroids)
+        return scores
+
+    def _assign(self, vectors: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+        """Returns the closest centroid of each vector, in chunks to bound memory"""
+        assignments = np.empty(len(vectors), dtype=np.int64)
+        chunk_size = max(1, 2**22 // max(len(centroids), 1))
+        for start in range(0, len(vectors), chunk_size):
+            chunk = vectors[start : start + chunk_size]
+            assignments[start : start + chunk_size] = np.argmax(
+                self._centroid_scores(chunk, centroids),
+                axis=1,
+            )
+        return assignments
+
+    def _train(self, vectors: np.ndarray, nlist: int) -> np.ndarray:
+        """Train k-means centroids on a sample of vectors"""
+        rng = np.random.default_rng(self.seed)
+        sample_size = min(len(vectors), nlist * self.train_size)
+        sample = vectors[rng.choice(len(vectors), size=sample_size, replace=False)]
+        centroids = sample[rng.choice(len(sample), size=nlist, replace=False)].copy()
+        for _ in range(self.num_iterations):
+            assignments = self._assign(sample, centroids)
+            counts = np.bincount(assignments, minlength=nlist)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assignments, sample)
+            non_empty = counts > 0
+            centroids[non_empty] = sums[non_empty] / counts[non_empty, None]
+            # Re-seed empty clusters with random samples
+            num_empty = int((~non_empty).sum())
+            if num_empty > 0:
+                centroids[~non_empty] = sample[rng.choice(len(sample), size=num_empty)]
+            if self.distance == Distance.cosine:
+                norms = np.linalg.norm(centroids, axis=1, keepdims=True)
+                centroids = centroids / np.where(norms == 0, 1, norms)
+        return centroids.astype(np.float32)
+
+    def _set_index(self, centroids: np.ndarray, assignments: np.ndarray) -> None:
+        """Replace the index with clusters for the first `len(assignments)` rows"""
+        order = np.argsort(assignments, kind="stable")
+        bounds = np.searchsorted(assignments[order], np.arange(len(centroids) + 1))
+        self._lists = [order[bounds[i] : bounds[i + 1]] for i in range(len(centroids))]
+        self._pending = [[] for _ in range(len(centroids))]
+        self._centroids = centroids
+
+    def build_index(self) -> None:
+        """Build the IVF index from the embeddings in the collection"""
+        with self._lock:
+            if self._embeddings is None:
+                logger.warning("Collection does not exist")
+                return
+            num_rows = self._size
+            # Existing rows are never rewritten, so they can be read without the lock
+            # Deleted rows are kept in the clusters and skipped when searched
+            embeddings = self._embeddings[:num_rows]
+
+        nlist = self.nlist or int(4 * np.sqrt(len(self._rows)))
+        nlist = min(nlist, num_rows)
+        if nlist < 2:  # noqa: PLR2004
+            logger.debug("Not enough documents to build an index")
+            return
+
+        logger.debug(f"Building IVF index with {nlist} clusters over {num_rows} rows")
+        centroids = self._train(embeddings, nlist)
+        assignments = self._assign(embeddings, centroids)
+
+        with self._lock:
+            if self._embeddings is None or self._size < num_rows:
+                logger.debug("Collection changed while building the index")
+                return
+            # Rows inserted while training are assigned to the new clusters
+            if self._size > num_rows:
+                new_rows = np.array(self._embeddings[num_rows : self._size])  # type: ignore
+                assignments = np.concatenate(
+                    [assignments, self._assign(new_rows, centroids)],
+                )
+            self._set_index(centroids, assignments)
+            if self.collection_path is not None:
+                np.save(self._centroids_file, centroids)
+        logger.debug("Built IVF index")
+
+    def wait_for_index(self) -> None:
+        """Block until a background index rebuild is finished"""
+        if self._rebuild_thread is not None:
+            self._rebuild_thread.join()
+
+    def optimize(self) -> None:
+        """Compact the collection, rebuild the IVF index and train the quantizer."""
+        if self._rebuild_thread is not None and self._rebuild_thread.is_alive():
+            logger.debug("IVF index rebuild already running")
+            return
+
+        # Compaction renumbers rows, so the current index is dropped with it
+        with self._lock:
+            if self._embeddings is not None and len(self._rows) != self._size:
+                self.compact()
+                self._drop_index()
+
+        if self.background_rebuild:
+            self._rebuild_thread = Thread(
+                target=self._rebuild,
+                name="ivf-rebuild",
+                daemon=True,
+            )
+            self._rebuild_thread.start()
+        else:
+            self._rebuild()
+
+    def _rebuild(self) -> None:
+        self.build_index()
+        self.train_quantizer()
+
+    def _drop_index(self) -> None:
+        self._centroids = None
+        self._lists = []
+        self._pending = []
+
+    def _reset(self) -> None:
+        super()._reset()
+        self._drop_index()
+
+    def _load(self) -> None:
+        super()._load()
+        if self.collection_path is None or not self._centroids_file.exists():
+            return
+        centroids = np.load(self._centroids_file)
+        if centroids.ndim != 2 or centroids.shape[1] != self.dimensions:  # noqa: PLR2004
+            logger.warning("Ignoring IVF centroids with different dimensions")
+            return
+        embeddings = self._embeddings[: self._size]  # type: ignore
+        self._set_index(centroids, self._assign(embeddings, centroids))
+
+    def _set_vectors(self, rows: list[int], vectors: np.ndarray) -> None:
+        super()._set_vectors(rows, vectors)
+        if self._centroids is None:
+            return
+        stored = self._embeddings[np.asarray(rows)]  # type: ignore
+        for row, cluster in zip(
+            rows, self._assign(stored, self._centroids), strict=True
+        ):
+            self._pending[cluster].append(row)
+
+    def candidate_rows(self, query_embedding: Any) -> np.ndarray | None:
+        if self._centroids is None:
+            return None
+
+        query = np.asarray(query_embedding, dtype=np.float32)
+        if self.distance == Distance.cosine:
+            query_norm = np.linalg.norm(query)
+            query = query / (query_norm if query_norm > 0 else 1)
+        scores = self._centroid_scores(query[None, :], self._centroids)[0]
+        nprobe = min(self.nprobe, len(self._centroids))
+        probes = np.argpartition(-scores, nprobe - 1)[:nprobe]
+        for cluster in probes:
+            if self._pending[cluster]:
+                self._lists[cluster] = np.concatenate(
+                    [self._lists[cluster], self._pending[cluster]],
+                ).astype(np.int64)
+                self._pending[cluster] = []
+        return np.concatenate([self._lists[cluster] for cluster in probes])
@@ -0,0 +1,956 @@
+import asyncio
+import json
+import shutil
+from pathlib import Path
+from threading import RLock
+from typing import Any
+
+import numpy as np
+
+from pas.knowledge.document import Document
+from pas.knowledge.embedder import Embedder
+from pas.knowledge.vectordb.base import Distance, VectorDb
+from pas.knowledge.vectordb.filters import FieldIndex, Filters, document_fields
+from pas.knowledge.vectordb.quantization import Quantizer
+from pas.utils.log import logger
+
+
+class NumpyVectorDb(VectorDb):
+    def __init__(
+        self,
+        collection: str,
+        embedder: Embedder,
+        distance: Distance = Distance.cosine,
+        path: str | None = None,
+        mmap: bool = False,
+        initial_capacity: int = 1024,
+        quantizer: Quantizer | None = None,
+        rerank_factor: int = 10,
+    ):
+        """
+        In-process vector db keeping embeddings in a contiguous float32 matrix.
+
+        Search is an exact, vectorized scan of all embeddings, suited to knowledge
+        bases up to a few hundred thousand documents.
+
+        If a path is provided, the collection is stored in `{path}/{collection}`:
+        embeddings in a raw float32 file and documents in a JSON lines log.
+        Writes only append to these files, `optimize()` compacts them.
+
+        With a quantizer, `optimize()` also trains it and searches scan the compact
+        codes, then re-rank `limit * rerank_factor` candidates with the float32
+        embeddings. Persisted collections then memory-map the float32 embeddings,
+        so only the codes are held in memory.
+
+        :param collection: The name of the collection.
+        :param embedder: The embedder for embedding the document contents.
+        :param distance: The distance metric used for search.
+        :param path: The directory to persist the collection in, in memory only if None.
+        :param mmap: If True, embeddings are memory-mapped from disk instead of loaded.
+        :param initial_capacity: The number of embeddings allocated up front.
+        :param quantizer: Optional quantizer, e.g. `ScalarQuantizer` or `ProductQuantizer`.
+        :param rerank_factor: The number of candidates re-ranked per result with a quantizer.
+        """
+        # Collection attributes
+        self.collection: str = collection
+
+        # Embedder for embedding the document contents
+        self.embedder: Embedder = embedder
+
+        # Distance metric
+        self.distance: Distance = distance
+
+        # Persistence attributes
+        self.path: str | None = path
+        self.mmap: bool = mmap and path is not None
+        self.initial_capacity: int = initial_capacity
+
+        # Quantization attributes
+        self.quantizer: Quantizer | None = quantizer
+        if quantizer is not None:
+            quantizer.check_dimensions(self.dimensions)
+        self.rerank_factor: int = rerank_factor
+        # Number of stored embeddings searched to measure the recall of the codes
+        self.num_recall_queries: int = 20
+        # Quantized codes, only set once the quantizer is trained
+        self._codes: np.ndarray | None = None
+
+        # Embedding matrix, only the first `_size` rows are in use
+        self._embeddings: np.ndarray | None = None
+        # Squared norms of the embeddings, used for l2 distance
+        self._sq_norms: np.ndarray | None = None
+        # False for rows of deleted documents
+        self._alive: np.ndarray | None = None
+        self._size: int = 0
+
+        # Document attributes by row
+        self._ids: list[str | None] = []
+        self._contents: list[str | None] = []
+        self._names: list[str | None] = []
+        self._meta_data: list[dict[str, Any] | None] = []
+        # Row of each document id
+        self._rows: dict[str, int] = {}
+        # Number of documents with each name
+        self._name_counts: dict[str, int] = {}
+        # Rows by value of the name and meta data fields, to evaluate filters
+        self._field_index: FieldIndex = FieldIndex()
+
+        self._lock = RLock()
+
+    @property
+    def dimensions(self) -> int:
+        return self.embedder.dimensions
+
+    @property
+    def collection_path(self) -> Path | None:
+        if self.path is None:
+            return None
+        return Path(self.path) / self.collection
+
+    @property
+    def _embeddings_file(self) -> Path:
+        return self.collection_path / "embeddings.f32"  # type: ignore
+
+    @property
+    def _documents_file(self) -> Path:
+        return self.collection_path / "documents.jsonl"  # type: ignore
+
+    @property
+    def _manifest_file(self) -> Path:
+        return self.collection_path / "manifest.json"  # type: ignore
+
+    @property
+    def _codes_file(self) -> Path:
+        return self.collection_path / "codes.bin"  # type: ignore
+
+    @property
+    def _quantizer_file(self) -> Path:
+        return self.collection_path / "quantizer.npz"  # type: ignore
+
+    def create(self) -> None:
+        """Create the collection, or load it from disk if it exists."""
+        with self._lock:
+            if self._embeddings is not None:
+                return
+
+            if self.exists():
+                self._load()
+                return
+
+            logger.debug(f"Creating collection: {self.collection}")
+            if self.collection_path is not None:
+                self.collection_path.mkdir(parents=True, exist_ok=True)
+                self._manifest_file.write_text(
+                    json.dumps(
+                        {
+                            "dimensions": self.dimensions,
+                            "distance": self.distance.value,
+                        },
+                    ),
+                )
+                self._embeddings_file.touch()
+                self._documents_file.touch()
+            self._allocate(self.initial_capacity)
+
+    def _allocate(self, capacity: int, mapped: bool = False) -> None:
+        """Allocate the embedding matrix with room for `capacity` rows.
+        The embeddings file is memory-mapped with `mmap`, if `mapped` is True, or if
+        the embeddings are already mapped.
+        """
+        capacity = max(capacity, 1)
+        if mapped or self.mmap or isinstance(self._embeddings, np.memmap):
+            if isinstance(self._embeddings, np.memmap):
+                self._embeddings.flush()
+            # Grow the file, then map the full capacity
+            with self._embeddings_file.open("r+b") as f:
+                f.truncate(capacity * self.dimensions * 4)
+            embeddings = np.memmap(
+                self._embeddings_file,
+                dtype=np.float32,
+                mode="r+",
+                shape=(capacity, self.dimensions),
+            )
+        else:
+            embeddings = np.zeros((capacity, self.dimensions), dtype=np.float32)
+            if self._embeddings is not None:
+                num_rows = min(len(self._embeddings), capacity)
+                embeddings[:num_rows] = self._embeddings[:num_rows]
+
+        sq_norms = np.zeros(capacity, dtype=np.float32)
+        alive = np.zeros(capacity, dtype=bool)
+        if self._sq_norms is not None and self._alive is not None:
+            num_rows = min(len(self._sq_norms), capacity)
+            sq_norms[:num_rows] = self._sq_norms[:num_rows]
+            alive[:num_rows] = self._alive[:num_rows]
+
+        self._embeddings = embeddings
+        self._sq_norms = sq_norms
+        self._alive = alive
+
+        if self._codes is not None:
+            codes = np.zeros((capacity, self._codes.shape[1]), dtype=self._codes.dtype)
+            num_rows = min(len(self._codes), capacity)
+            codes[:num_rows] = self._codes[:num_rows]
+            self._codes = codes
+
+    def _load(self) -> None:
+        """Load the collection from disk, replaying the documents log"""
+        logger.debug(f"Loading collection: {self.collection}")
+        manifest = json.loads(self._manifest_file.read_text())
+        if manifest.get("dimensions") != self.dimensions:
+            raise ValueError(
+                f"Collection {self.collection} has {manifest.get('dimensions')} "
+                f"dimensions, embedder has {self.dimensions}",
+            )
+
+        with self._documents_file.open(encoding="utf-8") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                entry = json.loads(line)
+                row = entry["row"]
+                while len(self._ids) <= row:
+                    self._append_row_attributes()
+                if entry.get("deleted"):
+                    self._remove_row_attributes(row)
+                else:
+                    self._set_row_attributes(
+                        row,
+                        doc_id=entry["id"],
+                        content=entry["content"],
+                        name=entry.get("name"),
+                        meta_data=entry.get("meta_data") or {},
+                    )
+        self._size = len(self._ids)
+
+        stored_rows = self._embeddings_file.stat().st_size // (self.dimensions * 4)
+        capacity = max(self._size, self.initial_capacity)
+        # With saved codes, the float32 embeddings are only read to re-rank
+        quantized = self.quantizer is not None and self._quantizer_file.exists()
+        if self.mmap or quantized:
+            self._allocate(max(capacity, stored_rows), mapped=True)
+        else:
+            self._allocate(capacity)
+            stored = np.fromfile(self._embeddings_file, dtype=np.float32)
+            stored = stored.reshape(-1, self.dimensions)[: self._size]
+            self._embeddings[: len(stored)] = stored  # type: ignore
+
+        embeddings = self._embeddings[: self._size]  # type: ignore
+        self._sq_norms[: self._size] = np.einsum("ij,ij->i", embeddings, embeddings)  # type: ignore
+        self._alive[: self._size] = [doc_id is not None for doc_id in self._ids]  # type: ignore
+        self._load_codes()
+
+    def _load_codes(self) -> None:
+        """Load the trained quantizer and codes saved with the collection"""
+        if self.quantizer is None or not self._quantizer_file.exists():
+            return
+
+        with np.load(self._quantizer_file) as state:
+            self.quantizer.load_state(dict(state))
+        codes = np.zeros(
+            (len(self._embeddings), self.quantizer.code_size),  # type: ignore
+            dtype=self.quantizer.dtype,
+        )
+        stored = np.fromfile(self._codes_file, dtype=self.quantizer.dtype)
+        stored = stored.reshape(-1, self.quantizer.code_size)[: self._size]
+        codes[: len(stored)] = stored
+        # Encode rows whose codes were not saved
+        if len(stored) < self._size:
+            codes[len(stored) : self._size] = self.quantizer.encode_chunked(
+                self._embeddings[len(stored) : self._size],  # type: ignore
+            )
+        self._codes = codes
+
+    def _append_row_attributes(self) -> None:
+        self._ids.append(None)
+        self._contents.append(None)
+        self._names.append(None)
+        self._meta_data.append(None)
+
+    def _set_row_attributes(
+        self,
+        row: int,
+        doc_id: str,
+        content: str,
+        name: str | None,
+        meta_data: dict[str, Any],
+    ) -> None:
+        self._remove_row_attributes(row)
+        self._ids[row] = doc_id
+        self._contents[row] = content
+        self._names[row] = name
+        self._meta_data[row] = meta_data
+        self._rows[doc_id] = row
+        if name is not None:
+            self._name_counts[name] = self._name_counts.get(name, 0) + 1
+        self._field_index.add(row, document_fields(name, meta_data))
+
+    def _remove_row_attributes(self, row: int) -> None:
+        doc_id = self._ids[row]
+        if doc_id is None:
+            return
+        name = self._names[row]
+        if name is not None:
+            self._name_counts[name] -= 1
+            if self._name_counts[name] == 0:
+                del self._name_counts[name]
+        self._rows.pop(doc_id, None)
+        self._field_index.remove(row)
+        self._ids[row] = None
+        self._contents[row] = None
+        self._names[row] = None
+        self._meta_data[row] = None
+
+    def doc_exists(self, document: Document) -> bool:
+        """Check if a document exists in the collection."""
+        return self.doc_id(document) in self._rows
+
+    def docs_exist(self, documents: list[Document]) -> list[bool]:
+        """Check which documents exist in the collection."""
+        return [self.doc_id(document) in self._rows for document in documents]
+
+    def get_stored_embeddings(self, documents: list[Document]) -> dict[str, np.ndarray]:
+        """Get the stored embeddings of documents which exist, as float32 arrays.
+        Embeddings are normalized for the cosine distance.
+        """
+        with self._lock:
+            rows = {
+                doc_id: row
+                for doc_id in map(self.doc_id, documents)
+                if (row := self._rows.get(doc_id)) is not None
+            }
+            return {
+                doc_id: np.array(self._embeddings[row])  # type: ignore
+                for doc_id, row in rows.items()
+            }
+
+    def name_exists(self, name: str) -> bool:
+        """Check if a document with a given name exists in the collection."""
+        return name in self._name_counts
+
+    def get_count(self) -> int:
+        """Get the count of documents in the collection."""
+        return len(self._rows)
+
+    def _write(self, documents: list[Document], skip_existing: bool) -> int:
+        """Embed and store documents, returns the number of documents written"""
+        if self._embeddings is None:
+            logger.error("Collection does not exist")
+            return 0
+
+        documents_to_write: dict[str, Document] = {}
+        for document in documents:
+            doc_id = self.doc_id(document)
+            if doc_id in documents_to_write or (skip_existing and doc_id in self._rows):
+                continue
+            documents_to_write[doc_id] = document
+
+        # Documents which exist with identical content keep their stored embeddings
+        Document.embed_documents(
+            documents=[
+                document
+                for doc_id, document in documents_to_write.items()
+                if document.embedding is None and doc_id not in self._rows
+            ],
+            embedder=self.embedder,
+        )
+
+        with self._lock:
+            # Embeddings of new documents are checked before any state is changed,
+            # so a failed write leaves the collection as it was
+            new_ids: list[str] = []
+            for doc_id, document in documents_to_write.items():
+                if doc_id in self._rows:
+                    continue
+                if document.embedding is None or len(document.embedding) == 0:
+                    logger.warning(f"Skipping document without embedding: {doc_id}")
+                    continue
+                new_ids.append(doc_id)
+            vectors = self._check_vectors(
+                [documents_to_write[doc_id].embedding for doc_id in new_ids],
+            )
+            new_rows = {
+                doc_id: self._size + position for position, doc_id in enumerate(new_ids)
+            }
+
+            if new_ids:
+                self._size += len(new_ids)
+                for _ in new_ids:
+                    self._append_row_attributes()
+                self._set_vectors(list(new_rows.values()), vectors)
+            entries: list[str] = []
+            for doc_id, document in documents_to_write.items():
+                row = self._rows.get(doc_id, new_rows.get(doc_id))
+                if row is None:
+                    continue
+                cleaned_content = document.content.replace("\x00", "\ufffd")
+                self._set_row_attributes(
+                    row,
+                    doc_id=doc_id,
+                    content=cleaned_content,
+                    name=document.name,
+                    meta_data=document.meta_data,
+                )
+                entries.append(
+                    json.dumps(
+                        {
+                            "row": row,
+                            "id": doc_id,
+                            "content": cleaned_content,
+                            "name": document.name,
+                            "meta_data": document.meta_data,
+                        },
+                        default=str,
+                    ),
+                )
+
+            self._append_log(entries)
+            if entries:
+                self.mark_changed()
+        return len(entries)
+
+    def _check_vectors(self, embeddings: list[Any]) -> np.ndarray:
+        """Returns the embeddings as a float32 matrix, raises a ValueError if they do
+        not all have `dimensions` dimensions
+        """
+        if len(embeddings) == 0:
+            return np.empty((0, self.dimensions), dtype=np.float32)
+        try:
+            vectors = np.asarray(embeddings, dtype=np.float32)
+        except ValueError:
+            # Embeddings of different lengths
+            vectors = None
+        if vectors is None or vectors.ndim != 2 or vectors.shape[1] != self.dimensions:  # noqa: PLR2004
+            lengths = sorted({len(embedding) for embedding in embeddings})
+            raise ValueError(
+                f"Expected embeddings with {self.dimensions} dimensions, got {lengths}",
+            )
+        return vectors
+
+    def _set_vectors(self, rows: list[int], vectors: np.ndarray) -> None:
+        """Store vectors at the given rows, growing the matrix if needed"""
+        if self._size > len(self._embeddings):  # type: ignore
+            self._allocate(max(self._size, 2 * len(self._embeddings)))  # type: ignore
+
+        if self.distance == Distance.cosine:
+            norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+            vectors = vectors / np.where(norms == 0, 1, norms)
+
+        index = np.asarray(rows)
+        self._embeddings[index] = vectors  # type: ignore
+        self._sq_norms[index] = np.einsum("ij,ij->i", vectors, vectors)  # type: ignore
+        self._alive[index] = True  # type: ignore
+
+        codes = None
+        if self._codes is not None and self.quantizer is not None:
+            codes = self.quantizer.encode_chunked(vectors)
+            self._codes[index] = codes
+
+        if self.collection_path is None:
+            return
+        # New rows are always appended in order, so they form one contiguous block
+        if codes is not None:
+            with self._codes_file.open("r+b") as f:
+                f.seek(rows[0] * codes.shape[1] * codes.itemsize)
+                f.write(codes.tobytes())
+        if isinstance(self._embeddings, np.memmap):
+            self._embeddings.flush()
+            return
+        with self._embeddings_file.open("r+b") as f:
+            f.seek(rows[0] * self.dimensions * 4)
+            f.write(np.ascontiguousarray(vectors, dtype=np.float32).tobytes())
+
+    def _append_log(self, entries: list[str]) -> None:
+        if self.collection_path is None or not entries:
+            return
+        with self._documents_file.open("a", encoding="utf-8") as f:
+            f.write("\n".join(entries) + "\n")
+
+    def insert(self, documents: list[Document]) -> None:
+        """Insert documents into the collection.
+        Documents which already exist in the collection are skipped without embedding.
+        Args:
+            documents (List[Document]): List of documents to insert
+        """
+        logger.debug(f"Inserting {len(documents)} documents")
+        num_written = self._write(documents, skip_existing=True)
+        logger.debug(f"Inserted {num_written} documents")
+
+    def upsert_available(self) -> bool:
+        return True
+
+    def upsert(self, documents: list[Document]) -> None:
+        """Upsert documents into the collection.
+        Documents which already exist keep their embeddings and update their metadata.
+        Args:
+            documents (List[Document]): List of documents to upsert
+        """
+        logger.debug(f"Upserting {len(documents)} documents")
+        num_written = self._write(documents, skip_existing=False)
+        logger.debug(f"Upserted {num_written} documents")
+
+    def delete_documents(self, ids: list[str]) -> None:
+        """Delete documents from the collection by id.
+        Args:
+            ids (List[str]): Ids of the documents to delete
+        """
+        with self._lock:
+            entries: list[str] = []
+            for doc_id in ids:
+                row = self._rows.get(doc_id)
+                if row is None:
+                    continue
+                self._remove_row_attributes(row)
+                self._alive[row] = False  # type: ignore
+                entries.append(json.dumps({"row": row, "deleted": True}))
+            self._append_log(entries)
+            if entries:
+                self.mark_changed()
+        logger.debug(f"Deleted {len(entries)} documents")
+
+    def distances(
+        self,
+        query_embedding: Any,
+        rows: np.ndarray | None = None,
+        approximate: bool = False,
+    ) -> np.ndarray:
+        """Returns the distance of each row to the query, lower is closer.
+        All rows are scored if `rows` is None. Deleted rows have an infinite distance.
+        If `approximate` is True, distances are computed from the quantized codes.
+        A matrix of queries gives a matrix of distances, one row per query.
+        """
+        query = np.asarray(query_embedding, dtype=np.float32)
+        if rows is None:
+            rows = slice(0, self._size)  # type: ignore
+        if approximate:
+            scores = self.quantizer.dot(self._codes[rows], query)  # type: ignore
+        elif query.ndim == 1:
+            scores = self._embeddings[rows] @ query  # type: ignore
+        else:
+            scores = query @ self._embeddings[rows].T  # type: ignore
+        if self.distance == Distance.cosine:
+            query_norms = np.linalg.norm(query, axis=-1, keepdims=True)
+            distances = 1 - scores / np.where(query_norms > 0, query_norms, 1)
+        elif self.distance == Distance.l2:
+            query_sq_norms = np.einsum("...i,...i->...", query, query)
+            distances = (
+                self._sq_norms[rows]  # type: ignore
+                - 2 * scores
+                + np.expand_dims(query_sq_norms, -1)
+            )
+        else:
+            distances = 1 - scores
+        return np.where(self._alive[rows], distances, np.inf)  # type: ignore
+
+    def candidate_rows(self, query_embedding: Any) -> np.ndarray | None:
+        """Returns the rows to score for a query, None to score all rows.
+        Approximate indexes override this to narrow down the search.
+        """
+        return None
+
+    def nearest_rows(
+        self,
+        query_embedding: Any,
+        limit: int,
+        exact: bool = False,
+        rows: np.ndarray | None = None,
+    ) -> np.ndarray:
+        """Returns the rows closest to an embedding, closest first.
+        If `rows` is provided, e.g. the rows matching filters, only these are scored.
+        """
+        if rows is None and not exact:
+            rows = self.candidate_rows(query_embedding)
+        num_shortlisted = limit * self.rerank_factor
+        if (
+            not exact
+            and self._codes is not None
+            and (rows is None or len(rows) > num_shortlisted)
+        ):
+            # Shortlist candidates using the codes, then re-rank them below
+            distances = self.distances(query_embedding, rows=rows, approximate=True)
+            top = top_k(distances, num_shortlisted)
+            rows = top if rows is None else rows[top]
+
+        distances = self.distances(query_embedding, rows=rows)
+        top = top_k(distances, limit)
+        return top if rows is None else rows[top]
+
+    def nearest_rows_many(
+        self,
+        query_embeddings: np.ndarray,
+        limit: int,
+        rows: np.ndarray | None = None,
+    ) -> list[np.ndarray]:
+        """Returns the rows closest to each embedding of a matrix, closest first.
+
+        Without a trained quantizer or index, the queries are scored together, a
+        block of queries at a time, with one matrix product per block.
+        """
+        candidates = (
+            [self.candidate_rows(query) for query in query_embeddings]
+            if rows is None
+            else [rows] * len(query_embeddings)
+        )
+        if self._codes is not None or (
+            rows is None and any(c is not None for c in candidates)
+        ):
+            return [
+                self.nearest_rows(query, limit=limit, rows=query_rows)
+                for query, query_rows in zip(query_embeddings, candidates, strict=True)
+            ]
+
+        num_rows = self._size if rows is None else len(rows)
+        # Bound the distance matrix of a block to about 64MB
+        block_size = max(1, (1 << 24) // max(num_rows, 1))
+        nearest: list[np.ndarray] = []
+        for start in range(0, len(query_embeddings), block_size):
+            distances = self.distances(
+                query_embeddings[start : start + block_size],
+                rows=rows,
+            )
+            for top in top_k_many(distances, limit):
+                nearest.append(top if rows is None else rows[top])
+        return nearest
+
+    def recall(self, query_embeddings: list[Any], k: int = 10) -> float:
+        """Returns the mean recall@k of the search compared to an exact search"""
+        recalls: list[float] = []
+        with self._lock:
+            for query_embedding in query_embeddings:
+                exact = set(self.nearest_rows(query_embedding, limit=k, exact=True))
+                if len(exact) == 0:
+                    continue
+                approximate = set(self.nearest_rows(query_embedding, limit=k))
+                recalls.append(len(exact & approximate) / len(exact))
+        recall = float(np.mean(recalls)) if recalls else 0.0
+        logger.info(f"Recall@{k}: {recall:.3f}")
+        return recall
+
+    def train_quantizer(self) -> None:
+        """Train the quantizer on the embeddings and encode them"""
+        if self.quantizer is None:
+            return
+
+        with self._lock:
+            if self._embeddings is None or len(self._rows) == 0:
+                logger.debug("No documents to train the quantizer on")
+                return
+            num_rows = self._size
+            alive_rows = np.flatnonzero(self._alive[:num_rows])  # type: ignore
+            # Existing rows are never rewritten, so they can be read without the lock
+            embeddings = self._embeddings
+
+        logger.debug(f"Training {self.quantizer.__class__.__name__} on {num_rows} rows")
+        self.quantizer.train(embeddings[alive_rows])
+        codes = np.zeros(
+            (len(embeddings), self.quantizer.code_size),
+            dtype=self.quantizer.dtype,
+        )
+        codes[:num_rows] = self.quantizer.encode_chunked(embeddings[:num_rows])
+
+        with self._lock:
+            if self._embeddings is None or self._size < num_rows:
+                logger.debug("Collection changed while training the quantizer")
+                return
+            if len(codes) < len(self._embeddings):
+                codes = np.concatenate(
+                    [
+                        codes,
+                        np.zeros(
+                            (len(self._embeddings) - len(codes), codes.shape[1]),
+                            dtype=codes.dtype,
+                        ),
+                    ],
+                )
+            # Rows inserted while training
+            if self._size > num_rows:
+                codes[num_rows : self._size] = self.quantizer.encode_chunked(
+                    self._embeddings[num_rows : self._size],
+                )
+            self._codes = codes
+            if self.collection_path is not None:
+                np.savez(self._quantizer_file, **self.quantizer.state())
+                codes[: self._size].tofile(self._codes_file)
+                # The codes are searched, the float32 embeddings are only read to
+                # re-rank, so they are released from memory and read from disk
+                self._allocate(len(self._embeddings), mapped=True)
+            sample_rows = np.random.default_rng(0).choice(
+                alive_rows,
+                size=min(len(alive_rows), self.num_recall_queries),
+                replace=False,
+            )
+            queries = list(np.asarray(self._embeddings[sample_rows]))
+
+        compression = 4 * self.dimensions / (codes.shape[1] * codes.itemsize)
+        recall = self.recall(queries)
+        logger.info(
+            f"Quantized embeddings, {compression:.0f}x smaller than float32, "
+            f"recall@10 {recall:.3f}",
+        )
+
+    def search(
+        self,
+        query: str,
+        limit: int = 5,
+        filters: Filters | None = None,
+    ) -> list[Document]:
+        """Search the collection for a query.
+        Args:
+            query (str): Query to search for.
+            limit (int): Number of results to return.
+            filters (Optional[Dict[str, Any]]): Only return documents matching these
+                filters on their name and meta data, see `filters.Filters`.
+        Returns:
+            List[Document]: List of search results.
+        """
+        query_embedding = self.embedder.get_embedding(query)
+        if query_embedding is None or len(query_embedding) == 0:
+            logger.error(f"Error getting embedding for Query: {query}")
+            return []
+        return self.search_by_embedding(query_embedding, limit=limit, filters=filters)
+
+    async def asearch(
+        self,
+        query: str,
+        limit: int = 5,
+        filters: Filters | None = None,
+    ) -> list[Document]:
+        """Search the collection for a query without blocking the event loop.
+        The query is embedded with the async API of the embedder, and the
+        collection is scanned in a thread, numpy releases the GIL while scoring.
+        """
+        query_embedding = await self.embedder.aget_embedding(query)
+        if query_embedding is None or len(query_embedding) == 0:
+            logger.error(f"Error getting embedding for Query: {query}")
+            return []
+        return await asyncio.to_thread(
+            self.search_by_embedding,
+            query_embedding,
+            limit,
+            filters,
+        )
+
+    def search_many(
+        self,
+        queries: list[str],
+        limit: int = 5,
+        filters: Filters | None = None,
+    ) -> list[list[Document]]:
+        """Search the collection for several queries at once.
+        The queries are embedded in batches and scored together.
+        Args:
+            queries (List[str]): Queries to search for.
+            limit (int): Number of results to return per query.
+            filters (Optional[Dict[str, Any]]): Only return documents matching these
+                filters on their name and meta data, see `filters.Filters`.
+        Returns:
+            List[List[Document]]: Search results of each query, in the same order.
+        """
+        if len(queries) == 0:
+            return []
+        query_embeddings = self.embedder.get_embedding_arrays(queries)
+        for query, query_embedding in zip(queries, query_embeddings, strict=True):
+            if len(query_embedding) == 0:
+                logger.error(f"Error getting embedding for Query: {query}")
+        return self.search_by_embeddings(query_embeddings, limit=limit, filters=filters)
+
+    def search_by_embedding(
+        self,
+        query_embedding: Any,
+        limit: int = 5,
+        filters: Filters | None = None,
+    ) -> list[Document]:
+        """Return the documents closest to an embedding"""
+        if self._embeddings is None:
+            if not self.exists():
+                return []
+            self.create()
+
+        with self._lock:
+            rows = None
+            if filters:
+                # Only the matching rows are scored, so a selective filter costs
+                # about as much as searching a collection of the matching documents
+                rows = self.filtered_rows(filters)
+                if len(rows) == 0:
+                    return []
+            top_rows = self.nearest_rows(query_embedding, limit=limit, rows=rows)
+            return [self._document(int(row)) for row in top_rows]
+
+    def search_by_embeddings(
+        self,
+        query_embeddings: list[Any],
+        limit: int = 5,
+        filters: Filters | None = None,
+    ) -> list[list[Document]]:
+        """Return the documents closest to each embedding.
+        Empty embeddings, e.g. of queries which failed to embed, have no results.
+        """
+        results: list[list[Document]] = [[] for _ in query_embeddings]
+        if self._embeddings is None:
+            if not self.exists():
+                return results
+            self.create()
+
+        positions = [
+            i for i, embedding in enumerate(query_embeddings) if len(embedding)
+        ]
+        if not positions:
+            return results
+        queries = np.asarray([query_embeddings[i] for i in positions], dtype=np.float32)
+        with self._lock:
+            rows = None
+            if filters:
+                rows = self.filtered_rows(filters)
+                if len(rows) == 0:
+                    return results
+            nearest = self.nearest_rows_many(queries, limit=limit, rows=rows)
+            for position, top_rows in zip(positions, nearest, strict=True):
+                results[position] = [self._document(int(row)) for row in top_rows]
+        return results
+
+    def get_ids(self, filters: Filters) -> list[str]:
+        """Get the ids of the documents matching the filters."""
+        with self._lock:
+            return [self._ids[row] for row in self.filtered_rows(filters)]  # type: ignore
+
+    def filtered_rows(self, filters: Filters) -> np.ndarray:
+        """Returns the rows of the documents matching the filters, in ascending order"""
+        with self._lock:
+            return self._field_index.rows(filters)
+
+    def _document(self, row: int) -> Document:
+        # Stored values are already valid, so validation is skipped
+        return Document.model_construct(
+            id=self._ids[row],
+            name=self._names[row],
+            meta_data=dict(self._meta_data[row] or {}),
+            content=self._contents[row] or "",
+        )
+
+    def delete(self) -> None:
+        """Delete the collection."""
+        with self._lock:
+            if self.exists():
+                logger.debug(f"Deleting collection: {self.collection}")
+                if self.collection_path is not None:
+                    # Release the memory map before removing the file
+                    self._embeddings = None
+                    shutil.rmtree(self.collection_path)
+            self._reset()
+            if self.quantizer is not None:
+                self.quantizer.reset()
+            self.mark_changed()
+
+    def _reset(self) -> None:
+        self._embeddings = None
+        self._sq_norms = None
+        self._alive = None
+        self._size = 0
+        self._ids = []
+        self._contents = []
+        self._names = []
+        self._meta_data = []
+        self._rows = {}
+        self._name_counts = {}
+        self._field_index.clear()
+        self._codes = None
+
+    def exists(self) -> bool:
+        """Check if the collection exists."""
+        if self.collection_path is None:
+            return self._embeddings is not None
+        return self._manifest_file.exists()
+
+    def optimize(self) -> None:
+        """Compact the collection and train the quantizer, if any."""
+        self.compact()
+        self.train_quantizer()
+
+    def compact(self) -> None:
+        """Remove deleted rows from memory and disk, renumbering the remaining rows."""
+        with self._lock:
+            if self._embeddings is None or len(self._rows) == self._size:
+                return
+
+            logger.debug(f"Compacting collection: {self.collection}")
+            keep = [row for row in range(self._size) if self._ids[row] is not None]
+            embeddings = np.array(self._embeddings[keep], dtype=np.float32)
+            documents = [
+                (
+                    self._ids[row],
+                    self._contents[row],
+                    self._names[row],
+                    self._meta_data[row],
+                )
+                for row in keep
+            ]
+
+            self._reset()
+            if self.collection_path is not None:
+                # Codes are saved by row, they are encoded again by train_quantizer
+                self._codes_file.unlink(missing_ok=True)
+                self._quantizer_file.unlink(missing_ok=True)
+                embeddings.tofile(self._embeddings_file)
+                with self._documents_file.open("w", encoding="utf-8") as f:
+                    for row, (doc_id, content, name, meta_data) in enumerate(documents):
+                        entry = {
+                            "row": row,
+                            "id": doc_id,
+                            "content": content,
+                            "name": name,
+                            "meta_data": meta_data,
+                        }
+                        f.write(json.dumps(entry, default=str) + "\n")
+                self._load()
+            else:
+                self._allocate(max(len(keep), self.initial_capacity))
+                self._size = len(keep)
+                for row, (doc_id, content, name, meta_data) in enumerate(documents):
+                    self._append_row_attributes()
+                    self._set_row_attributes(
+                        row,
+                        doc_id=doc_id,  # type: ignore
+                        content=content,  # type: ignore
+                        name=name,
+                        meta_data=meta_data or {},
+                    )
+                self._embeddings[: len(keep)] = embeddings  # type: ignore
+                self._sq_norms[: len(keep)] = np.einsum(  # type: ignore
+                    "ij,ij->i",
+                    embeddings,
+                    embeddings,
+                )
+                self._alive[: len(keep)] = True  # type: ignore
+
+    def clear(self) -> bool:
+        """Remove all documents from the collection."""
+        self.delete()
+        self.create()
+        return True
+
+
+def top_k(distances: np.ndarray, k: int) -> np.ndarray:
+    """Returns the positions of the k smallest finite distances, smallest first"""
+    k = min(k, len(distances))
+    if k <= 0:
+        return np.empty(0, dtype=np.int64)
+    top = np.argpartition(distances, k - 1)[:k]
+    top = top[np.argsort(distances[top])]
+    return top[np.isfinite(distances[top])]
+
+
+def top_k_many(distances: np.ndarray, k: int) -> list[np.ndarray]:
+    """Returns `top_k` of each row of a distance matrix"""
+    k = min(k, distances.shape[1])
+    if k <= 0:
+        return [np.empty(0, dtype=np.int64) for _ in range(len(distances))]
+    top = np.argpartition(distances, k - 1, axis=1)[:, :k]
+    top_distances = np.take_along_axis(distances, top, axis=1)
+    order = np.argsort(top_distances, axis=1)
+    top = np.take_along_axis(top, order, axis=1)
+    top_distances = np.take_along_axis(top_distances, order, axis=1)
+    return [
+        row_top[np.isfinite(row_distances)]
+        for row_top, row_distances in zip(top, top_distances, strict=True)
+    ]
@@ -0,0 +1,252 @@
+from abc import ABC, abstractmethod
+
+import numpy as np
+
+
+class Quantizer(ABC):
+    """Base class for compressing embeddings into compact codes.
+
+    Codes are scanned to find candidates cheaply, and candidates are re-ranked with
+    the float32 embeddings.
+    """
+
+    # Number of rows scored at a time, bounds the memory used per query
+    chunk_size: int = 65536
+
+    @property
+    @abstractmethod
+    def is_trained(self) -> bool:
+        raise NotImplementedError
+
+    @property
+    @abstractmethod
+    def code_size(self) -> int:
+        """Number of bytes per code"""
+        raise NotImplementedError
+
+    @property
+    @abstractmethod
+    def dtype(self) -> type:
+        raise NotImplementedError
+
+    def check_dimensions(self, dimensions: int) -> None:
+        """Raises a ValueError if embeddings of this size cannot be quantized"""
+        return
+
+    @abstractmethod
+    def train(self, vectors: np.ndarray) -> None:
+        raise NotImplementedError
+
+    @abstractmethod
+    def encode(self, vectors: np.ndarray) -> np.ndarray:
+        raise NotImplementedError
+
+    @abstractmethod
+    def dot(self, codes: np.ndarray, query: np.ndarray) -> np.ndarray:
+        """Returns the approximate inner product of each coded vector with the query"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def state(self) -> dict[str, np.ndarray]:
+        """Returns the trained parameters, to be saved with the collection"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def load_state(self, state: dict[str, np.ndarray]) -> None:
+        raise NotImplementedError
+
+    @abstractmethod
+    def reset(self) -> None:
+        raise NotImplementedError
+
+    def encode_chunked(self, vectors: np.ndarray) -> np.ndarray:
+        codes = np.empty((len(vectors), self.code_size), dtype=self.dtype)
+        for start in range(0, len(vectors), self.chunk_size):
+            chunk = np.asarray(vectors[start : start + self.chunk_size], np.float32)
+            codes[start : start + self.chunk_size] = self.encode(chunk)
+        return codes
+
+
+class ScalarQuantizer(Quantizer):
+    def __init__(self):
+        """
+        Quantizes each dimension to int8 between its minimum and maximum value.
+        Uses 1 byte per dimension, 4x smaller than float32.
+        """
+        self.minimum: np.ndarray | None = None
+        self.scale: np.ndarray | None = None
+        self.dimensions: int = 0
+
+    @property
+    def is_trained(self) -> bool:
+        return self.scale is not None
+
+    @property
+    def code_size(self) -> int:
+        return self.dimensions
+
+    @property
+    def dtype(self) -> type:
+        return np.int8
+
+    def train(self, vectors: np.ndarray) -> None:
+        vectors = np.asarray(vectors, dtype=np.float32)
+        self.dimensions = vectors.shape[1]
+        self.minimum = vectors.min(axis=0)
+        scale = (vectors.max(axis=0) - self.minimum) / 255
+        self.scale = np.where(scale == 0, 1, scale).astype(np.float32)
+
+    def encode(self, vectors: np.ndarray) -> np.ndarray:
+        levels = np.rint((vectors - self.minimum) / self.scale)
+        return (np.clip(levels, 0, 255) - 128).astype(np.int8)
+
+    def dot(self, codes: np.ndarray, query: np.ndarray) -> np.ndarray:
+        # x ~= (code + 128) * scale + minimum
+        scaled_query = (self.scale * query).astype(np.float32)
+        offset = float((128 * self.scale + self.minimum) @ query)  # type: ignore
+        scores = np.empty(len(codes), dtype=np.float32)
+        for start in range(0, len(codes), self.chunk_size):
+            chunk = codes[start : start + self.chunk_size].astype(np.float32)
+            scores[start : start + self.chunk_size] = chunk @ scaled_query + offset
+        return scores
+
+    def state(self) -> dict[str, np.ndarray]:
+        return {"minimum": self.minimum, "scale": self.scale}  # type: ignore
+
+    def load_state(self, state: dict[str, np.ndarray]) -> None:
+        self.minimum = np.asarray(state["minimum"], dtype=np.float32)
+        self.scale = np.asarray(state["scale"], dtype=np.float32)
+        self.dimensions = len(self.scale)
+
+    def reset(self) -> None:
+        self.minimum = None
+        self.scale = None
+        self.dimensions = 0
+
+
+class ProductQuantizer(Quantizer):
+    def __init__(
+        self,
+        num_subvectors: int | None = None,
+        num_iterations: int = 10,
+        train_size: int = 65536,
+    ):
+        """
+        Splits embeddings into subvectors and encodes each with one of 256 centroids.
+        Uses 1 byte per subvector, by default 1 byte per 8 dimensions, 32x smaller
+        than float32.
+
+        :param num_subvectors: The number of subvectors, must divide the dimensions.
+            Defaults to the largest divisor of the dimensions up to dimensions / 8.
+        :param num_iterations: The number of k-means iterations per subvector.
+        :param train_size: The maximum number of vectors used for training.
+        """
+        self.num_subvectors: int | None = num_subvectors
+        self.num_iterations: int = num_iterations
+        self.train_size: int = train_size
+        # Centroids of each subvector, shape (num_subvectors, 256, subvector size)
+        self.codebooks: np.ndarray | None = None
+
+    @property
+    def is_trained(self) -> bool:
+        return self.codebooks is not None
+
+    @property
+    def code_size(self) -> int:
+        return len(self.codebooks) if self.codebooks is not None else 0
+
+    @property
+    def dtype(self) -> type:
+        return np.uint8
+
+    def subvectors(self, dimensions: int) -> int:
+        """Returns the number of subvectors embeddings of this size are split into"""
+        if self.num_subvectors is not None:
+            return self.num_subvectors
+        return next(
+            m for m in range(max(1, dimensions // 8), 0, -1) if dimensions % m == 0
+        )
+
+    def check_dimensions(self, dimensions: int) -> None:
+        num_subvectors = self.subvectors(dimensions)
+        if num_subvectors < 1 or dimensions % num_subvectors != 0:
+            raise ValueError(
+                f"{num_subvectors} subvectors do not divide {dimensions} dimensions",
+            )
+
+    def train(self, vectors: np.ndarray) -> None:
+        vectors = np.asarray(vectors, dtype=np.float32)
+        dimensions = vectors.shape[1]
+        self.check_dimensions(dimensions)
+        num_subvectors = self.subvectors(dimensions)
+
+        rng = np.random.default_rng(0)
+        if len(vectors) > self.train_size:
+            vectors = vectors[rng.choice(len(vectors), self.train_size, replace=False)]
+        subvectors = vectors.reshape(len(vectors), num_subvectors, -1)
+        num_centroids = min(256, len(vectors))
+        self.codebooks = np.stack(
+            [
+                kmeans(subvectors[:, i], num_centroids, self.num_iterations, rng)
+                for i in range(num_subvectors)
+            ],
+        )
+
+    def encode(self, vectors: np.ndarray) -> np.ndarray:
+        codebooks: np.ndarray = self.codebooks  # type: ignore
+        subvectors = vectors.reshape(len(vectors), len(codebooks), -1)
+        codes = np.empty((len(vectors), len(codebooks)), dtype=np.uint8)
+        for i, codebook in enumerate(codebooks):
+            codes[:, i] = nearest_centroids(subvectors[:, i], codebook)
+        return codes
+
+    def dot(self, codes: np.ndarray, query: np.ndarray) -> np.ndarray:
+        codebooks: np.ndarray = self.codebooks  # type: ignore
+        # Inner product of each query subvector with each centroid
+        tables = np.einsum("mkd,md->mk", codebooks, query.reshape(len(codebooks), -1))
+        subvector_index = np.arange(len(codebooks))
+        scores = np.empty(len(codes), dtype=np.float32)
+        for start in range(0, len(codes), self.chunk_size):
+            chunk = codes[start : start + self.chunk_size]
+            scores[start : start + self.chunk_size] = tables[
+                subvector_index,
+                chunk,
+            ].sum(axis=1)
+        return scores
+
+    def state(self) -> dict[str, np.ndarray]:
+        return {"codebooks": self.codebooks}  # type: ignore
+
+    def load_state(self, state: dict[str, np.ndarray]) -> None:
+        self.codebooks = np.asarray(state["codebooks"], dtype=np.float32)
+
+    def reset(self) -> None:
+        self.codebooks = None
+
+
+def nearest_centroids(vectors: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+    """Returns the index of the closest centroid by l2 distance for each vector"""
+    # ||v - c||^2 ranks the same as ||c||^2 - 2 v.c
+    distances = np.einsum("ij,ij->i", centroids, centroids) - 2 * vectors @ centroids.T
+    return np.argmin(distances, axis=1)
+
+
+def kmeans(
+    vectors: np.ndarray,
+    k: int,
+    num_iterations: int,
+    rng: np.random.Generator,
+) -> np.ndarray:
+    """Returns k centroids of the vectors, trained with Lloyd's algorithm"""
+    centroids = vectors[rng.choice(len(vectors), size=k, replace=False)].copy()
+    for _ in range(num_iterations):
+        assignments = nearest_centroids(vectors, centroids)
+        counts = np.bincount(assignments, minlength=k)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignments, vectors)
+        non_empty = counts > 0
+        centroids[non_empty] = sums[non_empty] / counts[non_empty, None]
+        num_empty = k - int(non_empty.sum())
+        if num_empty > 0:
+            centroids[~non_empty] = vectors[rng.choice(len(vectors), size=num_empty)]
+    return centroids.astype(np.float32)
@@ -4,6 +4,7 @@ from pydantic import model_validator
 
 from pas.knowledge.base import AssistantKnowledge
 from pas.knowledge.document import Document
+from pas.knowledge.document.http_cache import CachedPage, HttpCache
 from pas.knowledge.document.website import WebsiteReader
 from pas.utils.log import logger
 
@@ -15,6 +16,9 @@ class WebsiteKnowledgeBase(AssistantKnowledge):
     # WebsiteReader parameters
     max_depth: int = 3
     max_links: int = 10
+    # Cache of crawled pages, websites which were loaded before are crawled again
+    # with conditional requests and only their changed pages are loaded
+    http_cache: HttpCache | None = None
 
     @model_validator(mode="after")  # type: ignore
     def set_reader(self) -> "WebsiteKnowledgeBase":
@@ -22,6 +26,7 @@ class WebsiteKnowledgeBase(AssistantKnowledge):
             self.reader = WebsiteReader(
                 max_depth=self.max_depth,
                 max_links=self.max_links,
+                http_cache=self.http_cache,
             )
         return self  # type: ignore
 
@@ -56,6 +61,8 @@ class WebsiteKnowledgeBase(AssistantKnowledge):
         if recreate:
             logger.debug("Deleting collection")
             self.vector_db.delete()
+            if self.lexical_index is not None:
+                self.lexical_index.clear()
 
         logger.debug("Creating collection")
         self.vector_db.create()
@@ -65,28 +72,92 @@ class WebsiteKnowledgeBase(AssistantKnowledge):
 
         # Given that the crawler needs to parse the URL before existence can be checked
         # We check if the website url exists in the vector db if recreate is False
+        # With an http cache, existing websites are refreshed with their changed pages
         urls_to_read = self.urls.copy()
+        existing_urls: set[str] = set()
         if not recreate:
-            for url in urls_to_read:
+            for url in self.urls:
                 logger.debug(f"Checking if {url} exists in the vector db")
                 if self.vector_db.name_exists(name=url):
-                    logger.debug(f"Skipping {url} as it exists in the vector db")
-                    urls_to_read.remove(url)
+                    existing_urls.add(url)
+                    if self.reader.http_cache is None:
+                        logger.debug(f"Skipping {url} as it exists in the vector db")
+                        urls_to_read.remove(url)
 
         for url in urls_to_read:
-            document_list = self.reader.read(url=url)
+            cache_pages: list[CachedPage] = []
+            document_list = self.reader.read(
+                url=url,
+                skip_unchanged=url in existing_urls,
+                cache_pages=cache_pages,
+            )
+            if url in existing_urls:
+                self.delete_stale_documents(url, document_list)
             # Filter out documents which already exist in the vector db
+            documents_to_load = document_list
             if not recreate:
-                document_list = [
+                documents_to_load = [
                     document
-                    for document in document_list
-                    if not self.vector_db.doc_exists(document)
+                    for document, exists in zip(
+                        document_list,
+                        self.vector_db.docs_exist(document_list),
+                        strict=True,
+                    )
+                    if not exists
                 ]
 
-            self.vector_db.insert(documents=document_list)
-            num_documents += len(document_list)
+            self.vector_db.insert(documents=documents_to_load)
+            # Documents are indexed once they are in the vector db
+            if self.lexical_index is not None:
+                self.lexical_index.add(document_list)
+            # Pages are cached once their documents are stored, so pages which
+            # failed to load are not skipped as unchanged on the next load
+            if self.reader.http_cache is not None:
+                for page in cache_pages:
+                    self.reader.http_cache.set(page)
+            num_documents += len(documents_to_load)
             logger.info(f"Loaded {num_documents} documents to knowledge base")
 
         if self.optimize_on is not None and num_documents > self.optimize_on:
             logger.debug("Optimizing Vector DB")
             self.vector_db.optimize()
+        if self.lexical_index is not None:
+            self.lexical_index.save()
+        self.clear_search_cache()
+
+    def delete_stale_documents(self, url: str, documents: list[Document]) -> None:
+        """Delete the stored documents of the pages read again which are not in
+        `documents`, i.e. the outdated chunks of changed pages.
+        Document ids are content hashes, so the chunks of a changed page are new
+        documents and its old chunks must be deleted.
+        """
+        if self.vector_db is None:
+            return
+
+        page_urls = list(
+            dict.fromkeys(
+                document.meta_data["url"]
+                for document in documents
+                if "url" in document.meta_data
+            ),
+        )
+        if len(page_urls) == 0:
+            return
+        current_ids = {self.vector_db.doc_id(document) for document in documents}
+        try:
+            stored_ids = self.vector_db.get_ids(
+                {"name": url, "url": {"$in": page_urls}},
+            )
+        except NotImplementedError:
+            logger.warning(
+                "Vector db cannot look up documents, "
+                f"outdated pages of {url} are not deleted",
+            )
+            return
+
+        stale_ids = [doc_id for doc_id in stored_ids if doc_id not in current_ids]
+        if len(stale_ids) > 0:
+            logger.info(f"Deleting {len(stale_ids)} outdated documents of {url}")
+            self.vector_db.delete_documents(stale_ids)
+            if self.lexical_index is not None:
+                self.lexical_index.remove(stale_ids)
@@ -0,0 +1,226 @@
+import asyncio
+import json
+from base64 import b64encode
+
+import httpx
+import numpy as np
+import pytest
+
+from pas.knowledge.document import Document
+from pas.knowledge.embedder import Embedder
+from pas.knowledge.embedder.cache import (
+    CachedEmbedder,
+    MemoryEmbeddingCache,
+    SqlEmbeddingCache,
+)
+
+
+class CountingEmbedder(Embedder):
+    dimensions: int = 2
+    requests: list[list[str]] = []
+
+    def get_embedding_and_usage(self, text: str) -> tuple[list[float], dict | None]:
+        self.requests.append([text])
+        return [float(len(text)), 1.0], {"total_tokens": 1}
+
+    def _embed_batch(self, texts: list[str]) -> tuple[list[list[float]], dict | None]:
+        self.requests.append(texts)
+        return [[float(len(text)), 1.0] for text in texts], {"total_tokens": len(texts)}
+
+
+@pytest.mark.parametrize(
+    ("batch_size", "batch_token_limit", "expected_requests"),
+    [
+        (100, None, 1),
+        (2, None, 3),
+        (100, 4, 5),
+    ],
+)
+def test_embedder_batches(batch_size, batch_token_limit, expected_requests):
+    embedder = CountingEmbedder(
+        batch_size=batch_size,
+        batch_token_limit=batch_token_limit,
+        requests=[],
+    )
+    texts = ["a" * 10 for _ in range(5)]
+    embeddings, usage = embedder.get_embeddings_and_usage(texts)
+    assert len(embedder.requests) == expected_requests
+    assert embeddings == [[10.0, 1.0]] * 5
+    assert usage == {"total_tokens": 5}
+
+
+def test_embed_documents():
+    embedder = CountingEmbedder(requests=[])
+    documents = [Document(content="ab"), Document(content="abc")]
+    Document.embed_documents(documents=documents, embedder=embedder)
+    assert [document.embedding.tolist() for document in documents] == [
+        [2.0, 1.0],
+        [3.0, 1.0],
+    ]
+    assert documents[0].embedding.dtype == np.float32
+    assert documents[0].model_dump()["embedding"] == [2.0, 1.0]
+    assert len(embedder.requests) == 1
+
+
+def openai_embeddings_handler(request: httpx.Request) -> httpx.Response:
+    body = json.loads(request.content)
+    assert body["encoding_format"] == "base64"
+    data = [
+        {
+            "object": "embedding",
+            "index": index,
+            "embedding": b64encode(
+                np.array([len(text), 1.0], dtype=np.float32).tobytes(),
+            ).decode(),
+        }
+        for index, text in reversed(list(enumerate(body["input"])))
+    ]
+    usage = {"prompt_tokens": 2, "total_tokens": 2}
+    return httpx.Response(
+        200,
+        json={
+            "object": "list",
+            "data": data,
+            "model": body["model"],
+            "usage": usage,
+        },
+    )
+
+
+def test_openai_embedding_arrays():
+    from openai import OpenAI
+
+    from pas.knowledge.embedder.openai import OpenAIEmbedder
+
+    client = OpenAI(
+        api_key="test",
+        http_client=httpx.Client(
+            transport=httpx.MockTransport(openai_embeddings_handler),
+        ),
+    )
+    embedder = OpenAIEmbedder(dimensions=2, openai_client=client)
+    embeddings, usage = embedder.get_embedding_arrays_and_usage(["a", "bb"])
+    assert [embedding.tolist() for embedding in embeddings] == [[1.0, 1.0], [2.0, 1.0]]
+    assert usage == {"prompt_tokens": 2, "total_tokens": 2}
+
+
+def test_async_embeddings():
+    from openai import AsyncOpenAI
+
+    from pas.knowledge.embedder.openai import OpenAIEmbedder
+
+    client = AsyncOpenAI(
+        api_key="test",
+        http_client=httpx.AsyncClient(
+            transport=httpx.MockTransport(openai_embeddings_handler),
+        ),
+    )
+    embedder = OpenAIEmbedder(
+        dimensions=2,
+        encoding_format="base64",
+        async_openai_client=client,
+    )
+    documents = [Document(content="a"), Document(content="bb")]
+    asyncio.run(Document.aembed_documents(documents, embedder=embedder))
+    assert [doc.embedding.tolist() for doc in documents] == [[1.0, 1.0], [2.0, 1.0]]
+
+    # Embedders without an async client embed in a thread
+    cached = CachedEmbedder(embedder=CountingEmbedder(requests=[]))
+    embeddings = asyncio.run(cached.aget_embedding_arrays(["a", "bb", "a"]))
+    assert [embedding.tolist() for embedding in embeddings] == [
+        [1.0, 1.0],
+        [2.0, 1.0],
+        [1.0, 1.0],
+    ]
+    assert asyncio.run(cached.aget_embedding("bb")) == [2.0, 1.0]
+    assert cached.embedder.requests == [["a", "bb"]]
+
+
+def test_ollama_batch_embeddings():
+    from ollama import AsyncClient, Client
+
+    from pas.knowledge.embedder.ollama import OllamaEmbedder
+
+    requests: list[str] = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        requests.append(request.url.path)
+        body = json.loads(request.content)
+        if request.url.path == "/api/embeddings":
+            return httpx.Response(200, json={"embedding": [len(body["prompt"]), 0.0]})
+        if not batch_endpoint:
+            return httpx.Response(404, json={"error": "not found"})
+        return httpx.Response(
+            200,
+            json={
+                "embeddings": [[len(text), 1.0] for text in body["input"]],
+                "prompt_eval_count": 3,
+            },
+        )
+
+    batch_endpoint = True
+    transport = httpx.MockTransport(handler)
+    embedder = OllamaEmbedder(
+        dimensions=2,
+        ollama_client=Client(transport=transport),
+        async_ollama_client=AsyncClient(transport=transport),
+    )
+    embeddings, usage = embedder.get_embeddings_and_usage(["a", "bb"])
+    assert embeddings == [[1.0, 1.0], [2.0, 1.0]]
+    assert usage == {"prompt_tokens": 3}
+    embeddings = asyncio.run(embedder.aget_embedding_arrays(["ccc"]))
+    assert [embedding.tolist() for embedding in embeddings] == [[3.0, 1.0]]
+    assert requests == ["/api/embed", "/api/embed"]
+
+    # Servers without `/api/embed` are sent one request per text
+    batch_endpoint = False
+    requests.clear()
+    embeddings, _ = embedder.get_embeddings_and_usage(["a", "bb"])
+    assert embeddings == [[1.0, 0.0], [2.0, 0.0]]
+    assert embedder.batch_endpoint is False
+    assert requests == ["/api/embed", "/api/embeddings", "/api/embeddings"]
+
+
+@pytest.mark.parametrize("cache_type", ["memory", "sql"])
+def test_cached_embedder(tmp_path, cache_type):
+    cache = (
+        MemoryEmbeddingCache(max_size=2)
+        if cache_type == "memory"
+        else SqlEmbeddingCache(db_file=str(tmp_path / "cache.db"), max_size=2)
+    )
+    embedder = CachedEmbedder(embedder=CountingEmbedder(requests=[]), cache=cache)
+    embeddings = embedder.get_embeddings(["a", "bb", "a"])
+    assert embeddings == [[1.0, 1.0], [2.0, 1.0], [1.0, 1.0]]
+    assert embedder.get_embedding("bb") == [2.0, 1.0]
+    assert embedder.get_embedding_arrays(["a"])[0].tolist() == [1.0, 1.0]
+    assert embedder.embedder.requests == [["a", "bb"]]
+    assert cache.stats()["hits"] == 3
+    assert cache.stats()["misses"] == 2
+
+    embedder.get_embedding("ccc")
+    assert len(cache) == 2
+
+
+def test_sql_embedding_cache_in_memory_across_threads():
+    from concurrent.futures import ThreadPoolExecutor
+
+    cache = SqlEmbeddingCache(db_file=None, memory_size=1)
+    cache.set_many({"a": [1.0, 2.0]})
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        executor.submit(cache.set_many, {"b": [3.0, 4.0]}).result()
+        found = executor.submit(cache.get_many, ["a", "b"]).result()
+    assert {key: np.asarray(embedding).tolist() for key, embedding in found.items()} == {
+        "a": [1.0, 2.0],
+        "b": [3.0, 4.0],
+    }
+    assert len(cache) == 2
+
+
+def test_sql_embedding_cache_without_upsert(monkeypatch):
+    cache = SqlEmbeddingCache(db_file=None, memory_size=1)
+    monkeypatch.setattr(cache, "upsert_statement", lambda: None)
+    cache.set_many({"a": [1.0, 2.0], "b": [3.0, 4.0]})
+    cache.set_many({"a": [5.0, 6.0]})
+    cache.memory.clear()
+    assert cache.get("a").tolist() == [5.0, 6.0]
+    assert len(cache) == 2
@@ -0,0 +1,790 @@
+from collections.abc import Iterator
+
+import pytest
+
+from pas.knowledge import AssistantKnowledge
+from pas.knowledge.document import Document
+from pas.knowledge.embedder import Embedder
+from pas.knowledge.pipeline import embed_pipeline
+from pas.knowledge.vectordb import VectorDb
+
+
+class LengthEmbedder(Embedder):
+    dimensions: int = 2
+
+    def get_embedding(self, text: str) -> list[float]:
+        return [float(len(text)), 1.0]
+
+    def get_embedding_and_usage(self, text: str) -> tuple[list[float], dict | None]:
+        return [float(len(text)), 1.0], None
+
+
+class ListVectorDb(VectorDb):
+    def __init__(self, embedder: Embedder):
+        self.embedder = embedder
+        self.documents: list[Document] = []
+
+    def create(self) -> None:
+        pass
+
+    def doc_exists(self, document: Document) -> bool:
+        return any(doc.content == document.content for doc in self.documents)
+
+    def name_exists(self, name: str) -> bool:
+        return False
+
+    def insert(self, documents: list[Document]) -> None:
+        Document.embed_documents(
+            documents=[doc for doc in documents if doc.embedding is None],
+            embedder=self.embedder,
+        )
+        self.documents.extend(documents)
+
+    def upsert_available(self) -> bool:
+        return False
+
+    def upsert(self, documents: list[Document]) -> None:
+        raise NotImplementedError
+
+    def search(self, query: str, limit: int = 5) -> list[Document]:
+        return self.documents[:limit]
+
+    def delete(self) -> None:
+        self.documents = []
+
+    def exists(self) -> bool:
+        return True
+
+    def optimize(self) -> None:
+        pass
+
+    def clear(self) -> bool:
+        self.documents = []
+        return True
+
+
+class ListKnowledgeBase(AssistantKnowledge):
+    contents: list[list[str]] = []
+
+    @property
+    def document_lists(self) -> Iterator[list[Document]]:
+        for contents in self.contents:
+            yield [Document(content=content) for content in contents]
+
+
+def test_embed_pipeline_keeps_order():
+    document_lists = [[Document(content="a" * i)] for i in range(1, 20)]
+    embedded = list(
+        embed_pipeline(
+            document_lists, embedder=LengthEmbedder(), num_workers=3, queue_size=2
+        ),
+    )
+    assert [docs[0].embedding.tolist() for docs in embedded] == [
+        [float(i), 1.0] for i in range(1, 20)
+    ]
+
+
+def test_embed_pipeline_raises_read_errors():
+    def document_lists() -> Iterator[list[Document]]:
+        yield [Document(content="a")]
+        raise ValueError("unreadable")
+
+    with pytest.raises(ValueError, match="unreadable"):
+        list(embed_pipeline(document_lists(), embedder=LengthEmbedder()))
+
+
+@pytest.mark.parametrize("num_workers", [1, 4])
+def test_load_skips_existing(num_workers):
+    vector_db = ListVectorDb(embedder=LengthEmbedder())
+    knowledge_base = ListKnowledgeBase(
+        vector_db=vector_db,
+        contents=[["a", "bb"], ["ccc"]],
+        num_workers=num_workers,
+    )
+    knowledge_base.load()
+    knowledge_base.load()
+    assert [doc.content for doc in vector_db.documents] == ["a", "bb", "ccc"]
+    assert all(doc.embedding is not None for doc in vector_db.documents)
+
+
+def test_chroma_docs_exist():
+    from pas import ChromaDb
+
+    vector_db = ChromaDb(collection="test_docs_exist", embedder=LengthEmbedder())
+    vector_db.delete()
+    vector_db.create()
+    vector_db.insert([Document(content="a"), Document(content="bb")])
+    documents = [Document(content="bb"), Document(content="ccc"), Document(content="a")]
+    assert vector_db.docs_exist(documents) == [True, False, True]
+    assert vector_db.doc_exists(Document(content="ccc")) is False
+
+
+def test_chroma_reuses_stored_embeddings():
+    from pas import ChromaDb
+
+    embedder = LengthEmbedder()
+    vector_db = ChromaDb(collection="test_reuse_embeddings", embedder=embedder)
+    vector_db.delete()
+    vector_db.create()
+    vector_db.insert([Document(content="a"), Document(content="a")])
+    assert vector_db.get_count() == 1
+
+    class FailingEmbedder(LengthEmbedder):
+        def get_embedding_and_usage(self, text: str) -> tuple[list[float], dict | None]:
+            if text == "a":
+                raise AssertionError("existing document embedded again")
+            return super().get_embedding_and_usage(text)
+
+    vector_db.embedder = FailingEmbedder()
+    vector_db.insert([Document(content="a"), Document(content="bb")])
+    vector_db.upsert([Document(content="a"), Document(content="ccc")])
+    assert vector_db.get_count() == 3
+
+
+def test_chroma_filtered_search():
+    from pas import ChromaDb
+
+    vector_db = ChromaDb(collection="test_filtered_search", embedder=LengthEmbedder())
+    vector_db.delete()
+    vector_db.create()
+    vector_db.insert(
+        [
+            Document(content="a", name="a.pdf", meta_data={"page": 1}),
+            Document(content="bb", name="b.pdf", meta_data={"page": 2, "tags": ["x"]}),
+            Document(content="ccc"),
+        ],
+    )
+    assert vector_db.name_exists("b.pdf")
+    assert not vector_db.name_exists("c.pdf")
+
+    results = vector_db.search("bb", limit=3, filters={"name": "b.pdf"})
+    assert [(doc.name, doc.meta_data) for doc in results] == [
+        ("b.pdf", {"page": 2, "tags": '["x"]'}),
+    ]
+    results = vector_db.search(
+        "a", limit=3, filters={"page": {"$lte": 2}, "name": "a.pdf"}
+    )
+    assert [doc.content for doc in results] == ["a"]
+    assert len(vector_db.search("a", limit=3)) == 3
+
+
+def test_chroma_keeps_name_meta_data():
+    from pas import ChromaDb
+
+    vector_db = ChromaDb(collection="test_name_meta_data", embedder=LengthEmbedder())
+    vector_db.delete()
+    vector_db.create()
+    vector_db.insert(
+        [
+            Document(content="a", name="a.pdf", meta_data={"name": "Ada"}),
+            Document(content="bb", meta_data={"name": "a.pdf"}),
+        ],
+    )
+
+    # The name filter matches the document name, not the meta data
+    results = vector_db.search("a", limit=3, filters={"name": "a.pdf"})
+    assert [(doc.name, doc.meta_data) for doc in results] == [
+        ("a.pdf", {"name": "Ada"}),
+    ]
+    assert not vector_db.name_exists("Ada")
+
+
+def test_search_filters():
+    from pas.knowledge.bm25 import BM25Index
+    from pas.knowledge.cache import SearchCache
+    from pas.knowledge.vectordb.numpy import NumpyVectorDb
+
+    knowledge_base = AssistantKnowledge(
+        vector_db=NumpyVectorDb(collection="test", embedder=LengthEmbedder()),
+        lexical_index=BM25Index(),
+        search_cache=SearchCache(),
+    )
+    knowledge_base.load_documents(
+        [
+            Document(content=f"{tenant} invoice {i}", meta_data={"tenant": tenant})
+            for tenant in ["acme", "globex"]
+            for i in range(3)
+        ],
+    )
+    for tenant in ["acme", "globex"]:
+        documents = knowledge_base.search(
+            "acme invoice", num_documents=5, filters={"tenant": tenant}
+        )
+        assert len(documents) == 3
+        assert {doc.meta_data["tenant"] for doc in documents} == {tenant}
+    # Results are cached by filters
+    assert knowledge_base.search_cache.misses == 2
+
+
+def test_search_many():
+    from pas import ChromaDb
+    from pas.knowledge.cache import SearchCache
+
+    class CountingEmbedder(LengthEmbedder):
+        num_batches: int = 0
+
+        def _embed_batch(self, texts: list[str]) -> tuple[list[list[float]], None]:
+            self.num_batches += 1
+            return [self.get_embedding(text) for text in texts], None
+
+    embedder = CountingEmbedder()
+    vector_db = ChromaDb(collection="test_search_many", embedder=embedder)
+    vector_db.delete()
+    vector_db.create()
+    vector_db.insert(
+        [Document(content="a" * i, meta_data={"even": i % 2 == 0}) for i in range(1, 7)]
+    )
+    embedder.num_batches = 0
+
+    queries = ["aa", "aaaaa", "aa"]
+    results = vector_db.search_many(queries, limit=2)
+    assert embedder.num_batches == 1
+    assert [[doc.content for doc in docs] for docs in results] == [
+        [doc.content for doc in vector_db.search(query, limit=2)] for query in queries
+    ]
+    results = vector_db.search_many(queries, limit=6, filters={"even": True})
+    assert all(len(docs) == 3 for docs in results)
+
+    knowledge_base = AssistantKnowledge(vector_db=vector_db, search_cache=SearchCache())
+    knowledge_base.search("aa")
+    results = knowledge_base.search_many(queries + ["aaa"])
+    assert [len(docs) for docs in results] == [2, 2, 2, 2]
+    # Cached and repeated queries are not searched again
+    assert knowledge_base.search_cache.stats()["size"] == 3
+
+
+def test_async_search():
+    import asyncio
+    import time
+
+    from pas.knowledge.bm25 import BM25Index
+    from pas.knowledge.vectordb.numpy import NumpyVectorDb
+
+    class SlowEmbedder(LengthEmbedder):
+        def get_embedding(self, text: str) -> list[float]:
+            time.sleep(0.2)
+            return super().get_embedding(text)
+
+    knowledge_base = AssistantKnowledge(
+        vector_db=NumpyVectorDb(collection="test", embedder=SlowEmbedder()),
+        lexical_index=BM25Index(),
+        num_documents=1,
+    )
+    documents = [Document(content="a" * i, meta_data={"i": i}) for i in range(1, 6)]
+
+    async def search() -> tuple[list[list[Document]], int]:
+        await knowledge_base.aload_documents(documents)
+        ticks = 0
+
+        async def tick() -> None:
+            nonlocal ticks
+            while True:
+                await asyncio.sleep(0.01)
+                ticks += 1
+
+        ticker = asyncio.create_task(tick())
+        results = await asyncio.gather(
+            *(knowledge_base.asearch("a" * i) for i in range(1, 5)),
+            knowledge_base.asearch("aaa", filters={"i": {"$gt": 3}}),
+        )
+        ticker.cancel()
+        return results, ticks
+
+    start = time.perf_counter()
+    results, ticks = asyncio.run(search())
+    # Blocking embeddings run in threads, so the searches run concurrently and
+    # the event loop keeps running
+    assert time.perf_counter() - start < 0.6
+    assert ticks > 5
+    assert [docs[0].content for docs in results] == ["a", "aa", "aaa", "aaaa", "aaaa"]
+    assert knowledge_base.vector_db.get_count() == 5
+
+
+def test_search_cache():
+    from pas.knowledge.cache import SearchCache
+
+    vector_db = ListVectorDb(embedder=LengthEmbedder())
+    knowledge_base = ListKnowledgeBase(
+        vector_db=vector_db,
+        contents=[["a", "bb"]],
+        search_cache=SearchCache(ttl=None),
+    )
+    knowledge_base.load()
+    assert len(knowledge_base.search("query")) == 2
+    assert len(knowledge_base.search("  query ")) == 2
+    assert knowledge_base.search_cache.stats()["hits"] == 1
+
+    # Documents added directly to the vector db invalidate cached results
+    vector_db.documents.append(Document(content="ccc"))
+    vector_db.mark_changed()
+    assert len(knowledge_base.search("query", num_documents=5)) == 3
+    assert len(knowledge_base.search("query", num_documents=5)) == 3
+    assert knowledge_base.search_cache.stats()["misses"] == 2
+
+    knowledge_base.clear()
+    assert knowledge_base.search("query") == []
+
+
+def test_search_cache_expires(monkeypatch):
+    from pas.knowledge import cache
+    from pas.knowledge.cache import SearchCache
+
+    now = 100.0
+    monkeypatch.setattr(cache, "monotonic", lambda: now)
+    search_cache = SearchCache(ttl=10)
+    search_cache.set("query", num_documents=2, documents=[Document(content="a")])
+    assert search_cache.get("query", num_documents=2) is not None
+    assert search_cache.get("query", num_documents=3) is None
+    now = 120.0
+    assert search_cache.get("query", num_documents=2) is None
+    assert search_cache.hit_rate == 1 / 3
+
+
+def test_file_knowledge_base_sync(tmp_path):
+    from pas.knowledge.document.text import TextReader
+    from pas.knowledge.text import TextKnowledgeBase
+    from pas.knowledge.vectordb.numpy import NumpyVectorDb
+
+    class CountingTextReader(TextReader):
+        paths: list[str] = []
+
+        def read_source(self, path):
+            self.paths.append(path.name)
+            return super().read_source(path)
+
+    docs_path = tmp_path / "docs"
+    docs_path.mkdir()
+    (docs_path / "a.txt").write_text("apple")
+    (docs_path / "b.txt").write_text("banana")
+    (docs_path / "c.txt").write_text("apple")
+
+    vector_db = NumpyVectorDb(collection="sync", embedder=LengthEmbedder())
+    reader = CountingTextReader(paths=[])
+    knowledge_base = TextKnowledgeBase(
+        path=docs_path,
+        vector_db=vector_db,
+        reader=reader,
+        manifest_file=tmp_path / "manifest.json",
+    )
+    knowledge_base.sync()
+    assert sorted(reader.paths) == ["a.txt", "b.txt", "c.txt"]
+    assert vector_db.get_count() == 2
+
+    # Only new and changed files are read again
+    reader.paths = []
+    (docs_path / "b.txt").write_text("blueberry")
+    (docs_path / "d.txt").write_text("date")
+    knowledge_base.sync()
+    assert sorted(reader.paths) == ["b.txt", "d.txt"]
+    assert not vector_db.doc_exists(Document(content="banana"))
+    assert vector_db.get_count() == 3
+
+    # Documents of removed files are deleted unless another file has them
+    reader.paths = []
+    (docs_path / "a.txt").unlink()
+    (docs_path / "d.txt").unlink()
+    knowledge_base.sync()
+    assert reader.paths == []
+    documents = [Document(content=content) for content in ["apple", "date"]]
+    assert vector_db.docs_exist(documents) == [True, False]
+    assert vector_db.get_count() == 2
+
+
+def test_file_knowledge_base_sync_keeps_unreadable_files(tmp_path):
+    from pas.knowledge.document.text import TextReader
+    from pas.knowledge.text import TextKnowledgeBase
+    from pas.knowledge.vectordb.numpy import NumpyVectorDb
+
+    class FlakyTextReader(TextReader):
+        fail: bool = False
+
+        def read_source(self, path):
+            if self.fail:
+                raise OSError("Read failed")
+            return super().read_source(path)
+
+    docs_path = tmp_path / "docs"
+    docs_path.mkdir()
+    (docs_path / "a.txt").write_text("apple")
+
+    vector_db = NumpyVectorDb(collection="sync", embedder=LengthEmbedder())
+    reader = FlakyTextReader()
+    knowledge_base = TextKnowledgeBase(
+        path=docs_path,
+        vector_db=vector_db,
+        reader=reader,
+        manifest_file=tmp_path / "manifest.json",
+    )
+    knowledge_base.sync()
+    assert vector_db.doc_exists(Document(content="apple"))
+
+    # The documents of a file which cannot be read are kept
+    (docs_path / "a.txt").write_text("apricot")
+    reader.fail = True
+    assert reader.read(docs_path / "a.txt") == []
+    knowledge_base.sync()
+    assert vector_db.doc_exists(Document(content="apple"))
+    assert vector_db.get_count() == 1
+
+    # and the file is read again on the next sync
+    reader.fail = False
+    knowledge_base.sync()
+    assert not vector_db.doc_exists(Document(content="apple"))
+    assert vector_db.doc_exists(Document(content="apricot"))
+
+
+def test_load_drops_duplicates():
+    from pas.knowledge.dedupe import Deduplicator
+
+    article = " ".join(f"word{i}" for i in range(100))
+    edited = article.replace("word50", "changed")
+    footer = "Copyright 2024 Example Inc. All rights reserved."
+    vector_db = ListVectorDb(embedder=LengthEmbedder())
+    knowledge_base = ListKnowledgeBase(
+        vector_db=vector_db,
+        contents=[[article, footer], [f"  {footer}\n", edited], ["other text"]],
+        deduplicator=Deduplicator(),
+    )
+    knowledge_base.load()
+    assert [doc.content for doc in vector_db.documents] == [
+        article,
+        footer,
+        "other text",
+    ]
+    assert knowledge_base.deduplicator.stats() == {
+        "kept": 3,
+        "exact_dropped": 1,
+        "near_dropped": 1,
+    }
+
+    # Only exact duplicates are dropped without near duplicate detection
+    deduplicator = Deduplicator(near_duplicates=False)
+    documents = [Document(content=article), Document(content=edited)]
+    assert len(deduplicator.filter(documents)) == 2
+    assert len(deduplicator.filter([Document(content=edited)])) == 0
+
+
+def test_bm25_index(tmp_path):
+    from pas.knowledge.bm25 import BM25Index
+
+    index = BM25Index(path=str(tmp_path))
+    index.add(
+        [
+            Document(content="the printer shows error ERR-4021 when out of paper"),
+            Document(content="restart the printer to clear most errors"),
+            Document(content="order paper with SKU 88-1204", meta_data={"page": 3}),
+            Document(content="the the the printer"),
+        ],
+    )
+    results = index.search("ERR-4021 printer", limit=2)
+    assert results[0].content.startswith("the printer shows error ERR-4021")
+    assert len(results) == 2
+    assert index.search("unknown words") == []
+
+    index.remove(
+        [VectorDb.doc_id(Document(content="restart the printer to clear most errors"))]
+    )
+    index.save()
+    reloaded = BM25Index(path=str(tmp_path))
+    assert len(reloaded) == 3
+    assert [doc.meta_data for doc in reloaded.search("sku 88 1204")] == [{"page": 3}]
+    assert [doc.content for doc in reloaded.search("restart")] == []
+
+
+def test_hybrid_search():
+    from pas.knowledge.bm25 import BM25Index, reciprocal_rank_fusion
+
+    a, b, c = (Document(content=content) for content in ["a", "b", "c"])
+    assert [doc.content for doc in reciprocal_rank_fusion([[a, b], [c, b]])] == [
+        "b",
+        "a",
+        "c",
+    ]
+
+    vector_db = ListVectorDb(embedder=LengthEmbedder())
+    knowledge_base = ListKnowledgeBase(
+        vector_db=vector_db,
+        contents=[["how to reset a password", "billing questions"], ["code ERR-4021"]],
+        lexical_index=BM25Index(),
+    )
+    knowledge_base.load()
+    # The vector db returns documents in insertion order, the lexical index
+    # ranks the exact identifier first
+    assert [doc.content for doc in knowledge_base.search("ERR-4021")] == [
+        "code ERR-4021",
+        "how to reset a password",
+    ]
+
+    knowledge_base.clear()
+    assert len(knowledge_base.lexical_index) == 0
+
+
+def test_clear_keeps_lexical_index_when_vector_db_fails():
+    from pas.knowledge.bm25 import BM25Index
+
+    class FailingClearVectorDb(ListVectorDb):
+        def clear(self) -> bool:
+            return False
+
+    knowledge_base = ListKnowledgeBase(
+        vector_db=FailingClearVectorDb(embedder=LengthEmbedder()),
+        contents=[["code ERR-4021"]],
+        lexical_index=BM25Index(),
+    )
+    knowledge_base.load()
+
+    assert knowledge_base.clear() is False
+    assert len(knowledge_base.lexical_index) == 1
+    assert [doc.content for doc in knowledge_base.search("ERR-4021")] == [
+        "code ERR-4021"
+    ]
+
+
+def test_failed_insert_keeps_lexical_index():
+    import asyncio
+
+    from pas.knowledge.bm25 import BM25Index
+
+    class FailingInsertVectorDb(ListVectorDb):
+        def insert(self, documents: list[Document]) -> None:
+            raise RuntimeError("insert failed")
+
+    knowledge_base = ListKnowledgeBase(
+        vector_db=FailingInsertVectorDb(embedder=LengthEmbedder()),
+        contents=[["code ERR-4021"]],
+        lexical_index=BM25Index(),
+    )
+    with pytest.raises(RuntimeError):
+        knowledge_base.load()
+    with pytest.raises(RuntimeError):
+        knowledge_base.load_documents([Document(content="code ERR-4021")])
+    with pytest.raises(RuntimeError):
+        asyncio.run(
+            knowledge_base.aload_documents([Document(content="code ERR-4021")])
+        )
+    assert len(knowledge_base.lexical_index) == 0
+
+    knowledge_base.vector_db = ListVectorDb(embedder=LengthEmbedder())
+    knowledge_base.load()
+    assert len(knowledge_base.lexical_index) == 1
+
+
+def test_reranker_batches_within_budget():
+    import time
+
+    from pas.knowledge.rerank import Reranker
+
+    class LengthReranker(Reranker):
+        batches: list[int] = []
+
+        def score(self, query: str, documents: list[Document]) -> list[float]:
+            self.batches.append(len(documents))
+            time.sleep(0.05)
+            return [float(len(document.content)) for document in documents]
+
+    documents = [Document(content="a" * i) for i in (2, 5, 1, 4, 3)]
+    reranker = LengthReranker(batch_size=2)
+    reranked = reranker.rerank("query", documents, top_n=3)
+    assert reranker.batches == [2, 2, 1]
+    assert [doc.content for doc in reranked] == ["aaaaa", "aaaa", "aaa"]
+
+    # Candidates which are not scored within the budget keep their order
+    reranker = LengthReranker(batch_size=2, latency_budget=0.07)
+    reranked = reranker.rerank("query", documents)
+    assert reranker.batches == [2]
+    assert [len(doc.content) for doc in reranked] == [5, 2, 1, 4, 3]
+
+
+def test_mmr_rerank():
+    from pas.knowledge.rerank import MMRReranker
+    from pas.knowledge.vectordb.numpy import NumpyVectorDb
+
+    class TopicEmbedder(Embedder):
+        dimensions: int = 2
+        num_embedded: int = 0
+
+        def get_embedding(self, text: str) -> list[float]:
+            return self.get_embedding_and_usage(text)[0]
+
+        def get_embedding_and_usage(self, text: str) -> tuple[list[float], None]:
+            self.num_embedded += 1
+            return [float(text.count("x")), float(text.count("y"))], None
+
+    embedder = TopicEmbedder()
+    knowledge_base = AssistantKnowledge(
+        vector_db=NumpyVectorDb(collection="test", embedder=embedder),
+        num_documents=2,
+        reranker=MMRReranker(embedder=embedder, lambda_mult=0.5),
+        rerank_candidates=3,
+    )
+    knowledge_base.load_documents(
+        [
+            Document(content="xxxxxxxxxx"),
+            Document(content="xxxxxxxxy"),
+            Document(content="xxyyyyyy"),
+        ]
+    )
+    embedder.num_embedded = 0
+    # The near duplicate of the best match is pushed down by a more diverse result
+    documents = knowledge_base.search("xxxxy")
+    assert [doc.content for doc in documents] == ["xxxxxxxxy", "xxyyyyyy"]
+    # Stored embeddings are used, only the query is embedded
+    assert embedder.num_embedded == 2
+    # Without diversity, the order of the search is kept
+    knowledge_base.reranker.lambda_mult = 1.0
+    documents = knowledge_base.search("xxxxy")
+    assert [doc.content for doc in documents] == ["xxxxxxxxy", "xxxxxxxxxx"]
+
+
+def test_cross_encoder_rerank():
+    import numpy as np
+
+    from pas.knowledge.rerank import CrossEncoderReranker
+
+    pytest.importorskip("tokenizers")
+    from tokenizers import Tokenizer
+    from tokenizers.models import WordLevel
+    from tokenizers.pre_tokenizers import Whitespace
+    from tokenizers.processors import TemplateProcessing
+
+    vocab = {"[PAD]": 0, "[UNK]": 1, "[CLS]": 2, "[SEP]": 3, "cat": 4, "dog": 5}
+    tokenizer = Tokenizer(WordLevel(vocab, unk_token="[UNK]"))
+    tokenizer.pre_tokenizer = Whitespace()
+    tokenizer.post_processor = TemplateProcessing(
+        single="[CLS] $A [SEP]",
+        pair="[CLS] $A [SEP] $B:1 [SEP]:1",
+        special_tokens=[("[CLS]", 2), ("[SEP]", 3)],
+    )
+
+    class Input:
+        def __init__(self, name: str):
+            self.name = name
+
+    class OverlapSession:
+        """Scores pairs by the number of document tokens found in the query"""
+
+        def __init__(self):
+            self.batch_sizes: list[int] = []
+
+        def get_inputs(self) -> list[Input]:
+            return [Input("input_ids"), Input("attention_mask")]
+
+        def run(self, output_names, inputs: dict[str, np.ndarray]) -> list[np.ndarray]:
+            input_ids = inputs["input_ids"]
+            self.batch_sizes.append(len(input_ids))
+            scores = []
+            for row in input_ids.tolist():
+                # [CLS] query [SEP] document [SEP] padding
+                separator = row.index(3)
+                query, document = row[1:separator], row[separator + 1 :]
+                overlap = sum(token in query for token in document if token > 3)
+                scores.append([0.0, float(overlap)])
+            return [np.array(scores, dtype=np.float32)]
+
+    session = OverlapSession()
+    reranker = CrossEncoderReranker(session=session, tokenizer=tokenizer, batch_size=2)
+    documents = [
+        Document(content="dog"),
+        Document(content="fish"),
+        Document(content="cat cat dog"),
+    ]
+    reranked = reranker.rerank("cat dog", documents, top_n=2)
+    assert session.batch_sizes == [2, 1]
+    assert [doc.content for doc in reranked] == ["cat cat dog", "dog"]
+
+
+def test_website_knowledge_base_replaces_changed_pages():
+    import httpx
+
+    from pas.knowledge.bm25 import BM25Index
+    from pas.knowledge.document.http_cache import HttpCache
+    from pas.knowledge.document.website import WebsiteReader
+    from pas.knowledge.vectordb.numpy import NumpyVectorDb
+    from pas.knowledge.website import WebsiteKnowledgeBase
+
+    pages = {
+        "/": "<main>home page</main><a href='/about'>about</a>",
+        "/about": "<main>about the old team</main>",
+    }
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        etag = f'"{hash(pages[request.url.path])}"'
+        if request.headers.get("if-none-match") == etag:
+            return httpx.Response(304)
+        return httpx.Response(200, html=pages[request.url.path], headers={"ETag": etag})
+
+    http_cache = HttpCache(db_file=None)
+    vector_db = NumpyVectorDb(collection="website", embedder=LengthEmbedder())
+    lexical_index = BM25Index()
+    knowledge_base = WebsiteKnowledgeBase(
+        urls=["https://example.com/"],
+        vector_db=vector_db,
+        lexical_index=lexical_index,
+        http_cache=http_cache,
+        reader=WebsiteReader(
+            min_delay=0,
+            max_delay=0,
+            http_cache=http_cache,
+            client_params={"transport": httpx.MockTransport(handler)},
+        ),
+    )
+    knowledge_base.load()
+    assert vector_db.get_count() == 2
+
+    # The outdated chunks of a changed page are deleted, unchanged pages are kept
+    pages["/about"] = "<main>about the new team</main>"
+    knowledge_base.load()
+    old, new, home = (
+        Document(content=content)
+        for content in ["about the old team", "about the new team", "home page"]
+    )
+    assert vector_db.docs_exist([old, new, home]) == [False, True, True]
+    assert [doc.content for doc in lexical_index.search("old team")] == [
+        "about the new team"
+    ]
+
+
+def test_website_knowledge_base_reloads_pages_after_failed_insert(monkeypatch):
+    import httpx
+
+    from pas.knowledge.document.http_cache import HttpCache
+    from pas.knowledge.document.website import WebsiteReader
+    from pas.knowledge.vectordb.numpy import NumpyVectorDb
+    from pas.knowledge.website import WebsiteKnowledgeBase
+
+    pages = {
+        "/": "<main>home page</main><a href='/about'>about</a>",
+        "/about": "<main>about the old team</main>",
+    }
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        etag = f'"{hash(pages[request.url.path])}"'
+        if request.headers.get("if-none-match") == etag:
+            return httpx.Response(304)
+        return httpx.Response(200, html=pages[request.url.path], headers={"ETag": etag})
+
+    http_cache = HttpCache(db_file=None)
+    vector_db = NumpyVectorDb(collection="website", embedder=LengthEmbedder())
+    knowledge_base = WebsiteKnowledgeBase(
+        urls=["https://example.com/"],
+        vector_db=vector_db,
+        reader=WebsiteReader(
+            min_delay=0,
+            max_delay=0,
+            http_cache=http_cache,
+            client_params={"transport": httpx.MockTransport(handler)},
+        ),
+    )
+    knowledge_base.load()
+
+    def failing_insert(documents: list[Document]) -> None:
+        raise RuntimeError("insert failed")
+
+    # The changed page is not cached when its documents fail to load
+    pages["/about"] = "<main>about the new team</main>"
+    with monkeypatch.context() as patch:
+        patch.setattr(vector_db, "insert", failing_insert)
+        with pytest.raises(RuntimeError):
+            knowledge_base.load()
+    knowledge_base.load()
+    assert vector_db.docs_exist([Document(content="about the new team")]) == [True]
@@ -0,0 +1,534 @@
+from pathlib import Path
+
+import pytest
+
+from pas.knowledge.document import Document
+from pas.knowledge.document.pdf import PDFReader
+from pas.knowledge.document.reader import Reader
+from pas.knowledge.document.tokenizer import Tokenizer
+
+
+def test_chunk_document_prefers_separators():
+    reader = Reader(chunk_size=20)
+    document = Document(
+        id="doc",
+        content="first paragraph\n\nsecond  paragraph\twith more words",
+        meta_data={"page": 1},
+    )
+    chunks = reader.chunk_document(document)
+    assert [chunk.content for chunk in chunks] == [
+        "first paragraph",
+        "second paragraph",
+        "with more words",
+    ]
+    assert [chunk.id for chunk in chunks] == ["doc_1", "doc_2", "doc_3"]
+    assert chunks[1].meta_data == {"page": 1, "chunk": 2, "chunk_size": 16}
+
+
+def test_chunk_overlap():
+    reader = Reader(chunk_size=12, chunk_overlap=6)
+    chunks = list(reader.split_text("one two three four five six"))
+    assert chunks == ["one two", "two three", "three four", "four five", "five six"]
+    assert all(len(chunk) <= 12 for chunk in chunks)  # noqa: PLR2004
+
+    # Text without whitespace is cut at the chunk size
+    reader = Reader(chunk_size=4, chunk_overlap=2)
+    assert list(reader.split_text("abcdefghij")) == ["abcd", "cdef", "efgh", "ghij"]
+
+
+def test_chunk_overlap_at_word_boundaries():
+    # The overlap is measured from the last word, so it is applied at every boundary
+    reader = Reader(chunk_size=12, chunk_overlap=5)
+    assert list(reader.split_text("one two three four five six seven")) == [
+        "one two",
+        "two three",
+        "three four",
+        "four five",
+        "five six",
+        "six seven",
+    ]
+
+    # Chunks shorter than the overlap are not overlapped mid-word
+    reader = Reader(chunk_size=6, chunk_overlap=3)
+    assert list(reader.split_text("zeta a delta beta to zeta")) == [
+        "zeta",
+        "a",
+        "delta",
+        "beta",
+        "to",
+        "zeta",
+    ]
+    reader = Reader(chunk_size=10, chunk_overlap=4)
+    chunks = list(reader.split_text("alpha beta gamma delta of f epsilon zeta"))
+    assert chunks == ["alpha", "beta", "gamma", "delta of", "of f", "f epsilon", "zeta"]
+
+    # Chunks which would only repeat the overlap start after it
+    reader = Reader(chunk_size=11, chunk_overlap=4)
+    assert list(reader.split_text("a a a eta epsilon a")) == ["a a a eta", "epsilon a"]
+
+
+def test_chunk_size_in_tokens():
+    reader = Reader(chunk_size=2, chunk_unit="tokens")
+    chunks = list(reader.split_text("aaa bbb ccc ddd eee"))
+    assert chunks == ["aaa bbb", "ccc ddd", "eee"]
+
+
+class WordTokenizer(Tokenizer):
+    batch_size: int = 2
+    vocabulary: dict[str, int] = {}
+    batches: list[int] = []
+
+    def encode(self, text: str) -> list[int]:
+        return [
+            self.vocabulary.setdefault(word, len(self.vocabulary))
+            for word in text.split()
+        ]
+
+    def decode(self, tokens: list[int]) -> str:
+        words = {token: word for word, token in self.vocabulary.items()}
+        return " ".join(words[token] for token in tokens)
+
+    def encode_batch(self, texts: list[str]) -> list[list[int]]:
+        self.batches.append(len(texts))
+        return super().encode_batch(texts)
+
+
+def test_chunk_size_with_tokenizer():
+    tokenizer = WordTokenizer(vocabulary={}, batches=[])
+    reader = Reader(chunk_size=6, chunk_overlap=2, tokenizer=tokenizer)
+    text = "one two three four five six\n\nseven eight nine ten"
+    assert list(reader.split_text(text)) == [
+        "one two three four five six",
+        "five six seven eight nine ten",
+    ]
+    assert max(tokenizer.batches) == tokenizer.batch_size
+
+    # Pieces longer than the chunk size are cut by tokens
+    reader = Reader(chunk_size=1, tokenizer=tokenizer)
+    assert list(reader.split_text("a b c d")) == ["a", "b", "c", "d"]
+
+
+class CharacterTokenizer(Tokenizer):
+    def encode(self, text: str) -> list[int]:
+        return [ord(char) for char in text]
+
+    def decode(self, tokens: list[int]) -> str:
+        return "".join(map(chr, tokens))
+
+
+def test_chunk_overlap_with_tokenizer():
+    # Text cut by tokens is overlapped at every boundary, like text cut by characters
+    reader = Reader(chunk_size=6, chunk_overlap=2, tokenizer=CharacterTokenizer())
+    assert list(reader.split_text("abcdefghijklmnopqrstuvwxyz")) == [
+        "abcdef",
+        "efghij",
+        "ijklmn",
+        "mnopqr",
+        "qrstuv",
+        "uvwxyz",
+    ]
+    assert list(reader.split_text("ab cdefghijklmnop qr")) == [
+        "ab cd",
+        "cdefgh",
+        "ghijkl",
+        "klmnop",
+        "op qr",
+    ]
+
+
+def write_pdf(
+    path: Path,
+    texts: list[str],
+    images: list[list[tuple[int, int]]] | None = None,
+) -> Path:
+    """Write a PDF with one page per text.
+    `images` are the size and gray level of the square images on each page.
+    """
+    from pypdf import PdfWriter
+    from pypdf.generic import (
+        DecodedStreamObject,
+        DictionaryObject,
+        NameObject,
+        NumberObject,
+    )
+
+    writer = PdfWriter()
+    font = writer._add_object(
+        DictionaryObject(
+            {
+                NameObject("/Type"): NameObject("/Font"),
+                NameObject("/Subtype"): NameObject("/Type1"),
+                NameObject("/BaseFont"): NameObject("/Helvetica"),
+            },
+        ),
+    )
+    for page_index, text in enumerate(texts):
+        page = writer.add_blank_page(width=200, height=200)
+        content = f"BT /F1 12 Tf 10 100 Td ({text}) Tj ET"
+        xobjects = DictionaryObject()
+        for image_index, (size, gray) in enumerate(
+            images[page_index] if images else []
+        ):
+            image = DecodedStreamObject()
+            image.set_data(bytes([gray]) * size * size)
+            image.update(
+                {
+                    NameObject("/Type"): NameObject("/XObject"),
+                    NameObject("/Subtype"): NameObject("/Image"),
+                    NameObject("/Width"): NumberObject(size),
+                    NameObject("/Height"): NumberObject(size),
+                    NameObject("/ColorSpace"): NameObject("/DeviceGray"),
+                    NameObject("/BitsPerComponent"): NumberObject(8),
+                },
+            )
+            xobjects[NameObject(f"/Im{image_index}")] = writer._add_object(image)
+            content += f" q {size} 0 0 {size} 0 0 cm /Im{image_index} Do Q"
+        page[NameObject("/Resources")] = DictionaryObject(
+            {
+                NameObject("/Font"): DictionaryObject({NameObject("/F1"): font}),
+                NameObject("/XObject"): xobjects,
+            },
+        )
+        stream = DecodedStreamObject()
+        stream.set_data(content.encode())
+        page[NameObject("/Contents")] = writer._add_object(stream)
+    writer.write(path)
+    return path
+
+
+@pytest.mark.parametrize("num_workers", [1, 2])
+def test_pdf_reader_read_many(tmp_path, num_workers):
+    pdfs = [
+        write_pdf(tmp_path / "large.pdf", [f"large page {i}" for i in range(1, 6)]),
+        write_pdf(tmp_path / "small.pdf", ["small page"]),
+        tmp_path / "missing.pdf",
+        write_pdf(tmp_path / "last.pdf", ["last page"]),
+    ]
+    reader = PDFReader(num_workers=num_workers, pages_per_task=2, max_pending_tasks=1)
+    document_lists = list(reader.read_many(pdfs))
+    assert [
+        [doc.content for doc in docs] if docs is not None else None
+        for docs in document_lists
+    ] == [
+        [f"large page {i}" for i in range(1, 6)],
+        ["small page"],
+        None,
+        ["last page"],
+    ]
+    assert document_lists[0][4].id == "large_5_1"
+    assert document_lists[0][4].meta_data == {"page": 5, "chunk": 1, "chunk_size": 12}
+
+
+def test_pdf_reader_keeps_workers(tmp_path):
+    small = write_pdf(tmp_path / "small.pdf", ["small page"])
+    large = write_pdf(tmp_path / "large.pdf", [f"large page {i}" for i in range(1, 4)])
+    reader = PDFReader(num_workers=2, pages_per_task=2)
+
+    # Files of a single task are read in the current process
+    assert [doc.content for doc in reader.read(small)] == ["small page"]
+    assert reader._executor is None
+
+    # The worker processes are started once
+    assert len(reader.read(large)) == 3  # noqa: PLR2004
+    executor = reader._executor
+    assert executor is not None
+    assert [len(docs) for docs in reader.read_many([large, small])] == [3, 1]
+    assert reader._executor is executor
+
+    reader.close()
+    assert reader._executor is None
+
+
+def test_pdf_reader_parses_files_once(tmp_path, monkeypatch):
+    import pypdf
+
+    large = write_pdf(tmp_path / "large.pdf", [f"large page {i}" for i in range(1, 4)])
+    opened: list[str] = []
+
+    class CountingPdfReader(pypdf.PdfReader):
+        def __init__(self, stream, *args, **kwargs):
+            opened.append(str(stream))
+            super().__init__(stream, *args, **kwargs)
+
+    # Worker processes are spawned, so only the current process is patched
+    monkeypatch.setattr(pypdf, "PdfReader", CountingPdfReader)
+    reader = PDFReader(num_workers=2, pages_per_task=2)
+    assert len(reader.read(large)) == 3  # noqa: PLR2004
+    assert opened == [str(large)]
+
+    # Files read in the pool are only parsed by the worker processes
+    assert [len(docs) for docs in reader.read_many([large, large])] == [3, 3]
+    assert opened == [str(large)]
+    reader.close()
+
+
+def test_pdf_reader_max_tasks_per_child_requires_python_311(monkeypatch):
+    from pas.knowledge.document import pdf
+
+    executor_kwargs: list[dict] = []
+
+    class RecordingExecutor:
+        def __init__(self, **kwargs):
+            executor_kwargs.append(kwargs)
+
+    monkeypatch.setattr(pdf, "ProcessPoolExecutor", RecordingExecutor)
+    monkeypatch.setattr(pdf.sys, "version_info", (3, 10, 14))
+    PDFReader(num_workers=2, max_tasks_per_child=10).executor
+    assert "max_tasks_per_child" not in executor_kwargs[0]
+
+
+def test_pdf_image_reader_caches_ocr(tmp_path, monkeypatch):
+    from pas.knowledge.document import pdf
+
+    ocr_calls: list[bytes] = []
+
+    def ocr(image: bytes) -> tuple[list, float]:
+        ocr_calls.append(image)
+        return [[None, f"image {len(ocr_calls)}", 1.0]], 0.0
+
+    monkeypatch.setattr(pdf, "get_ocr", lambda: ocr)
+    logo, photo, rule = (64, 10), (64, 200), (8, 0)
+    path = write_pdf(
+        tmp_path / "scan.pdf",
+        ["first", "second"],
+        images=[[logo, rule, photo], [logo]],
+    )
+
+    reader = pdf.PDFImageReader(chunk=False)
+    documents = reader.read(path)
+    assert [doc.content.split() for doc in documents] == [
+        ["first", "image", "1", "image", "2"],
+        ["second"],
+    ]
+    assert len(ocr_calls) == 2  # noqa: PLR2004
+
+    # Images are cached by content across files
+    reader.read(path)
+    assert len(ocr_calls) == 2  # noqa: PLR2004
+
+
+def website_transport(pages: dict[str, str], in_flight: list[int]):
+    """Mock transport serving `pages`, recording the number of requests in flight"""
+    import asyncio
+
+    import httpx
+
+    active = [0]
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        active[0] += 1
+        in_flight.append(active[0])
+        await asyncio.sleep(0.01)
+        active[0] -= 1
+        html = pages.get(request.url.path)
+        if html is None:
+            return httpx.Response(404)
+        return httpx.Response(200, html=html)
+
+    return httpx.MockTransport(handler)
+
+
+def test_website_reader_crawl():
+    from pas.knowledge.document.website import WebsiteReader
+
+    links = "".join(f'<a href="/page{i}">page {i}</a>' for i in range(8))
+    pages = {"/": f"<main>home</main>{links}<a href='/missing'>missing</a>"}
+    pages |= {
+        f"/page{i}": f"<article>page {i}</article><a href='/deep{i}'>deep</a>"
+        for i in range(8)
+    }
+    pages |= {f"/deep{i}": "<main>too deep</main>" for i in range(8)}
+
+    in_flight: list[int] = []
+    reader = WebsiteReader(
+        max_depth=2,
+        max_links=20,
+        max_concurrency_per_host=3,
+        min_delay=0,
+        max_delay=0,
+        client_params={"transport": website_transport(pages, in_flight)},
+    )
+    result = reader.crawl("https://docs.example.com/")
+    assert sorted(result.values()) == ["home"] + [f"page {i}" for i in range(8)]
+    assert max(in_flight) == 3  # noqa: PLR2004
+
+    # Crawl state is not kept between crawls
+    reader.max_links = 3
+    assert len(reader.crawl("https://docs.example.com/")) == 3  # noqa: PLR2004
+
+
+def test_website_reader_conditional_requests():
+    import httpx
+
+    from pas.knowledge.document.http_cache import HttpCache
+    from pas.knowledge.document.website import WebsiteReader
+
+    pages = {
+        "/": "<main>home v1</main><a href='/about'>about</a>",
+        "/about": "<main>about v1</main>",
+    }
+    not_modified: list[str] = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        etag = f'"{hash(pages[request.url.path])}"'
+        if request.headers.get("if-none-match") == etag:
+            not_modified.append(request.url.path)
+            return httpx.Response(304)
+        return httpx.Response(200, html=pages[request.url.path], headers={"ETag": etag})
+
+    reader = WebsiteReader(
+        min_delay=0,
+        max_delay=0,
+        http_cache=HttpCache(db_file=None),
+        client_params={"transport": httpx.MockTransport(handler)},
+    )
+    assert reader.crawl("https://example.com/") == {
+        "https://example.com/": "home v1",
+        "https://example.com/about": "about v1",
+    }
+
+    # Links of pages which are not modified are still crawled
+    pages["/about"] = "<main>about v2</main>"
+    assert reader.crawl("https://example.com/", skip_unchanged=True) == {
+        "https://example.com/about": "about v2",
+    }
+    assert not_modified == ["/"]
+    assert reader.crawl("https://example.com/") == {
+        "https://example.com/": "home v1",
+        "https://example.com/about": "about v2",
+    }
+    assert not_modified == ["/", "/", "/about"]
+
+
+def test_http_cache_in_memory_across_threads():
+    from concurrent.futures import ThreadPoolExecutor
+
+    from pas.knowledge.document.http_cache import CachedPage, HttpCache
+
+    http_cache = HttpCache(db_file=None)
+    page = CachedPage(url="https://example.com/", etag='"1"', content="home")
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        executor.submit(http_cache.set, page).result()
+    assert http_cache.get(page.url) == page
+
+
+HTML_FIXTURES = sorted((Path(__file__).parent / "fixtures" / "html").glob("*.html"))
+
+
+@pytest.mark.parametrize(
+    ("parser_name", "module"),
+    [("LxmlParser", "lxml"), ("SelectolaxParser", "selectolax")],
+)
+def test_html_parsers_match_beautifulsoup(parser_name, module):
+    from pas.knowledge.document import html
+
+    pytest.importorskip(module)
+    parser = getattr(html, parser_name)()
+    url = "https://docs.example.com/guide/intro"
+    for path in HTML_FIXTURES:
+        expected = html.BeautifulSoupParser().parse(path.read_bytes(), url)
+        assert parser.parse(path.read_bytes(), url) == expected, path.name
+
+    page = parser.parse(
+        HTML_FIXTURES[0].with_name("docs_article.html").read_bytes(), url
+    )
+    assert page.content.startswith("Knowledge bases A knowledge base is")
+    assert "tracking" not in page.content
+    assert "read the sources & insert" in page.content
+    assert "https://docs.example.com/guide/knowledge/json#loading" in page.links
+
+
+def test_json_reader_streams_documents(tmp_path):
+    import json
+
+    from pas.knowledge.document.json import JSONReader
+
+    records = [
+        {"title": f"title {i}", "body": f"body {i} " * 3, "meta": {"id": i}}
+        for i in range(5)
+    ]
+    json_path = tmp_path / "records.json"
+    json_path.write_text(json.dumps(records, indent=2))
+    jsonl_path = tmp_path / "records.jsonl"
+    jsonl_path.write_text("\n".join(json.dumps(record) for record in records) + "\n")
+
+    reader = JSONReader(
+        content_fields=["title", "body"],
+        meta_data_fields=["meta.id"],
+        batch_size=2,
+        read_size=16,
+    )
+    for path in [json_path, jsonl_path]:
+        batches = list(reader.iter_documents(path))
+        assert [len(batch) for batch in batches] == [2, 2, 1]
+        document = batches[1][0]
+        assert document.id == "records_3"
+        assert document.content == "title: title 2\nbody: body 2 body 2 body 2 "
+        assert document.meta_data == {"page": 3, "meta.id": 2}
+
+    # Whole elements are the content by default, and can be chunked
+    reader = JSONReader(chunk=True, chunk_size=40, read_size=16)
+    documents = reader.read(json_path)
+    assert documents[0].id == "records_1_1"
+    assert documents[0].content.startswith('{"title": "title 0"')
+    assert all(len(document.content) <= 40 for document in documents)  # noqa: PLR2004
+
+
+def test_iter_json_leading_whitespace():
+    import io
+
+    from pas.knowledge.document.json import iter_json
+
+    # The first blocks hold only whitespace
+    assert list(iter_json(io.StringIO("      \n  [1, 2]"), read_size=4)) == [1, 2]
+    assert list(iter_json(io.StringIO('      \n  {"a": 1}'), read_size=4)) == [
+        {"a": 1}
+    ]
+    assert list(iter_json(io.StringIO("      \n  "), read_size=4)) == []
+
+
+@pytest.mark.parametrize("text", ["[1,]", "[1, 2 ,\n ]", "[,1]"])
+def test_iter_json_rejects_misplaced_commas(text):
+    import io
+    import json
+
+    from pas.knowledge.document.json import iter_json
+
+    with pytest.raises(json.JSONDecodeError):
+        list(iter_json(io.StringIO(text), read_size=2))
+
+
+@pytest.mark.parametrize("element", ["trux", '{"a" 1}', "[2.]", '"\\x"'])
+def test_iter_json_raises_on_invalid_element(element):
+    import io
+    import json
+
+    from pas.knowledge.document.json import iter_json
+
+    f = io.StringIO(f"[1, {element}, " + "3, " * 1000 + "3]")
+    elements = iter_json(f, read_size=8)
+    assert next(elements) == 1
+    with pytest.raises(json.JSONDecodeError):
+        next(elements)
+    # The error is raised without reading the rest of the file
+    assert f.tell() < 32  # noqa: PLR2004
+
+
+def test_iter_json_elements_cut_across_blocks():
+    import io
+    import json
+
+    from pas.knowledge.document.json import iter_json
+
+    elements = [
+        {"text": "café \U0001f600", "values": [1.5, -2e10, 1e-7, [0.25]]},
+        "tab\\t",
+        True,
+        None,
+        -1.25,
+        [],
+        {},
+    ]
+    text = json.dumps(elements)
+    for read_size in range(1, 20):
+        assert list(iter_json(io.StringIO(text), read_size)) == elements
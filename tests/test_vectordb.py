@@ -0,0 +1,291 @@
+import pytest
+
+from pas.knowledge.document import Document
+from pas.knowledge.embedder import Embedder
+from pas.knowledge.vectordb import Distance
+from pas.knowledge.vectordb.numpy import NumpyVectorDb
+
+VECTORS = {
+    "apple": [1.0, 0.0, 0.0],
+    "pear": [0.9, 0.1, 0.0],
+    "car": [0.0, 1.0, 0.0],
+    "bus": [0.0, 0.9, 0.2],
+    "sky": [0.0, 0.0, 1.0],
+}
+
+
+class WordEmbedder(Embedder):
+    dimensions: int = 3
+
+    def get_embedding(self, text: str) -> list[float]:
+        return VECTORS[text]
+
+    def get_embedding_and_usage(self, text: str) -> tuple[list[float], dict | None]:
+        return VECTORS[text], None
+
+
+@pytest.fixture(params=["memory", "file", "mmap"])
+def vector_db(request, tmp_path):
+    path = None if request.param == "memory" else str(tmp_path)
+    db = NumpyVectorDb(
+        collection="test",
+        embedder=WordEmbedder(),
+        path=path,
+        mmap=request.param == "mmap",
+        initial_capacity=2,
+    )
+    db.create()
+    return db
+
+
+def documents(*words: str) -> list[Document]:
+    return [
+        Document(content=word, name=word, meta_data={"word": word}) for word in words
+    ]
+
+
+@pytest.mark.parametrize(
+    "distance", [Distance.cosine, Distance.l2, Distance.max_inner_product]
+)
+def test_numpy_search(distance):
+    db = NumpyVectorDb(collection="test", embedder=WordEmbedder(), distance=distance)
+    db.create()
+    db.insert(documents(*VECTORS))
+    results = db.search("apple", limit=2)
+    assert [doc.content for doc in results] == ["apple", "pear"]
+    assert results[0].meta_data == {"word": "apple"}
+    assert len(db.search("car", limit=10)) == len(VECTORS)
+
+
+def test_numpy_insert_upsert_delete(vector_db):
+    vector_db.insert(documents("apple", "car", "apple"))
+    vector_db.upsert(documents("car", "sky"))
+    assert vector_db.get_count() == 3
+    assert vector_db.docs_exist(documents("apple", "bus")) == [True, False]
+    assert vector_db.name_exists("sky")
+
+    vector_db.delete_documents([vector_db.doc_id(Document(content="car"))])
+    assert vector_db.get_count() == 2
+    assert not vector_db.name_exists("car")
+    assert [doc.content for doc in vector_db.search("bus", limit=1)] == ["sky"]
+
+    vector_db.optimize()
+    assert vector_db.get_count() == 2
+    assert [doc.content for doc in vector_db.search("pear", limit=1)] == ["apple"]
+
+
+def test_numpy_rejects_wrong_dimensions(vector_db):
+    vector_db.insert(documents("apple"))
+    wrong = [
+        Document(content="car", embedding=[0.0, 1.0, 0.0]),
+        Document(content="flat", embedding=[1.0, 0.0]),
+    ]
+    with pytest.raises(ValueError, match="3 dimensions"):
+        vector_db.insert(wrong)
+    # Nothing of the failed write is stored
+    assert vector_db.get_count() == 1
+    assert vector_db.docs_exist(wrong) == [False, False]
+    vector_db.insert(documents("car"))
+    assert [doc.content for doc in vector_db.search("bus", limit=1)] == ["car"]
+
+
+def test_numpy_persistence(tmp_path):
+    db = NumpyVectorDb(collection="test", embedder=WordEmbedder(), path=str(tmp_path))
+    db.create()
+    db.insert(documents("apple", "car", "bus"))
+    db.delete_documents([db.doc_id(Document(content="car"))])
+
+    reloaded = NumpyVectorDb(
+        collection="test", embedder=WordEmbedder(), path=str(tmp_path)
+    )
+    assert reloaded.exists()
+    reloaded.create()
+    assert reloaded.get_count() == 2
+    assert [doc.content for doc in reloaded.search("car", limit=1)] == ["bus"]
+
+    reloaded.delete()
+    assert not reloaded.exists()
+
+
+def test_numpy_filtered_search(vector_db):
+    vector_db.insert(
+        [
+            Document(
+                content=word, name=word, meta_data={"tenant": tenant, "page": page}
+            )
+            for word, tenant, page in [
+                ("apple", "acme", 1),
+                ("pear", "globex", 2),
+                ("car", "acme", 3),
+                ("bus", "globex", 4),
+            ]
+        ],
+    )
+
+    def search(filters: dict) -> list[str]:
+        return [doc.content for doc in vector_db.search("apple", 5, filters=filters)]
+
+    assert search({"tenant": "globex"}) == ["pear", "bus"]
+    assert search({"tenant": "acme", "page": {"$gt": 1}}) == ["car"]
+    assert search({"name": {"$in": ["bus", "car"]}}) == ["car", "bus"]
+    assert search({"$or": [{"page": 1}, {"page": {"$gte": 4}}]}) == ["apple", "bus"]
+    assert search({"tenant": {"$ne": "acme"}}) == ["pear", "bus"]
+    assert search({"tenant": "initech"}) == []
+    assert vector_db.search("apple", 1, filters={"page": 2})[0].meta_data == {
+        "tenant": "globex",
+        "page": 2,
+    }
+
+    vector_db.delete_documents([vector_db.doc_id(Document(content="pear"))])
+    vector_db.upsert([Document(content="bus", meta_data={"tenant": "acme"})])
+    assert search({"tenant": "globex"}) == []
+    vector_db.optimize()
+    assert search({"tenant": "acme"}) == ["apple", "car", "bus"]
+
+
+def test_field_index():
+    from pas.knowledge.vectordb.filters import FieldIndex
+
+    index = FieldIndex()
+    index.add(0, {"tenant": "acme", "page": 1, "draft": True})
+    index.add(1, {"tenant": "globex", "page": 2})
+    index.add(5, {"page": 1})
+
+    def rows(filters: dict) -> list[int]:
+        return index.rows(filters).tolist()
+
+    # Documents without the field match negations
+    assert rows({"tenant": {"$ne": "acme"}}) == [1, 5]
+    assert rows({"tenant": {"$nin": ["acme", "globex"]}}) == [5]
+    assert rows({"page": 1, "tenant": {"$ne": "globex"}}) == [0, 5]
+    assert rows({"draft": 1}) == []
+    assert rows({"draft": True}) == [0]
+    assert rows({"$or": [{"page": {"$gt": 1}}, {"draft": True}]}) == [0, 1]
+    assert rows({}) == [0, 1, 5]
+
+    index.remove(0)
+    assert rows({"tenant": {"$ne": "globex"}}) == [5]
+    assert len(index) == 2
+
+
+@pytest.mark.parametrize(
+    "distance", [Distance.cosine, Distance.l2, Distance.max_inner_product]
+)
+def test_numpy_search_many(distance):
+    db = NumpyVectorDb(collection="test", embedder=WordEmbedder(), distance=distance)
+    db.create()
+    db.insert(documents(*VECTORS))
+    db.delete_documents([db.doc_id(Document(content="pear"))])
+    queries = ["apple", "bus", "sky", "apple"]
+    results = db.search_many(queries, limit=2)
+    assert [[doc.content for doc in docs] for docs in results] == [
+        [doc.content for doc in db.search(query, limit=2)] for query in queries
+    ]
+    results = db.search_many(["car", "sky"], limit=3, filters={"word": "bus"})
+    assert [[doc.content for doc in docs] for docs in results] == [["bus"], ["bus"]]
+    assert db.search_many([]) == []
+
+
+def test_ivf_index():
+    import numpy as np
+
+    from pas.knowledge.vectordb.ivf import IVFVectorDb
+
+    rng = np.random.default_rng(0)
+    vectors = rng.normal(size=(500, 3)).astype(np.float32)
+    db = IVFVectorDb(collection="test", embedder=WordEmbedder(), nlist=10, nprobe=10)
+    db.create()
+    db.insert(
+        [Document(content=str(i), embedding=v.tolist()) for i, v in enumerate(vectors)],
+    )
+    db.optimize()
+    db.wait_for_index()
+    assert db.is_indexed
+    assert db.recall(list(vectors[:20]), k=5) == 1.0
+
+    db.insert([Document(content="new", embedding=[10.0, 0.0, 0.0])])
+    db.nprobe = 1
+    assert db.search_by_embedding([1.0, 0.0, 0.0], limit=1)[0].content == "new"
+
+
+@pytest.mark.parametrize("quantizer_type", ["scalar", "product"])
+def test_quantized_search(tmp_path, quantizer_type):
+    import numpy as np
+
+    from pas.knowledge.vectordb.quantization import ProductQuantizer, ScalarQuantizer
+
+    def quantizer():
+        return ScalarQuantizer() if quantizer_type == "scalar" else ProductQuantizer(1)
+
+    rng = np.random.default_rng(0)
+    vectors = rng.normal(size=(300, 3)).astype(np.float32)
+    db = NumpyVectorDb(
+        collection="test",
+        embedder=WordEmbedder(),
+        path=str(tmp_path),
+        mmap=True,
+        quantizer=quantizer(),
+    )
+    db.create()
+    db.insert(
+        [Document(content=str(i), embedding=v.tolist()) for i, v in enumerate(vectors)],
+    )
+    db.optimize()
+    assert db.recall(list(vectors[:20]), k=5) >= 0.8
+
+    db.insert([Document(content="new", embedding=[10.0, 0.0, 0.0])])
+    reloaded = NumpyVectorDb(
+        collection="test",
+        embedder=WordEmbedder(),
+        path=str(tmp_path),
+        quantizer=quantizer(),
+    )
+    reloaded.create()
+    assert reloaded.search_by_embedding([1.0, 0.0, 0.0], limit=1)[0].content == "new"
+
+
+def test_quantized_embeddings_are_memory_mapped(tmp_path):
+    import numpy as np
+
+    from pas.knowledge.vectordb.quantization import ScalarQuantizer
+
+    rng = np.random.default_rng(0)
+    vectors = rng.normal(size=(50, 3)).astype(np.float32)
+    db = NumpyVectorDb(
+        collection="test",
+        embedder=WordEmbedder(),
+        path=str(tmp_path),
+        quantizer=ScalarQuantizer(),
+    )
+    db.create()
+    db.insert(
+        [Document(content=str(i), embedding=v.tolist()) for i, v in enumerate(vectors)],
+    )
+    assert not isinstance(db._embeddings, np.memmap)
+
+    # Only the codes are kept in memory once the quantizer is trained
+    db.optimize()
+    assert isinstance(db._embeddings, np.memmap)
+    db.insert([Document(content="new", embedding=[10.0, 0.0, 0.0])])
+    assert db.search_by_embedding([1.0, 0.0, 0.0], limit=1)[0].content == "new"
+
+    reloaded = NumpyVectorDb(
+        collection="test",
+        embedder=WordEmbedder(),
+        path=str(tmp_path),
+        quantizer=ScalarQuantizer(),
+    )
+    reloaded.create()
+    assert isinstance(reloaded._embeddings, np.memmap)
+    assert reloaded.search_by_embedding([1.0, 0.0, 0.0], limit=1)[0].content == "new"
+
+
+def test_product_quantizer_dimensions():
+    from pas.knowledge.vectordb.quantization import ProductQuantizer
+
+    with pytest.raises(ValueError, match="2 subvectors do not divide 3 dimensions"):
+        NumpyVectorDb(
+            collection="test", embedder=WordEmbedder(), quantizer=ProductQuantizer(2)
+        )
+    assert ProductQuantizer().subvectors(50) == 5  # noqa: PLR2004
+    assert ProductQuantizer().subvectors(768) == 96  # noqa: PLR2004